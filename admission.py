@@ -0,0 +1,207 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import metrics
+
+# Admission control for model calls. At most max_concurrent calls run at once
+# across the process; everyone else waits in a bounded queue, so a classroom
+# starting together is served in order instead of all hitting the model and
+# getting errors. The queue is ordered by arrival, with each priority level
+# (lower first) worth priority_step seconds of head start: urgent calls jump
+# ahead, but nothing waits forever behind a stream of them.
+#
+# Callers either block in acquire() (worker threads), take a ticket with
+# enqueue() and poll() it (the Streamlit app, which shows the queue position
+# and estimated wait while a fragment polls), or submit() work that is handed
+# to an executor once admitted, so it doesn't hold a thread while it waits.
+# A polled ticket that stops being polled, or an admitted one that is never
+# claimed, expires after ticket_ttl so an abandoned tab can't hold a place or
+# a slot.
+
+Status = namedtuple("Status", ["admitted", "position", "eta_seconds"])
+
+class QueueFull(Exception):
+    pass
+
+class Ticket:
+    def __init__(self, owner, priority, seq, priority_step):
+        self.owner = owner
+        self.priority = priority
+        self.state = "queued"  # queued -> admitted -> claimed -> released, or expired
+        self.enqueued_at = self.last_seen = time.monotonic()
+        self.sort_key = (self.enqueued_at + priority * priority_step, seq)
+        self.admitted_at = None
+        self.admitted = threading.Event()
+        self.on_admit = None  # optional callback(ticket), e.g. to wake an asyncio waiter
+        self.dispatched = False  # run by its on_admit callback (submit()), so never polled and never expired
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+class AdmissionController:
+    def __init__(self, max_concurrent, max_queue, ticket_ttl=30.0, priority_step=10.0, service_seconds=5.0, smoothing=0.2):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.ticket_ttl = ticket_ttl
+        self.priority_step = priority_step
+        self.smoothing = smoothing
+        self._service_seconds = service_seconds  # moving average of how long a slot is held
+        self._queue = []  # heap of tickets; released/expired ones are skipped lazily
+        self._queued = 0
+        self._active = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    # Function to join the queue; the ticket is admitted at once if a slot is free. A ticket
+    # given an on_admit callback here is dispatched by it and isn't expected to be polled.
+    def enqueue(self, owner, priority=0, on_admit=None):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            ticket = Ticket(owner, priority, next(self._seq), self.priority_step)
+            ticket.on_admit = on_admit
+            ticket.dispatched = on_admit is not None
+            if len(self._active) < self.max_concurrent and not self._queued:
+                self._admit(ticket, now)
+            elif self._queued >= self.max_queue:
+                metrics.increment("admission.rejected")
+                raise QueueFull(f"Admission queue is full ({self.max_queue} waiting)")
+            else:
+                heapq.heappush(self._queue, ticket)
+                self._queued += 1
+                metrics.increment("admission.queued_total")
+            self._report()
+        return ticket
+
+    # Function to check a ticket, keeping it alive; returns admitted, position and estimated wait
+    def poll(self, ticket):
+        now = time.monotonic()
+        with self._lock:
+            ticket.last_seen = now
+            self._expire(now)
+            if ticket.state in ("admitted", "claimed"):
+                return Status(True, 0, 0.0)
+            if ticket.state != "queued":
+                return Status(False, None, None)
+            position = sum(1 for other in self._queue if other.state == "queued" and other < ticket)
+            # Slots free up every service_seconds / max_concurrent on average
+            eta = math.ceil((position + 1) * self._service_seconds / max(1, self.max_concurrent))
+            return Status(False, position + 1, eta)
+
+    # Function to start using an admitted ticket's slot
+    def claim(self, ticket):
+        with self._lock:
+            if ticket.state != "admitted":
+                return False
+            ticket.state = "claimed"
+            metrics.observe("admission.wait_ms", (ticket.admitted_at - ticket.enqueued_at) * 1000)
+            return True
+
+    # Function to give back a slot (or leave the queue) and admit whoever is next
+    def release(self, ticket):
+        now = time.monotonic()
+        with self._lock:
+            if ticket in self._active:
+                self._active.discard(ticket)
+                held = now - ticket.admitted_at
+                self._service_seconds += self.smoothing * (held - self._service_seconds)
+            elif ticket.state == "queued":
+                self._queued -= 1
+            ticket.state = "released"
+            self._admit_next(now)
+            self._report()
+
+    # Function to wait for a slot from a worker thread; returns the claimed ticket
+    def acquire(self, owner, priority=0, poll_interval=1.0, on_wait=None):
+        ticket = self.enqueue(owner, priority)
+        while not ticket.admitted.wait(poll_interval):
+            status = self.poll(ticket)
+            if status.position is None:
+                raise QueueFull("Admission ticket expired")
+            if on_wait is not None:
+                on_wait(status)
+        if not self.claim(ticket):
+            raise QueueFull("Admission ticket expired")
+        return ticket
+
+    # Function to take a slot only if one is free right now, without queueing; returns the
+    # claimed ticket (give it back with release()) or None. For optional extra work like a
+    # hedge duplicate, which should never hold up a queued call.
+    def try_acquire(self, owner, priority=0):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if len(self._active) >= self.max_concurrent or self._queued:
+                return None
+            ticket = Ticket(owner, priority, next(self._seq), self.priority_step)
+            self._admit(ticket, now)
+            ticket.state = "claimed"
+            self._report()
+        return ticket
+
+    # Function to run func(*args) on an executor once a slot is free, without holding one of its
+    # threads while queued; returns a Future of the result. The slot is released when func
+    # returns, or at once if the future is cancelled before it starts.
+    def submit(self, executor, owner, priority, func, *args):
+        future = Future()
+        def run(ticket):
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                if not self.claim(ticket):
+                    raise QueueFull("Admission ticket expired")
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.release(ticket)
+        ticket = self.enqueue(owner, priority, on_admit=lambda ticket: executor.submit(run, ticket))
+        future.add_done_callback(lambda future: future.cancelled() and self.release(ticket))
+        return future
+
+    # Function to count running and waiting calls
+    def counts(self):
+        with self._lock:
+            return len(self._active), self._queued
+
+    def _admit(self, ticket, now):
+        ticket.state = "admitted"
+        ticket.admitted_at = now
+        self._active.add(ticket)
+        ticket.admitted.set()
+        if ticket.on_admit is not None:
+            ticket.on_admit(ticket)
+        metrics.increment("admission.admitted")
+
+    def _admit_next(self, now):
+        while self._queue and len(self._active) < self.max_concurrent:
+            ticket = heapq.heappop(self._queue)
+            if ticket.state == "queued":
+                self._queued -= 1
+                self._admit(ticket, now)
+
+    def _expire(self, now):
+        expired = [ticket for ticket in self._active if not ticket.dispatched
+                   and ticket.state == "admitted" and now - ticket.admitted_at > self.ticket_ttl]
+        expired += [ticket for ticket in self._queue if not ticket.dispatched
+                    and ticket.state == "queued" and now - ticket.last_seen > self.ticket_ttl]
+        for ticket in expired:
+            if ticket in self._active:
+                self._active.discard(ticket)
+            else:
+                self._queued -= 1
+            ticket.state = "expired"
+            metrics.increment("admission.expired")
+        if expired:
+            self._queue = [ticket for ticket in self._queue if ticket.state == "queued"]
+            heapq.heapify(self._queue)
+            self._admit_next(now)
+
+    def _report(self):
+        metrics.set_gauge("admission.active", len(self._active))
+        metrics.set_gauge("admission.queued", self._queued)
@@ -0,0 +1,175 @@
+import json
+import math
+
+# Materialized per-learner and per-role aggregates for the trainer dashboard.
+# They are updated incrementally from each batch of turns the ETL appends, so a
+# dashboard render reads a handful of pre-computed rows instead of scanning
+# transcripts. Latency percentiles come from a small mergeable log-bucket sketch.
+
+ALL_LEARNERS = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS learner_stats (
+    learner_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    turns INTEGER NOT NULL DEFAULT 0,
+    hints INTEGER NOT NULL DEFAULT 0,
+    newcomer_help INTEGER NOT NULL DEFAULT 0,
+    best_practices INTEGER NOT NULL DEFAULT 0,
+    priority_answers INTEGER NOT NULL DEFAULT 0,
+    priority_correct INTEGER NOT NULL DEFAULT 0,
+    respond_s_sum REAL NOT NULL DEFAULT 0,
+    respond_count INTEGER NOT NULL DEFAULT 0,
+    latency_sketch TEXT,
+    respond_sketch TEXT,
+    PRIMARY KEY (learner_id, role)
+);
+"""
+
+_COUNTERS = ("sessions", "turns", "hints", "newcomer_help", "best_practices", "priority_answers",
+             "priority_correct", "respond_s_sum", "respond_count")
+_HELP_COLUMNS = {"hint": "hints", "newcomer": "newcomer_help", "best_practices": "best_practices"}
+
+class QuantileSketch:
+    # Values land in logarithmic buckets with ~2% relative error, so the sketch
+    # stays small however many values are added and two sketches merge by addition
+    def __init__(self, relative_accuracy=0.02, buckets=None, zeros=0):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = buckets or {}
+        self.zeros = zeros
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, value):
+        if value <= 0:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    # Function to add another sketch's values (weight=-1 takes them back out)
+    def merge(self, other, weight=1):
+        for index, count in other.buckets.items():
+            total = self.buckets.get(index, 0) + weight * count
+            if total > 0:
+                self.buckets[index] = total
+            else:
+                self.buckets.pop(index, None)
+        self.zeros = max(0, self.zeros + weight * other.zeros)
+
+    # Function to estimate the q-th quantile (0 <= q <= 1)
+    def quantile(self, q):
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+    def to_json(self):
+        return json.dumps({"a": self.relative_accuracy, "b": self.buckets, "z": self.zeros})
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        data = json.loads(text)
+        return cls(data["a"], {int(index): count for index, count in data["b"].items()}, data["z"])
+
+# Function to make sure the aggregate tables exist (executescript commits, so call it
+# when opening the database, never inside a transaction)
+def ensure_schema(connection):
+    connection.executescript(SCHEMA)
+
+# Function to fold a batch of ETL fact rows into the aggregates (called inside the ETL transaction)
+def apply_batch(connection, batch):
+    _apply(connection, batch, 1)
+
+# Function to take fact rows that were applied before back out of the aggregates, e.g. when
+# a transcript is reloaded from the start (called inside the ETL transaction)
+def retract_batch(connection, batch):
+    _apply(connection, batch, -1)
+
+def _apply(connection, batch, sign):
+    deltas = {}
+    for facts in batch:
+        for learner_id in (facts.get("learner_id") or "unknown", ALL_LEARNERS):
+            key = (learner_id, facts.get("role") or "unknown")
+            delta = deltas.setdefault(key, {name: 0 for name in _COUNTERS} | {"latency": QuantileSketch(), "respond": QuantileSketch()})
+            if facts["latency_ms"] is not None:
+                delta["latency"].add(facts["latency_ms"])
+            if facts["is_regeneration"]:
+                continue
+            delta["turns"] += 1
+            delta["sessions"] += facts["request_type"] == "scenario_start"
+            help_column = _HELP_COLUMNS.get(facts["help_type"])
+            if help_column:
+                delta[help_column] += 1
+            if facts["priority_correct"] is not None:
+                delta["priority_answers"] += 1
+                delta["priority_correct"] += facts["priority_correct"]
+            if facts["time_to_respond_s"] is not None:
+                delta["respond_s_sum"] += facts["time_to_respond_s"]
+                delta["respond_count"] += 1
+                delta["respond"].add(facts["time_to_respond_s"])
+    
+    for (learner_id, role), delta in deltas.items():
+        row = connection.execute(
+            "SELECT latency_sketch, respond_sketch FROM learner_stats WHERE learner_id = ? AND role = ?",
+            (learner_id, role),
+        ).fetchone()
+        latency, respond = (QuantileSketch.from_json(row[0]), QuantileSketch.from_json(row[1])) if row else (QuantileSketch(), QuantileSketch())
+        latency.merge(delta["latency"], sign)
+        respond.merge(delta["respond"], sign)
+        connection.execute("INSERT OR IGNORE INTO learner_stats (learner_id, role) VALUES (?, ?)", (learner_id, role))
+        connection.execute(
+            "UPDATE learner_stats SET " + ", ".join(f"{name} = {name} + ?" for name in _COUNTERS)
+            + ", latency_sketch = ?, respond_sketch = ? WHERE learner_id = ? AND role = ?",
+            [sign * delta[name] for name in _COUNTERS] + [latency.to_json(), respond.to_json(), learner_id, role],
+        )
+
+# Function to turn an aggregate row into display-ready numbers
+def _summarise(row):
+    (learner_id, role, sessions, turns, hints, newcomer_help, best_practices, priority_answers,
+     priority_correct, respond_s_sum, respond_count, latency_sketch, respond_sketch) = row
+    latency = QuantileSketch.from_json(latency_sketch)
+    respond = QuantileSketch.from_json(respond_sketch)
+    return {
+        "learner": learner_id,
+        "role": role,
+        "sessions": sessions,
+        "turns": turns,
+        "turns_per_ticket": turns / sessions if sessions else None,
+        "hints": hints,
+        "newcomer_help": newcomer_help,
+        "best_practices": best_practices,
+        "priority_accuracy": priority_correct / priority_answers if priority_answers else None,
+        "avg_time_to_respond_s": respond_s_sum / respond_count if respond_count else None,
+        "p50_time_to_respond_s": respond.quantile(0.5),
+        "p50_latency_ms": latency.quantile(0.5),
+        "p95_latency_ms": latency.quantile(0.95),
+    }
+
+# Function to read the role-wide summary row
+def role_summary(connection, role):
+    row = connection.execute("SELECT * FROM learner_stats WHERE learner_id = ? AND role = ?", (ALL_LEARNERS, role)).fetchone()
+    return _summarise(row) if row else None
+
+# Function to read the per-learner rows for a role (most active first)
+def learner_summaries(connection, role, limit=100):
+    rows = connection.execute(
+        "SELECT * FROM learner_stats WHERE role = ? AND learner_id != ? ORDER BY turns DESC LIMIT ?",
+        (role, ALL_LEARNERS, limit),
+    ).fetchall()
+    return [_summarise(row) for row in rows]
@@ -0,0 +1,462 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import WSMsgType, web
+
+import admission
+import backends
+import config
+import costs
+import desktop_assets
+import metrics
+import session_store
+import warmup
+from engine import ERROR_PREFIX, HELP_MESSAGES, SimulationEngine
+from singleflight import idempotency_key
+
+# Asyncio HTTP + WebSocket service for embedding the simulator in an LMS or
+# mobile app. It runs the same SimulationEngine as the Streamlit app, but
+# one event loop serves every learner: model calls are the only blocking work
+# and run on a shared thread pool, sessions live in the SessionManager (and
+# spill to disk when idle), and turns within a session are serialised by a
+# per-session lock.
+#
+#   POST /sessions                      {"role": ...}              -> opening email
+#   GET  /sessions/{id}                                            -> transcript
+#   POST /sessions/{id}/replies         {"text": ..., "idempotency_key": ...}
+#   POST /sessions/{id}/help/{kind}     kind: hint, newcomer, best_practices
+#   GET  /sessions/{id}/ws              WebSocket, replies streamed in chunks
+#   POST /sessions/{id}/branches        {"length": n, "name": ...}  rewind to n messages on a new branch
+#   POST /sessions/{id}/branches/{name}/select                     -> switch branch
+#   GET  /sessions/{id}/compare?a=..&b=..                          -> shared prefix and both outcomes
+#   GET  /healthz (liveness), GET /readyz (503 until warm-up is done), GET /metrics
+#   GET  /assets/desktop/{name}         the Streamlit desktop's hashed CSS/JS, cached for a year
+#
+# The model key comes from the X-Gemini-Key header, or GEMINI_API_KEY. Sends
+# carrying the same idempotency key (body field or Idempotency-Key header) are
+# recorded once; retries get the recorded reply back.
+
+class SimulatorService:
+    def __init__(self, simulation_engine=None, sessions=None, executor=None, ledger=None, estimator=None):
+        self.engine = simulation_engine or SimulationEngine()
+        self.sessions = sessions or session_store.SessionManager(
+            config.SESSION_SPILL_DIR,
+            idle_timeout=config.SESSION_IDLE_TIMEOUT,
+            max_resident_bytes=int(config.SESSION_MAX_RESIDENT_MB * 1024 * 1024),
+            spill_ttl=config.SESSION_SPILL_TTL,
+            threshold=config.DUPLICATE_THRESHOLD,
+        )
+        self.executor = executor or ThreadPoolExecutor(max_workers=config.API_WORKERS, thread_name_prefix="api")
+        self.ledger = ledger if ledger is not None else costs.CostLedger(config.MODEL_PRICES, config.COST_QUOTAS, config.COST_LEDGER_PATH)
+        self.estimator = estimator or costs.TokenEstimator()
+        self.admission = admission.AdmissionController(config.ADMISSION_MAX_CONCURRENT, config.ADMISSION_MAX_QUEUE,
+                                                       config.ADMISSION_TICKET_TTL, config.ADMISSION_PRIORITY_STEP)
+        self.warm_up = warmup.WarmUp(self.engine, warmup.service_backend_factory())
+        self._locks = weakref.WeakValueDictionary()  # session_id -> asyncio.Lock, dropped when no turn holds it
+
+    # Function to run blocking work (model calls, session spills) off the event loop
+    async def run_blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # Function to wait for a model-call slot without blocking the loop; on_wait gets queue updates
+    async def admit(self, kind, session_id, on_wait=None):
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+        ticket = self.admission.enqueue(session_id, config.ADMISSION_PRIORITIES[kind])
+        ticket.on_admit = lambda ticket: loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+        if ticket.admitted.is_set() and not admitted.done():
+            admitted.set_result(None)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(admitted), config.ADMISSION_POLL_SECONDS)
+                    break
+                except asyncio.TimeoutError:
+                    status = self.admission.poll(ticket)  # Also keeps the place alive
+                    if status.position is not None and on_wait is not None:
+                        await on_wait(status)
+        except BaseException:
+            self.admission.release(ticket)
+            raise
+        if not self.admission.claim(ticket):
+            raise admission.QueueFull("Admission ticket expired")
+        return ticket
+
+    # Function to run a blocking model call once admission control lets it through; the
+    # session stays resident (not spilled) while it waits and until the turn is recorded
+    async def call_model(self, kind, session_id, on_wait, func, *args):
+        with self.sessions.pinned(session_id):
+            ticket = await self.admit(kind, session_id, on_wait)
+            try:
+                return await self.run_blocking(func, *args)
+            finally:
+                self.admission.release(ticket)
+
+    def _lock(self, session_id):
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def _backend(self, api_key, session_id):
+        return backends.create_backend(api_key or config.GEMINI_API_KEY, session_id, config, self.ledger, self.estimator,
+                                       admission=self.admission)
+
+    # Function to load a started session, or None if it doesn't exist
+    async def conversation(self, session_id):
+        try:
+            # Only existing sessions: an unknown id must not allocate (and later spill) a new one
+            conversation = await self.run_blocking(self.sessions.get, session_id)
+        except ValueError:
+            return None
+        return conversation if conversation is not None and conversation.role else None
+
+    # Function to start a simulation for a role; returns the conversation and opening email
+    async def start(self, role, api_key=None, on_wait=None):
+        conversation = await self.run_blocking(self.sessions.checkout, uuid.uuid4().hex)
+        conversation.role = role
+        async with self._lock(conversation.session_id):
+            response = await self.call_model("start", conversation.session_id, on_wait, self.engine.start, conversation, role,
+                                             self._backend(api_key, conversation.session_id))
+        return conversation, response
+
+    # Function to send a learner reply, once per client idempotency key if one is given;
+    # returns (reply, preliminary, duplicate). on_chunk is called from a worker thread.
+    async def reply(self, conversation, text, client_key=None, api_key=None, on_wait=None, on_chunk=None):
+        send_key = idempotency_key(conversation.session_id, client_key, text) if client_key else None
+        async with self._lock(conversation.session_id):
+            # A retried or double-submitted send gets the reply that was already recorded for it
+            if send_key and send_key in conversation.completed_sends:
+                metrics.increment("sends.duplicate_dropped")
+                return conversation.send_replies.get(send_key, ""), None, True
+            ticket = conversation.opening_ticket()
+            preliminary = self.engine.preliminary_feedback(ticket, text)
+            response = await self.call_model("reply", conversation.session_id, on_wait, self.engine.reply, conversation,
+                                             conversation.role, text, self._backend(api_key, conversation.session_id), on_chunk)
+            if send_key:
+                conversation.completed_sends.add(send_key)
+                conversation.send_replies[send_key] = response
+        return response, preliminary, False
+
+    # Function to rewind to the first `length` messages on a new, active branch
+    async def fork_branch(self, conversation, length, name=None):
+        async with self._lock(conversation.session_id):
+            if conversation.threads:
+                raise ValueError("Shift sessions can't be branched")
+            if not 0 < length <= len(conversation.chat_history):
+                raise ValueError(f"length must be between 1 and {len(conversation.chat_history)}")
+            return conversation.fork_branch(length, name)
+
+    # Function to switch a session to another branch, waiting for any turn in progress
+    async def select_branch(self, conversation, name):
+        async with self._lock(conversation.session_id):
+            conversation.select_branch(name)
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+async def _read_json(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text='{"error": "Body must be JSON"}', content_type="application/json")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text='{"error": "Body must be a JSON object"}', content_type="application/json")
+    return body
+
+def _client_key(request, body):
+    return body.get("idempotency_key") or request.headers.get("Idempotency-Key")
+
+# Function to describe a turn's result for clients
+def _turn(conversation, reply, preliminary=None, duplicate=False):
+    return {
+        "session_id": conversation.session_id,
+        "role": conversation.role,
+        "reply": reply,
+        "error": reply.startswith(ERROR_PREFIX),
+        "preliminary": preliminary,
+        "duplicate": duplicate,
+        "email_counter": conversation.email_counter,
+    }
+
+# Function to split a reply into word-aligned chunks, for replies that weren't streamed by the model
+def chunk_text(text, size):
+    chunks, current = [], ""
+    for word in text.split(" "):
+        if current and len(current) + len(word) + 1 > size:
+            chunks.append(current + " ")
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        chunks.append(current)
+    return chunks
+
+@web.middleware
+async def timing_middleware(request, handler):
+    start = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else "unmatched"
+        metrics.observe(f"api.latency_ms.{request.method} {route}", (time.perf_counter() - start) * 1000)
+        metrics.increment("api.requests")
+
+# Overflow beyond the admission queue gets a 503 the client can retry, not an error email
+@web.middleware
+async def overload_middleware(request, handler):
+    try:
+        return await handler(request)
+    except admission.QueueFull as e:
+        retry_after = max(1, int(config.ADMISSION_TICKET_TTL // 3))
+        return web.json_response({"error": f"The simulator is at capacity: {e}", "retry_after": retry_after},
+                                 status=503, headers={"Retry-After": str(retry_after)})
+
+async def create_session(request):
+    service = request.app["service"]
+    body = await _read_json(request)
+    role = body.get("role")
+    if role not in service.engine.role_prompts:
+        return _error(400, f"Unknown role: {role!r}")
+    conversation, response = await service.start(role, request.headers.get("X-Gemini-Key"))
+    return web.json_response(_turn(conversation, response), status=201)
+
+async def get_session(request):
+    service = request.app["service"]
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    return web.json_response({
+        "session_id": conversation.session_id,
+        "role": conversation.role,
+        "email_counter": conversation.email_counter,
+        "chat_history": list(conversation.chat_history),
+        "active_branch": conversation.active_branch,
+        "branches": {name: len(branch) for name, branch in conversation.branches.items()},
+    })
+
+# Function to describe a session's branches for clients
+def _branches(conversation):
+    return {
+        "session_id": conversation.session_id,
+        "active_branch": conversation.active_branch,
+        "branches": {name: len(branch) for name, branch in conversation.branches.items()},
+    }
+
+# Rewind: {"length": n, "name": optional} starts a branch from the first n messages and makes it active
+async def post_branch(request):
+    service = request.app["service"]
+    body = await _read_json(request)
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    if not isinstance(body.get("length"), int):
+        return _error(400, "length (number of messages to keep) is required")
+    try:
+        await service.fork_branch(conversation, body["length"], body.get("name"))
+    except ValueError as e:
+        return _error(400, str(e))
+    return web.json_response(_branches(conversation), status=201)
+
+async def select_branch(request):
+    service = request.app["service"]
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    name = request.match_info["name"]
+    if name not in conversation.branches:
+        return _error(404, f"Unknown branch: {name!r}")
+    await service.select_branch(conversation, name)
+    return web.json_response(_branches(conversation))
+
+# Compare two branches: ?a=<branch>&b=<branch> (a defaults to the active branch)
+async def compare_branches(request):
+    service = request.app["service"]
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    name_a = request.query.get("a", conversation.active_branch)
+    name_b = request.query.get("b", "")
+    for name in (name_a, name_b):
+        if name not in conversation.branches:
+            return _error(404, f"Unknown branch: {name!r}")
+    shared, messages_a, messages_b = conversation.compare_branches(name_a, name_b)
+    return web.json_response({"shared_messages": shared, name_a: messages_a, name_b: messages_b})
+
+async def post_reply(request):
+    service = request.app["service"]
+    body = await _read_json(request)
+    text = (body.get("text") or "").strip()
+    if not text:
+        return _error(400, "Reply text is required")
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    reply, preliminary, duplicate = await service.reply(conversation, text, _client_key(request, body),
+                                                        request.headers.get("X-Gemini-Key"))
+    return web.json_response(_turn(conversation, reply, preliminary, duplicate))
+
+async def post_help(request):
+    service = request.app["service"]
+    kind = request.match_info["kind"]
+    if kind not in HELP_MESSAGES:
+        return _error(404, f"Unknown help action: {kind}")
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    body = await _read_json(request) if request.can_read_body else {}
+    reply, _, duplicate = await service.reply(conversation, HELP_MESSAGES[kind], _client_key(request, body),
+                                              request.headers.get("X-Gemini-Key"))
+    return web.json_response(_turn(conversation, reply, duplicate=duplicate))
+
+_STREAM_END = object()  # queued after the last chunk of a streamed reply
+
+# WebSocket protocol. Client messages: {"type": "reply", "text", "idempotency_key"}
+# or {"type": "help", "kind", "idempotency_key"}. The server answers with an
+# optional {"type": "preliminary"}, {"type": "queued", "position", "eta_seconds"}
+# updates while waiting for admission, then {"type": "chunk", "text"} messages
+# and a final {"type": "done", ...turn} once the reply is recorded. Chunks are
+# forwarded as the model streams them; {"type": "reset"} means discard the
+# chunks so far (e.g. the reply was regenerated) and the text starts again.
+async def session_ws(request):
+    service = request.app["service"]
+    conversation = await service.conversation(request.match_info["session_id"])
+    if conversation is None:
+        return _error(404, "Unknown session")
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    metrics.increment("api.ws_connections")
+    async for message in ws:
+        if message.type != WSMsgType.TEXT:
+            continue
+        try:
+            data = message.json()
+        except ValueError:
+            await ws.send_json({"type": "error", "error": "Messages must be JSON"})
+            continue
+        if data.get("type") == "help" and data.get("kind") in HELP_MESSAGES:
+            text = HELP_MESSAGES[data["kind"]]
+        elif data.get("type") == "reply" and (data.get("text") or "").strip():
+            text = data["text"].strip()
+        else:
+            await ws.send_json({"type": "error", "error": "Expected a reply with text or a known help kind"})
+            continue
+
+        # The session may have been spilled while the socket sat idle, so load it for each message
+        session_id = conversation.session_id
+        conversation = await service.conversation(session_id)
+        if conversation is None:
+            await ws.send_json({"type": "error", "error": "Unknown session"})
+            break
+
+        # The preliminary check is local and instant, so send it before waiting on the model
+        ticket = conversation.opening_ticket()
+        preliminary = service.engine.preliminary_feedback(ticket, text) if data["type"] == "reply" else None
+        if preliminary:
+            await ws.send_json({"type": "preliminary", "text": preliminary})
+        async def on_wait(status):
+            await ws.send_json({"type": "queued", "position": status.position, "eta_seconds": status.eta_seconds})
+
+        # Chunks arrive on the worker thread running the model call and are handed to the loop
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        streamed = []
+        async def forward_chunks():
+            while (chunk := await chunks.get()) is not _STREAM_END:
+                if chunk is None:
+                    streamed.clear()
+                    await ws.send_json({"type": "reset"})
+                else:
+                    streamed.append(chunk)
+                    await ws.send_json({"type": "chunk", "text": chunk})
+        forwarder = asyncio.create_task(forward_chunks())
+        try:
+            reply, _, duplicate = await service.reply(conversation, text, data.get("idempotency_key"),
+                                                      request.headers.get("X-Gemini-Key"), on_wait,
+                                                      lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk))
+        except admission.QueueFull as e:
+            await ws.send_json({"type": "error", "error": f"The simulator is at capacity: {e}"})
+            continue
+        finally:
+            chunks.put_nowait(_STREAM_END)  # Queued after every chunk the worker sent
+            await forwarder
+        # Backends that can't stream (and cached, duplicate or fallback replies) are chunked here
+        if "".join(streamed) != reply:
+            if streamed:
+                await ws.send_json({"type": "reset"})
+            for chunk in chunk_text(reply, config.STREAM_CHUNK_CHARS):
+                await ws.send_json({"type": "chunk", "text": chunk})
+        await ws.send_json({"type": "done", **_turn(conversation, reply, preliminary, duplicate)})
+    return ws
+
+async def healthz(request):
+    service = request.app["service"]
+    resident, spilled = service.sessions.counts()
+    active, queued = service.admission.counts()
+    return web.json_response({"status": "ok", "sessions_resident": resident, "sessions_spilled": spilled,
+                              "model_calls_active": active, "model_calls_queued": queued})
+
+async def readyz(request):
+    warm_up = request.app["service"].warm_up
+    if not warm_up.ready.is_set():
+        return web.json_response({"status": "warming_up"}, status=503)
+    return web.json_response({"status": "ready", "warmup_ms": warm_up.stages,
+                              "warmup_error": str(warm_up.error) if warm_up.error else None})
+
+async def get_metrics(request):
+    return web.json_response(metrics.snapshot())
+
+# Function to serve a content-hashed desktop asset. Its name changes whenever its content
+# does, so it can be cached for good (Streamlit's component server can't send these headers).
+async def desktop_asset(request):
+    name = request.match_info["name"]
+    path = os.path.join(request.app["desktop_build_dir"], name)
+    if not desktop_assets.HASHED_NAME.match(name) or not os.path.exists(path):
+        return _error(404, "Unknown asset")
+    return web.FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable",
+                                           "Access-Control-Allow-Origin": "*"})
+
+async def _startup(app):
+    app["service"].warm_up.start()
+
+async def _shutdown(app):
+    service = app["service"]
+    if service.ledger.path:
+        service.ledger.save()
+    service.executor.shutdown(wait=False)
+
+# Function to build the aiohttp application around a service
+def create_app(service=None):
+    app = web.Application(middlewares=[timing_middleware, overload_middleware])
+    app["service"] = service or SimulatorService()
+    app["desktop_build_dir"] = desktop_assets.build_assets()
+    app.router.add_post("/sessions", create_session)
+    app.router.add_get("/sessions/{session_id}", get_session)
+    app.router.add_post("/sessions/{session_id}/replies", post_reply)
+    app.router.add_post("/sessions/{session_id}/help/{kind}", post_help)
+    app.router.add_post("/sessions/{session_id}/branches", post_branch)
+    app.router.add_post("/sessions/{session_id}/branches/{name}/select", select_branch)
+    app.router.add_get("/sessions/{session_id}/compare", compare_branches)
+    app.router.add_get("/sessions/{session_id}/ws", session_ws)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", get_metrics)
+    app.router.add_get("/assets/desktop/{name}", desktop_asset)
+    app.on_startup.append(_startup)
+    app.on_shutdown.append(_shutdown)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the career simulator over HTTP and WebSocket")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
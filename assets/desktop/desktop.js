@@ -0,0 +1,143 @@
+// The desktop is a Streamlit component: this page and its assets are loaded
+// once and cached, and each script run only sends the current email as args.
+
+// Function to post a component message to Streamlit
+function sendToStreamlit(type, data) {
+    window.parent.postMessage(Object.assign({isStreamlitMessage: true, type: type}, data), '*');
+}
+
+// Function to show the new email notification after a brief delay
+function showNotification() {
+    setTimeout(function() {
+        document.getElementById('notification').style.display = 'block';
+        // Hide after 5 seconds
+        setTimeout(function() {
+            document.getElementById('notification').style.display = 'none';
+        }, 5000);
+    }, 2000);
+}
+
+// Function to keep the taskbar clock current
+function updateClock() {
+    const now = new Date();
+    const time = now.toLocaleTimeString('en-US', {hour: '2-digit', minute: '2-digit'});
+    const date = now.toLocaleDateString('en-US', {weekday: 'long', year: 'numeric', month: 'long', day: 'numeric'});
+    document.getElementById('taskbar-time').textContent = time + ' | ' + date;
+}
+
+let lastEmailKey;
+
+// Function to show the session's place in the admission queue, if it is waiting
+function renderQueue(queue) {
+    const banner = document.getElementById('queue-banner');
+    if (!queue) {
+        banner.style.display = 'none';
+        return;
+    }
+    if (queue.position === null) {
+        banner.textContent = 'The simulator is at capacity. You will be added to the queue shortly...';
+    } else {
+        banner.textContent = 'Lots of learners are starting right now. You are #' + queue.position
+            + ' in line, about ' + queue.eta_seconds + 's to go.';
+    }
+    banner.style.display = 'block';
+}
+
+// Function to render the args sent by Streamlit: role, unread_count, email and queue
+function render(args) {
+    renderQueue(args.queue);
+    document.querySelectorAll('.role-name').forEach(function(element) {
+        element.textContent = args.role;
+    });
+    document.querySelectorAll('.unread-count').forEach(function(element) {
+        element.textContent = args.unread_count;
+    });
+    document.getElementById('compose-subject').value = 'Re: Support Ticket #' + args.unread_count;
+
+    // Only touch the email view when the email changed, so reruns don't reset it
+    const email = args.email;
+    const emailKey = email ? email.subject + '\n' + email.body : null;
+    if (emailKey === lastEmailKey) {
+        return;
+    }
+    lastEmailKey = emailKey;
+    if (email) {
+        const display = document.getElementById('email-display');
+        display.innerHTML = '<div class="email-header"><div class="email-subject"></div>'
+            + '<div class="email-meta"><div class="email-from"></div><div>Just now</div></div>'
+            + '<div class="email-meta"><div>To: You &lt;you@company.com&gt;</div></div></div>'
+            + '<div class="email-body plain-text"></div>';
+        display.querySelector('.email-subject').textContent = email.subject;
+        display.querySelector('.email-from').textContent = 'From: ' + email.sender;
+        display.querySelector('.email-body').textContent = email.body;
+        showEmailDisplay();
+    }
+    showNotification();
+}
+
+window.addEventListener('message', function(event) {
+    if (event.data.type === 'streamlit:render') {
+        render(event.data.args);
+    }
+});
+
+// Function to show email display and hide composer
+function showEmailDisplay() {
+    document.getElementById('email-display').style.display = 'block';
+    document.getElementById('email-composer').style.display = 'none';
+}
+
+// Function to show email composer and hide display
+function showEmailComposer() {
+    document.getElementById('email-display').style.display = 'none';
+    document.getElementById('email-composer').style.display = 'block';
+}
+
+// Function to show help modal
+function showHelpModal() {
+    document.getElementById('help-modal').style.display = 'flex';
+}
+
+// Function to close help modal
+function closeHelpModal() {
+    document.getElementById('help-modal').style.display = 'none';
+}
+
+// Function to provide help based on option selected
+function provideHelp(type) {
+    let helpText = '';
+
+    if (type === 'hint') {
+        document.getElementById('compose-textarea').value = "[HINT] I need a metaphorical explanation for this problem";
+    } else if (type === 'dont-know') {
+        document.getElementById('compose-textarea').value = "I'm not sure how to handle this situation as I'm new to this role. Can you guide me through what an experienced support engineer would do here?";
+    }else if (type === 'best-practices') {
+        document.getElementById('compose-textarea').value = "Can you explain the best practices for handling this type of issue?";
+    }
+
+    showEmailComposer();
+    closeHelpModal();
+}
+
+// Function to send email response
+function sendEmail() {
+    const responseText = document.getElementById('compose-textarea').value;
+
+    if (responseText) {
+        window.parent.postMessage({
+            type: 'streamlit:componentValue',
+            value: {
+                email_response: responseText
+            }
+        }, '*');
+
+        document.getElementById('compose-textarea').value = '';
+
+        showEmailDisplay();
+    }
+}
+
+updateClock();
+setInterval(updateClock, 30000);
+sendToStreamlit('streamlit:componentReady', {apiVersion: 1});
+sendToStreamlit('streamlit:setFrameHeight', {height: 700});
@@ -0,0 +1,516 @@
+import hashlib
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import costs
+import metrics
+
+# Model backends. Every model call in the app goes through backend.send(), so
+# the hosted Gemini API can be swapped for a deterministic replay of a recorded
+# session, and any backend can be wrapped to record what it returns.
+
+# Function to import the Gemini SDK on first use. It is slow to import and not
+# needed to paint the API key or role selection pages.
+def load_genai():
+    import google.generativeai as genai
+    return genai
+
+_gemini_clients = {}
+_gemini_clients_lock = threading.Lock()
+
+# Function to get the Gemini client for one API key, created once per key. genai.configure()
+# sets a process-wide key, so concurrent calls on different keys (the key pool, a hedge on
+# another project, learners' own keys) would race on it; each call uses its key's client instead.
+def gemini_client(api_key):
+    with _gemini_clients_lock:
+        client = _gemini_clients.get(api_key)
+        if client is None:
+            from google.ai import generativelanguage
+            client = _gemini_clients[api_key] = generativelanguage.GenerativeServiceClient(client_options={"api_key": api_key})
+        return client
+
+# Function to build a model that sends through the given key's client
+def gemini_model(api_key, model_name, generation_config=None):
+    genai = load_genai()
+    model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+    model._client = gemini_client(api_key)
+    return model
+
+class GeminiBackend:
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    # Function to send one message in a chat with the given history and return the reply text.
+    # With an on_chunk callback the reply is streamed and each piece is passed to it on arrival.
+    def send(self, model_name, generation_config, history, message, **metadata):
+        model = gemini_model(self.api_key, model_name, generation_config)
+        chat = model.start_chat(history=history)
+        on_chunk = metadata.get("on_chunk")
+        response = chat.send_message(message, stream=on_chunk is not None)
+        if on_chunk is not None:
+            for chunk in response:
+                if chunk.parts:
+                    on_chunk(chunk.text)
+        usage = metadata.get("usage")
+        if usage is not None and getattr(response, "usage_metadata", None):
+            usage["prompt_tokens"] = response.usage_metadata.prompt_token_count
+            usage["output_tokens"] = response.usage_metadata.candidates_token_count
+        return response.text
+
+class StubBackend:
+    # Offline backend for benchmarks and load tests: returns canned emails
+    # (varied per call so they don't trip duplicate detection) after an optional delay.
+    # Without a seed, every stub in the process shares one counter so per-request
+    # backends (the API service) don't repeat each other's emails.
+    # slow_rate of calls take slow_seconds instead, to mimic the hosted model's latency tail.
+    _shared_counter = itertools.count()
+
+    def __init__(self, latency=0.0, seed=None, slow_rate=0.0, slow_seconds=0.0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self._counter = self._shared_counter if seed is None else itertools.count(seed)
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        latency = self.slow_seconds if self.slow_rate and random.random() < self.slow_rate else self.latency
+        if latency > 0:
+            time.sleep(latency)
+        n = next(self._counter)
+        request_type = metadata.get("request_type")
+        if request_type == "hint":
+            return f"METAPHORICAL HINT: Imagine a librarian hunting for book number {n} that was shelved in the wrong aisle."
+        if request_type == "scenario_start":
+            return (
+                f"From: Customer {n} <customer{n}@example.com>\nTo: Support <support@company.com>\nSubject: Ticket #{n} - login failures {n * 7919 % 104729}\n\n"
+                f"Users on account {n} cannot sign in since {n % 12 + 1}am. How would you classify this ticket's priority (P1-P4)?"
+            )
+        if request_type == "best_practices":
+            return f"BEST PRACTICES: 1) Confirm the scope of issue {n} 2) Set the priority from business impact 3) Keep the customer updated"
+        if request_type == "judge":
+            return json.dumps({"score": 4, "reason": f"Stub judgement {n}"})
+        return (
+            f"From: Customer {n} <customer{n}@example.com>\nTo: You <you@company.com>\nSubject: Ticket #{n} - issue {n * 7919 % 104729}\n\n"
+            f"FEEDBACK: Reply {n} to '{(metadata.get('user_input') or '')[:40]}'.\n\n"
+            f"LEARNING GUIDE: Scope issue {n}, check logs for request {n * 31}, then escalate.\n\n"
+            f"OPTIONS: 1) Ask for request ids {n} 2) Check monitoring {n + 1} 3) Escalate {n + 2}"
+        )
+
+class RecordingBackend:
+    def __init__(self, inner, path, learner_id=None):
+        self.inner = inner
+        self.path = path
+        self.learner_id = learner_id
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        start = time.perf_counter()
+        output = self.inner.send(model_name, generation_config, history, message, **metadata)
+        latency_ms = (time.perf_counter() - start) * 1000
+        record = {
+            "type": "turn",
+            "model": model_name,
+            "request_type": metadata.get("request_type"),
+            "role": metadata.get("role"),
+            "learner_id": self.learner_id,
+            "thread_id": metadata.get("thread_id"),
+            "regenerate": bool(metadata.get("regenerate")),
+            "user_input": metadata.get("user_input"),
+            "history_length": len(history),
+            "output": output,
+            "latency_ms": round(latency_ms, 3),
+            "recorded_at": time.time(),
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return output
+
+class RateLimiter:
+    # Token bucket shared by every caller of one backend: allows `rate` requests
+    # per second on average with bursts of up to `burst`
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Function to take a token if one is free; returns 0 or the seconds until one will be
+    def try_acquire(self):
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    # Function to report the share of the burst currently unused
+    def headroom(self):
+        with self._lock:
+            self._refill()
+            return self._tokens / self.burst
+
+    # Function to block until a request may go out; returns the seconds waited
+    def acquire(self):
+        waited = 0.0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+class RateLimitedBackend:
+    # Holds each model call until its model's limiter lets it through
+    def __init__(self, inner, limiters):
+        self.inner = inner
+        self.limiters = limiters  # model name -> RateLimiter
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        limiter = self.limiters.get(model_name)
+        if limiter is not None:
+            waited = limiter.acquire()
+            if waited:
+                metrics.observe("ratelimit.wait_ms", waited * 1000)
+        return self.inner.send(model_name, generation_config, history, message, **metadata)
+
+class KeysExhausted(Exception):
+    pass
+
+class PooledKey:
+    def __init__(self, name, key, rpm):
+        self.name = name
+        self.key = key
+        self.rpm = rpm
+        self.limiter = RateLimiter(rpm / 60.0, burst=max(1, int(rpm / 60)))
+        self.error_rate = 0.0  # moving average over recent calls
+        self.in_flight = 0
+        self.strikes = 0  # rate limit errors in a row, for the backoff
+        self.quarantined_until = 0.0
+        self.recent = deque()  # call times in the last minute
+
+class KeyPool:
+    # Spreads model calls over several API keys (or projects), each with its own
+    # requests-per-minute quota, so a shared deployment can go faster than any
+    # one key allows. Each call takes the key with the most unused quota, fewest
+    # recent errors and fewest calls in flight. A key that hits a rate limit is
+    # quarantined with exponential backoff. Per-key use is reported as keys.* metrics.
+    def __init__(self, keys, quarantine_seconds=5.0, max_quarantine_seconds=300.0, max_wait=30.0, smoothing=0.1):
+        self.keys = [PooledKey(entry.get("name") or f"key{index}", entry["key"], entry.get("rpm", 60))
+                     for index, entry in enumerate(keys)]
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.max_wait = max_wait
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    def _score(self, pooled_key):
+        return pooled_key.limiter.headroom() * (1 - pooled_key.error_rate) / (1 + pooled_key.in_flight)
+
+    # Function to take the best available key, waiting up to max_wait for quota or a quarantine to end
+    def acquire(self):
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                available = [pooled_key for pooled_key in self.keys if pooled_key.quarantined_until <= now]
+                delay = min((pooled_key.quarantined_until - now for pooled_key in self.keys if pooled_key.quarantined_until > now), default=self.max_wait)
+                for pooled_key in sorted(available, key=self._score, reverse=True):
+                    wait = pooled_key.limiter.try_acquire()
+                    if not wait:
+                        pooled_key.in_flight += 1
+                        pooled_key.recent.append(now)
+                        return pooled_key
+                    delay = min(delay, wait)
+            if time.monotonic() + delay > deadline:
+                metrics.increment("keys.exhausted")
+                raise KeysExhausted("Every API key is out of quota or rate limited, please try again shortly")
+            time.sleep(delay)
+
+    # Function to record how a call on a key went: "ok", "error" or "rate_limited"
+    def release(self, pooled_key, outcome):
+        with self._lock:
+            now = time.monotonic()
+            pooled_key.in_flight -= 1
+            pooled_key.error_rate += self.smoothing * ((outcome != "ok") - pooled_key.error_rate)
+            if outcome == "rate_limited":
+                pooled_key.strikes += 1
+                backoff = min(self.max_quarantine_seconds, self.quarantine_seconds * 2 ** (pooled_key.strikes - 1))
+                pooled_key.quarantined_until = now + backoff
+                metrics.increment(f"keys.{pooled_key.name}.rate_limited")
+            elif outcome == "ok":
+                pooled_key.strikes = 0
+            while pooled_key.recent and now - pooled_key.recent[0] > 60:
+                pooled_key.recent.popleft()
+            metrics.increment(f"keys.{pooled_key.name}.requests")
+            metrics.set_gauge(f"keys.{pooled_key.name}.utilisation", len(pooled_key.recent) / pooled_key.rpm)
+            metrics.set_gauge(f"keys.{pooled_key.name}.error_rate", pooled_key.error_rate)
+            metrics.set_gauge(f"keys.{pooled_key.name}.quarantined", int(pooled_key.quarantined_until > now))
+            metrics.set_gauge("keys.available", sum(1 for other in self.keys if other.quarantined_until <= now))
+
+# Function to tell a rate limit (HTTP 429 / ResourceExhausted) from other errors
+def is_rate_limited(error):
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or getattr(error, "code", None) == 429
+
+class PooledBackend:
+    # Sends each call on a key from the pool, moving on to another key when one is rate limited
+    def __init__(self, pool, backend_factory=GeminiBackend):
+        self.pool = pool
+        self._backends = {pooled_key.name: backend_factory(pooled_key.key) for pooled_key in pool.keys}
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        for _ in range(len(self.pool.keys)):
+            pooled_key = self.pool.acquire()
+            try:
+                output = self._backends[pooled_key.name].send(model_name, generation_config, history, message, **metadata)
+            except Exception as e:
+                rate_limited = is_rate_limited(e)
+                self.pool.release(pooled_key, "rate_limited" if rate_limited else "error")
+                if not rate_limited:
+                    raise
+                error = e
+                continue
+            self.pool.release(pooled_key, "ok")
+            return output
+        raise error
+
+_key_pool = None
+_key_pool_lock = threading.Lock()
+
+# Function to get the process-wide key pool built from GEMINI_API_KEYS, or None without one
+def shared_key_pool(config):
+    global _key_pool
+    if not config.GEMINI_API_KEYS:
+        return None
+    with _key_pool_lock:
+        if _key_pool is None:
+            _key_pool = KeyPool(config.GEMINI_API_KEYS, config.KEY_QUARANTINE_SECONDS, config.KEY_MAX_QUARANTINE_SECONDS, config.KEY_POOL_MAX_WAIT)
+        return _key_pool
+
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+# Function to get the process-wide executor hedged attempts run on, sized by HEDGE_WORKERS
+def shared_hedge_executor(config):
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=config.HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_executor
+
+class DeadlineExceeded(Exception):
+    pass
+
+class HedgedBackend:
+    # Cuts tail latency: when a call is still running after its request type's
+    # hedge deadline (about that type's p95), a duplicate goes to the alternate
+    # backend/model and whichever answers first wins. When every attempt misses
+    # the hard deadline DeadlineExceeded is raised, so the engine can serve
+    # pregenerated content instead. Losing attempts finish in the background and
+    # report how much waiting the hedge saved. The losers cost tokens as well, so
+    # each one that completes is passed to the caller's charge_extra(model, output,
+    # usage) callback, even if it finishes after the reply was returned.
+    #
+    # Attempts run on a bounded executor shared by every hedged backend. A duplicate
+    # is extra load the caller's admission slot and rate limiter didn't account for,
+    # so it only fires when the alternate model's limiter has a token free and the
+    # admission controller has a free slot (held until the duplicate finishes);
+    # otherwise the call just waits for the original attempt.
+    def __init__(self, inner, deadlines, alternate_models=None, alternate=None, executor=None, limiters=None, admission=None):
+        self.inner = inner
+        self.deadlines = deadlines  # request type -> (hedge after, hard deadline or None) in seconds
+        self.alternate_models = alternate_models or {}
+        self.alternate = alternate or inner  # e.g. a backend on another key or project
+        self.executor = executor or ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+        self.limiters = limiters or {}  # model name -> RateLimiter
+        self.admission = admission
+
+    # Function to take what a duplicate needs to go out without queueing: a limiter token
+    # and an admission slot. Returns the claimed ticket (or True without admission control),
+    # or None when the duplicate would have to wait and so isn't sent.
+    def _reserve_hedge(self, model, request_type):
+        limiter = self.limiters.get(model)
+        if limiter is not None and limiter.try_acquire():
+            metrics.increment(f"hedge.skipped_rate_limited.{request_type}")
+            return None
+        if self.admission is None:
+            return True
+        ticket = self.admission.try_acquire("hedge")
+        if ticket is None:
+            metrics.increment(f"hedge.skipped_no_slot.{request_type}")
+        return ticket
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        request_type = metadata.get("request_type")
+        if request_type not in self.deadlines:
+            return self.inner.send(model_name, generation_config, history, message, **metadata)
+        hedge_after, hard_deadline = self.deadlines[request_type]
+        # Either attempt may win, so neither streams; the caller gets the winner in one piece
+        metadata = {key: value for key, value in metadata.items() if key != "on_chunk"}
+        results = queue.Queue()
+        start = time.monotonic()
+        won_at = []  # set once a winner is returned, read by the loser
+        decided = []  # set under the lock by the first successful attempt, or when the hard deadline gives up
+        lock = threading.Lock()
+
+        def attempt(backend, model, hedged, ticket=None):
+            usage = {}
+            try:
+                output = backend.send(model, generation_config, history, message, **{**metadata, "usage": usage})
+                error = None
+            except Exception as e:
+                output, error = None, e
+            finally:
+                if ticket not in (None, True):
+                    self.admission.release(ticket)
+            with lock:
+                extra = error is None and bool(decided)
+                if error is None:
+                    decided.append(model)
+            if extra:
+                metrics.increment(f"hedge.extra_charged.{request_type}")
+                if metadata.get("charge_extra") is not None:
+                    metadata["charge_extra"](model, output, usage)
+            else:
+                results.put((hedged, model, output, usage, error))
+            if not hedged:
+                # What the learner would have waited without hedging, against what they did wait
+                finished = time.monotonic()
+                metrics.observe(f"hedge.unhedged_ms.{request_type}", (finished - start) * 1000)
+                if won_at and won_at[0] < finished:
+                    metrics.observe(f"hedge.saved_ms.{request_type}", (finished - won_at[0]) * 1000)
+                unhedged_p95 = metrics.percentile(f"hedge.unhedged_ms.{request_type}", 95)
+                served_p95 = metrics.percentile(f"hedge.latency_ms.{request_type}", 95)
+                if served_p95 is not None:
+                    metrics.set_gauge(f"hedge.p95_improvement_ms.{request_type}", unhedged_p95 - served_p95)
+
+        metrics.increment(f"hedge.calls.{request_type}")
+        self.executor.submit(attempt, self.inner, model_name, False)
+        pending, hedge_sent, first_error = 1, False, None
+        while True:
+            if not hedge_sent:
+                timeout = start + hedge_after - time.monotonic()
+            elif hard_deadline:
+                timeout = start + hard_deadline - time.monotonic()
+            else:
+                timeout = None
+            try:
+                hedged, model, output, usage, error = results.get(timeout=None if timeout is None else max(0.0, timeout))
+            except queue.Empty:
+                if not hedge_sent:
+                    hedge_sent = True
+                    alternate_model = self.alternate_models.get(model_name, model_name)
+                    ticket = self._reserve_hedge(alternate_model, request_type)
+                    if ticket is not None:
+                        pending += 1
+                        metrics.increment(f"hedge.sent.{request_type}")
+                        self.executor.submit(attempt, self.alternate, alternate_model, True, ticket)
+                    continue
+                with lock:
+                    if decided:
+                        continue  # An answer came in just now
+                    decided.append(None)
+                metrics.increment(f"hedge.deadline_missed.{request_type}")
+                raise DeadlineExceeded(f"No response within {hard_deadline:g} seconds")
+            pending -= 1
+            metrics.set_gauge(f"hedge.rate.{request_type}", metrics.ratio(f"hedge.sent.{request_type}", f"hedge.calls.{request_type}"))
+            if error is None:
+                won_at.append(time.monotonic())
+                metrics.observe(f"hedge.latency_ms.{request_type}", (won_at[0] - start) * 1000)
+                if hedged:
+                    metrics.increment(f"hedge.won.{request_type}")
+                if metadata.get("usage") is not None:
+                    metadata["usage"].update(usage, model=model)
+                return output
+            first_error = first_error or error
+            if pending == 0:
+                raise first_error
+
+# Function to build one shared limiter per model from requests-per-minute limits
+def rate_limiters(limits_per_minute):
+    return {model: RateLimiter(rpm / 60.0, burst=max(1, int(rpm / 60))) for model, rpm in limits_per_minute.items() if rpm > 0}
+
+class ReplayExhausted(Exception):
+    pass
+
+class ReplayBackend:
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self.turns = load_replay(path)
+        # Turns are matched on what was asked rather than strict order, so a
+        # replay stays deterministic even if duplicate regeneration differs
+        self._queues = {}
+        for turn in self.turns:
+            self._queues.setdefault(_turn_key(turn), []).append(turn)
+        self._served = {}
+        self._lock = threading.Lock()
+
+    # Function to return the matching recorded output after its (scaled) recorded latency
+    def send(self, model_name, generation_config, history, message, **metadata):
+        key = _turn_key({**metadata, "history_length": len(history)})
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                metrics.increment("replay.mismatch")
+                raise ReplayExhausted(f"No recorded turn for {key}")
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            turn = queue[min(index, len(queue) - 1)]  # Extra regenerations reuse the last recording
+        if self.speed > 0:
+            time.sleep(turn["latency_ms"] * self.speed / 1000)
+        return turn["output"]
+
+# Function to identify a recorded turn by what was asked
+def _turn_key(turn):
+    return (turn.get("request_type"), turn.get("user_input") or "", turn.get("history_length"))
+
+# Function to read the recorded turns from a replay file
+def load_replay(path):
+    with open(path, encoding="utf-8") as f:
+        return [record for record in map(json.loads, filter(str.strip, f)) if record.get("type") == "turn"]
+
+# Function to derive a stable, anonymous learner id from an API key
+def learner_id(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+# Function to build the backend for a session according to the configuration
+def create_backend(api_key, session_id, config, ledger=None, estimator=None, cached_scenarios=None, limiters=None, admission=None):
+    # Without a key of their own (e.g. with the key pool) a learner is known by their session
+    learner = learner_id(api_key or session_id)
+    pool = shared_key_pool(config) if config.BACKEND == "gemini" and api_key in ("", None, config.GEMINI_API_KEY) else None
+    if config.BACKEND == "replay":
+        backend = ReplayBackend(config.REPLAY_PATH, config.REPLAY_SPEED)
+    elif config.BACKEND == "stub":
+        backend = StubBackend(config.STUB_LATENCY, slow_rate=config.STUB_SLOW_RATE, slow_seconds=config.STUB_SLOW_SECONDS)
+    elif pool is not None:
+        # Calls that would use the service key are spread over the shared key pool instead
+        backend = PooledBackend(pool)
+    else:
+        backend = GeminiBackend(api_key)
+    # Replays are served as recorded, so only live backends are hedged
+    if config.HEDGE_DEADLINES and config.BACKEND != "replay":
+        alternate = GeminiBackend(config.HEDGE_API_KEY) if config.BACKEND == "gemini" and config.HEDGE_API_KEY else None
+        # Duplicates take their own limiter token and admission slot, or aren't sent
+        backend = HedgedBackend(backend, config.HEDGE_DEADLINES, config.HEDGE_ALTERNATE_MODELS, alternate,
+                                shared_hedge_executor(config), limiters, admission)
+    if config.RECORD_DIR:
+        backend = RecordingBackend(backend, os.path.join(config.RECORD_DIR, f"{session_id}.jsonl"), learner)
+    if ledger is not None:
+        # A learner is identified by their API key (or session), so "user" is also the per-key quota
+        scopes = {"session": session_id, "user": learner}
+        backend = costs.MeteredBackend(backend, ledger, estimator or costs.TokenEstimator(), scopes,
+                                       config.QUOTA_FALLBACK_MODEL, config.QUOTA_FALLBACK_MAX_TOKENS, cached_scenarios)
+    return backend
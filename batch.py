@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import backends
+import config
+from engine import ERROR_PREFIX, HELP_MESSAGES, SimulationEngine, classify_request
+
+# Batch runner for scripted learner conversations. Each line of the input is
+# one conversation:
+#
+#   {"id": "p2-then-hint", "role": "Support Engineer",
+#    "turns": ["I'd classify this as P2", "[HINT] I'm stuck", {"help": "newcomer"}]}
+#
+# Every conversation opens with a generated scenario and then sends its turns
+# through SimulationEngine.reply, so they take the same request-type branches
+# (hint, newcomer, best practices, follow-up) as the app. Conversations run in
+# parallel on a thread pool; all of them share one rate limiter per model.
+# Results are streamed to a JSONL file, one line per turn, as they complete.
+
+# Function to read and validate conversation scripts
+def load_scripts(path, roles):
+    scripts = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            script = json.loads(line)
+            script.setdefault("id", f"line-{line_number}")
+            if script.get("role") not in roles:
+                raise ValueError(f"{path}:{line_number}: unknown role {script.get('role')!r}")
+            for turn in script.get("turns", []):
+                if isinstance(turn, dict) and turn.get("help") not in HELP_MESSAGES:
+                    raise ValueError(f"{path}:{line_number}: unknown help action {turn.get('help')!r}")
+            scripts.append(script)
+    return scripts
+
+class ResultWriter:
+    def __init__(self, f):
+        self.f = f
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self.f.write(json.dumps(record) + "\n")
+            self.f.flush()
+
+# Function to run one scripted conversation, writing a result line per turn
+def run_script(simulation_engine, script, backend, writer):
+    conversation = simulation_engine.new_conversation()
+    role = script["role"]
+    turns = [""] + [HELP_MESSAGES[turn["help"]] if isinstance(turn, dict) else turn for turn in script.get("turns", [])]
+    timings = []
+    for index, user_input in enumerate(turns):
+        request_type = classify_request(user_input, conversation.chat_history)
+        model_name, _ = simulation_engine.route(request_type)
+        start = time.perf_counter()
+        if index == 0:
+            response = simulation_engine.start(conversation, role, backend)
+        else:
+            response = simulation_engine.reply(conversation, role, user_input, backend)
+        seconds = time.perf_counter() - start
+        timings.append(seconds)
+        writer.write({
+            "conversation_id": script["id"],
+            "turn": index,
+            "role": role,
+            "request_type": request_type,
+            "model": model_name,
+            "user_input": user_input,
+            "response": response,
+            "error": response.startswith(ERROR_PREFIX),
+            "seconds": round(seconds, 4),
+        })
+    return timings
+
+# Function to run every script on a thread pool; returns a summary
+def run(scripts, out, simulation_engine, api_key, workers, limits):
+    limiters = backends.rate_limiters(limits)
+    writer = ResultWriter(out)
+    timings, failed = [], []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {}
+        for script in scripts:
+            backend = backends.RateLimitedBackend(backends.create_backend(api_key, uuid.uuid4().hex, config, limiters=limiters), limiters)
+            futures[executor.submit(run_script, simulation_engine, script, backend, writer)] = script["id"]
+        for future in as_completed(futures):
+            try:
+                timings.extend(future.result())
+            except Exception as e:
+                failed.append(futures[future])
+                print(f"Conversation {futures[future]} failed: {e}", file=sys.stderr)
+    wall = time.perf_counter() - start
+    timings.sort()
+    return {
+        "conversations": len(scripts),
+        "failed": len(failed),
+        "turns": len(timings),
+        "wall_seconds": round(wall, 2),
+        "turn_p50_seconds": round(statistics.median(timings), 3) if timings else None,
+        "turn_p95_seconds": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3) if timings else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run scripted learner conversations through the simulator")
+    parser.add_argument("scripts", help="JSONL file, one conversation script per line")
+    parser.add_argument("--out", default="batch_results.jsonl", help="where to stream per-turn results")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="conversations run in parallel")
+    parser.add_argument("--api-key", default=config.GEMINI_API_KEY)
+    parser.add_argument("--rate-limits", type=json.loads, default={},
+                        help='requests per minute per model as JSON, overriding RATE_LIMITS, e.g. \'{"gemini-1.5-pro": 60}\'')
+    parser.add_argument("--corpus", help="scenario corpus to dedup against and extend (default: a fresh temporary one)")
+    args = parser.parse_args()
+
+    # Scripted runs shouldn't add QA scenarios to the live corpus unless asked to
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        simulation_engine = SimulationEngine(corpus_path=args.corpus or os.path.join(scratch_dir, "scenario_corpus.jsonl"))
+        scripts = load_scripts(args.scripts, simulation_engine.role_prompts)
+        with open(args.out, "w", encoding="utf-8") as out:
+            summary = run(scripts, out, simulation_engine, args.api_key, args.workers, {**config.RATE_LIMITS, **args.rate_limits})
+    print(", ".join(f"{key}={value}" for key, value in summary.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import subprocess
+import sys
+import time
+
+# Benchmark suite for the career simulator hot paths. Run with
+#   python benchmarks.py            (all benchmarks)
+#   python benchmarks.py dedup      (selected benchmarks)
+# Results are printed and written to bench_output.txt.
+
+BENCHMARKS = {}
+
+# Decorator to register a benchmark function under a name
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+# Function to time a callable and return the mean in milliseconds
+def time_it(func, repeat=1000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+@benchmark("dedup")
+def bench_dedup():
+    import dedup
+    ticket = (
+        "From: Jordan Lee <jordan@customer.com>\nSubject: Login not working\n"
+        "Hi support, none of our users can log in to the portal since this morning. "
+        "The page says invalid credentials even after a password reset. About 40 people are blocked "
+        "and we have a payroll deadline at 5pm. Please help urgently. "
+    ) * 3
+    index = dedup.MinHashIndex()
+    for i in range(10000):
+        index.add(i, dedup.signature(f"ticket {i} reports issue {i * 7} in module {i % 13} for tenant {i % 97}"))
+    sig = dedup.signature(ticket)
+    return {
+        "signature_ms": time_it(lambda: dedup.signature(ticket), 200),
+        "check_ms_10k_index": time_it(lambda: index.is_duplicate(sig), 2000),
+    }
+
+# Function to time a module import in a fresh interpreter (None if it isn't installed)
+def cold_import_ms(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return float(result.stdout) if result.returncode == 0 else None
+
+@benchmark("startup")
+def bench_startup():
+    results = {}
+    for module in ("streamlit", "google.generativeai", "prompts", "desktop", "dedup"):
+        results[f"import_ms.{module}"] = cold_import_ms(module)
+    
+    # Time to first paint of the API key page, measured with Streamlit's headless test runner
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        results["first_paint_ms"] = None
+        return results
+    app = AppTest.from_file("check.py", default_timeout=60)
+    start = time.perf_counter()
+    app.run()
+    results["first_paint_ms"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    app.run()
+    results["rerun_ms"] = (time.perf_counter() - start) * 1000
+    results["genai_imported_before_first_call"] = "google.generativeai" in sys.modules
+    return results
+
+# Function to build a realistic-looking synthetic conversation of the given number of turns
+def synthetic_history(turns, seed=0):
+    import random
+    rng = random.Random(seed)
+    issues = ["login failures", "slow dashboard loads", "webhook timeouts", "CSV export errors", "SSO redirect loops", "missing invoices"]
+    names = ["Priya Shah", "Tom Becker", "Ana Lopez", "Wei Chen", "Sam Okafor"]
+    history = []
+    for turn in range(turns):
+        issue, name = rng.choice(issues), rng.choice(names)
+        history.append({"role": "user", "content": f"I would classify this as P{rng.randint(1, 4)}. First I'd check the logs for {issue} and ask the customer for a timestamp."})
+        paragraphs = [
+            f"From: {name} <{name.split()[0].lower()}@customer{rng.randint(1, 999)}.com>\nTo: You <you@company.com>\nSubject: Re: Ticket #{1000 + turn} - {issue}\nTime: {rng.randint(1, 12)}:{rng.randint(10, 59)} PM",
+            f"Thanks for the quick reply. We are still seeing {issue} for about {rng.randint(5, 500)} users since {rng.randint(1, 12)}am.",
+            "FEEDBACK: Good instinct to check the logs first. Your priority choice was reasonable, but consider the business impact and the number of affected users before settling on it.",
+            "LEARNING GUIDE: An experienced support engineer would first acknowledge the customer, confirm the scope (who is affected, since when, what changed), check monitoring dashboards and recent deployments, reproduce the issue if possible, and then escalate to the on-call developer with a clear summary.",
+            f"OPTIONS: 1) Ask the customer for request IDs for the failed attempts. 2) Check the status of the {issue.split()[0]} service in monitoring. 3) Escalate to engineering with your findings so far.",
+        ]
+        # Model replies are long: pad with a varied selection of typical guidance sentences
+        guidance = [
+            "Remember to keep the customer updated at regular intervals, even if you have nothing new to share.",
+            f"In this case roughly {rng.randint(2, 90)}% of requests are failing, which changes how urgent the ticket is.",
+            "Document every step you take in the ticket so that the next engineer can pick it up without repeating work.",
+            "When you escalate, include the impact, the timeline, what you have already ruled out and your best hypothesis.",
+            f"The customer's account manager, {rng.choice(names)}, has asked to be copied on all updates.",
+            "A common beginner mistake is to jump straight to a fix before understanding the scope of the problem.",
+            "Check whether a workaround exists that you can offer while engineering investigates the root cause.",
+            f"Our SLA for this customer tier requires a first response within {rng.choice([15, 30, 60, 240])} minutes.",
+            "Try to reproduce the problem in the staging environment with the same browser and account settings.",
+            "If several customers report the same symptom, open a single incident and link the tickets to it.",
+            f"The last deployment went out at {rng.randint(1, 12)}:{rng.randint(10, 59)} and touched the {issue.split()[0]} module.",
+            "Close the loop at the end: confirm with the customer that the fix works before resolving the ticket.",
+        ]
+        paragraphs[2:2] = rng.sample(guidance, 9)
+        history.append({"role": "assistant", "content": "\n\n".join(paragraphs)})
+    return history
+
+# Function to measure the memory allocated while building a history container
+def traced_bytes(build):
+    import tracemalloc
+    tracemalloc.start()
+    container = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, container
+
+@benchmark("transcript")
+def bench_transcript():
+    from transcript import Transcript
+    results = {}
+    for turns in (50, 200):
+        # Copy strings so the plain list doesn't just share the template's objects
+        messages = [{"role": m["role"], "content": "".join(list(m["content"]))} for m in synthetic_history(turns)]
+        plain, _ = traced_bytes(lambda: [{"role": m["role"], "content": (m["content"] + ".")[:-1]} for m in messages])
+        compressed, transcript = traced_bytes(lambda: Transcript({"role": m["role"], "content": (m["content"] + ".")[:-1]} for m in messages))
+        results[f"plain_kb_{turns}_turns"] = plain / 1024
+        results[f"compressed_kb_{turns}_turns"] = compressed / 1024
+        results[f"saved_pct_{turns}_turns"] = 100 * (1 - compressed / plain)
+        results[f"read_all_ms_{turns}_turns"] = time_it(lambda: list(transcript), 20)
+    return results
+
+@benchmark("engine")
+def bench_engine():
+    import os
+    import tempfile
+    from backends import StubBackend
+    from engine import SimulationEngine
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        engine = SimulationEngine(corpus_path=os.path.join(scratch_dir, "scenario_corpus.jsonl"))
+        backend = StubBackend()
+        conversation = engine.new_conversation()
+        engine.start(conversation, "Support Engineer", backend)
+        for i in range(20):
+            engine.reply(conversation, "Support Engineer", f"I would classify this as P{i % 4 + 1}", backend)
+        history = list(conversation.chat_history)
+        return {
+            "build_prompt_ms": time_it(lambda: engine.build_prompt("Support Engineer", "follow_up", "P2", history), 2000),
+            "generate_ms_20_turns": time_it(lambda: engine.generate("Support Engineer", "P2", history, backend), 500),
+            "generate_unique_ms_20_turns": time_it(lambda: engine.generate_unique("Support Engineer", "P2", history, backend, conversation.scenario_index), 200),
+            "reply_ms": time_it(lambda: engine.reply(conversation, "Support Engineer", "P3 because only one user", backend), 50),
+        }
+
+@benchmark("desktop")
+def bench_desktop():
+    import json
+    import os
+    import tempfile
+    import desktop_assets
+    history = synthetic_history(1)
+    email = {"subject": "Support Ticket #1", "sender": "Support System <support@company.com>", "body": history[-1]["content"]}
+    args = {"role": "Support Engineer", "email": email, "unread_count": 1}
+    with tempfile.TemporaryDirectory() as build_dir:
+        desktop_assets.build_assets(build_dir, base_url="")
+        # Fetched once, then cached by the browser (index.html is revalidated)
+        first_load_bytes = sum(os.path.getsize(os.path.join(build_dir, name)) for name in os.listdir(build_dir))
+    # The same page with its CSS/JS inlined and the email embedded, as the f-string version sent
+    # on every script run (21,727 bytes for this email before the component, vs 20,751 first load)
+    with open(os.path.join(desktop_assets.ASSET_DIR, "index.html"), encoding="utf-8") as f:
+        page = f.read()
+    with open(os.path.join(desktop_assets.ASSET_DIR, "desktop.css"), encoding="utf-8") as f:
+        page = page.replace('<link rel="stylesheet" href="desktop.css">', f"<style>{f.read()}</style>")
+    with open(os.path.join(desktop_assets.ASSET_DIR, "desktop.js"), encoding="utf-8") as f:
+        page = page.replace('<script src="desktop.js"></script>', f"<script>{f.read()}</script>")
+    return {
+        "inline_page_bytes": len(page.encode("utf-8")) + len(email["body"].encode("utf-8")),
+        "first_load_bytes": first_load_bytes,
+        "per_turn_bytes": len(json.dumps(args).encode("utf-8")),
+        "email_bytes": len(email["body"].encode("utf-8")),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run career simulator benchmarks")
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    args = parser.parse_args()
+    lines = []
+    for name in args.names or list(BENCHMARKS):
+        for key, value in BENCHMARKS[name]().items():
+            line = f"{name}.{key}: {value:.4f}" if isinstance(value, float) else f"{name}.{key}: {value}"
+            print(line)
+            lines.append(line)
+    with open("bench_output.txt", "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+if __name__ == "__main__":
+    main()
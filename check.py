@@ -1,796 +1,483 @@
 import streamlit as st
-import json
-import google.generativeai as genai
+import uuid
+import config
+import dedup
+import engine
+import metrics
+import priority_classifier
+import singleflight
+import session_store
+import backends
+import costs
+import threading
+import shift
+import scheduler
+import random
 import time
-from datetime import datetime
-import streamlit.components.v1 as components
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import etl
+import aggregates
+import desktop
+import admission
+import warmup
+import profiler
+from prompts import roles
 
 # Set page configuration with expanded layout
 st.set_page_config(page_title="Career Simulator", page_icon="💼", layout="wide", initial_sidebar_state="collapsed")
 
-# Define roles and their descriptions
-roles = {
-    "Support Engineer": "Technical support specialist who resolves customer issues, troubleshoots technical problems, and coordinates with development teams.",
-    "Front-end Developer": "Software engineer who builds user interfaces and interactive components for web applications.",
-    "Data Analyst": "Professional who processes and analyzes data to derive insights and support business decisions.",
-    "Project Manager": "Professional who plans, executes, and closes projects while managing scope, resources, and timelines."
-}
-
-# Role-specific simulation prompts with learning mode
-role_prompts = {
-    "Support Engineer": """
-    You are simulating a realistic work environment for a Support Engineer, but with an educational component for someone completely new to the role. Act as both the system generating support scenarios AND various stakeholders (customers, managers, developers).
-    
-    Follow these rules:
-    1. Create realistic support tickets with technical problems of varying complexity
-    2. Require the user to classify priority (P1/Critical, P2/High, P3/Medium, P4/Low)
-    3. After the user responds, ALWAYS provide:
-       a) Feedback on their answer
-       b) A detailed "LEARNING GUIDE" section that explains how an experienced support engineer would approach this situation
-       c) Give them 2-3 options for what they might do next (with clear explanations)
-    4. Present new challenges based on their decisions
-    5. Track and remember their previous actions within this session
+# Function to get the latest profile summaries per session (written by profiler threads)
+@st.cache_resource
+def get_profile_summaries():
+    return {}
+
+# Function to remember a finished profile's summary for the profiler panel
+def record_profile(session_id, sampler):
+    summaries = get_profile_summaries().setdefault(session_id, deque(maxlen=config.PROFILE_KEEP))
+    summaries.append(sampler.summary(config.PROFILE_TOP_N))
+
+# Developer profiling, switched on for one session by opening the app with
+# ?profile=<PROFILE_TOKEN> and off with ?profile=off. While it is off this costs one check per run.
+if config.PROFILE_TOKEN and "profile" in st.query_params:
+    profiling = st.query_params["profile"] == config.PROFILE_TOKEN
+    if profiling != st.session_state.get("profiling", False):
+        st.session_state.profiling = profiling
+        st.session_state.pop("backend", None)  # Rebuilt with or without model call profiling
+if st.session_state.get("profiling"):
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    profiler.profile_script_run(f"run-{st.session_state.get('script_runs', 0) + 1}", os.path.join(config.PROFILE_DIR, session_id),
+                                config.PROFILE_INTERVAL_MS / 1000, config.PROFILE_TOP_N,
+                                lambda sampler, session_id=session_id: record_profile(session_id, sampler))
+
+# Function to get the headless simulation engine shared by all sessions
+@st.cache_resource
+def get_engine():
+    return engine.SimulationEngine()
+
+# Function to start the process warm-up once, on the first script run after a deploy
+@st.cache_resource
+def get_warm_up():
+    return warmup.WarmUp(get_engine(), warmup.service_backend_factory()).start()
+
+# Function to get the process-wide single-flight group for model calls
+@st.cache_resource
+def get_send_flights():
+    return singleflight.SingleFlight()
+
+# Function to get the process-wide session manager that spills idle sessions to disk
+@st.cache_resource
+def get_session_manager():
+    return session_store.SessionManager(
+        config.SESSION_SPILL_DIR,
+        idle_timeout=config.SESSION_IDLE_TIMEOUT,
+        max_resident_bytes=int(config.SESSION_MAX_RESIDENT_MB * 1024 * 1024),
+        spill_ttl=config.SESSION_SPILL_TTL,
+        threshold=config.DUPLICATE_THRESHOLD,
+        # A spilled session's tab is gone, so stop its ticket arrivals and SLA timers
+        on_evict=lambda session_id: get_scheduler().cancel_session(session_id),
+    )
+
+# Function to get this session's conversation state (rehydrated if it was spilled)
+def current_conversation():
+    return get_session_manager().checkout(st.session_state.session_id)
+
+# Function to get the process-wide cost ledger and token estimator
+@st.cache_resource
+def get_cost_tracking():
+    ledger = costs.CostLedger(config.MODEL_PRICES, config.COST_QUOTAS, config.COST_LEDGER_PATH)
+    return ledger, costs.TokenEstimator()
+
+# Function to load stored opening scenarios, served instead of new ones when over the soft quota
+@st.cache_resource(ttl=600)
+def load_cached_scenarios():
+    return dedup.load_corpus_scenarios(config.SCENARIO_CORPUS_PATH)
+
+# Function to get this session's model backend, created on first use
+def get_session_backend():
+    if 'backend' not in st.session_state:
+        ledger, estimator = get_cost_tracking()
+        backend = backends.create_backend(st.session_state.api_key, st.session_state.session_id, config,
+                                          ledger, estimator, load_cached_scenarios(), admission=get_admission())
+        if st.session_state.get("profiling"):
+            session_id = st.session_state.session_id
+            backend = profiler.ProfiledBackend(backend, os.path.join(config.PROFILE_DIR, session_id), config.PROFILE_INTERVAL_MS / 1000,
+                                               config.PROFILE_TOP_N, lambda sampler: record_profile(session_id, sampler))
+        st.session_state.backend = backend
+    return st.session_state.backend
+
+# Function to send a reply and record the turn exactly once
+def send_reply(send_key, user_input):
+    conversation = current_conversation()
+    if send_key in conversation.completed_sends:
+        metrics.increment("sends.duplicate_dropped")
+        return
     
-    Keep scenarios focused on common software issues like:
-    - Authentication problems
-    - Performance slowdowns
-    - Integration errors
-    - Data sync issues
-    - UI/UX problems
-    - API failures
+    # Instant local check of a priority answer while the full grading is generated
+    ticket = conversation.opening_ticket()
+    preliminary = get_engine().preliminary_feedback(ticket, user_input)
+    if preliminary:
+        st.info(preliminary)
     
-    Start by introducing yourself as the simulation system, explaining that you will provide guidance for beginners, and present the first simple ticket.
-    """
-}
-
-# Function to generate simulation response
-def generate_simulation(role, user_input, chat_history, api_key):
-    # Configure the API with the provided key
-    genai.configure(api_key=api_key)
+    # Show a spinner while generating response; the session stays resident until the turn is recorded
+    with st.spinner("Sending email and waiting for response..."), get_session_manager().pinned(conversation.session_id):
+        # Generate response (history does not yet contain the new user message). The snapshot
+        # is a fork of the branch, so nothing is copied; the turn is recorded on that branch.
+        branch = conversation.chat_history
+        history = branch.fork()
+        ai_response = get_send_flights().do(send_key, lambda: get_engine().respond(
+            st.session_state.selected_role,
+            user_input,
+            history,
+            get_session_backend(),
+            conversation.scenario_index
+        ))
+        
+        # Only the first run to get here records the turn
+        with st.session_state.send_lock:
+            if send_key in conversation.completed_sends:
+                metrics.increment("sends.duplicate_dropped")
+                return
+            branch.append({"role": "user", "content": user_input})
+            branch.append({"role": "assistant", "content": ai_response})
+            conversation.email_counter += 1
+            conversation.completed_sends.add(send_key)
+            st.session_state.composer_nonce = uuid.uuid4().hex
+            if preliminary and not ai_response.startswith(engine.ERROR_PREFIX):
+                priority_classifier.log_grading(config.PRIORITY_LOG_PATH, ticket, priority_classifier.extract_priority(user_input), ai_response)
+    update_analytics()
+
+# Function to get the process-wide admission controller for model calls
+@st.cache_resource
+def get_admission():
+    return admission.AdmissionController(config.ADMISSION_MAX_CONCURRENT, config.ADMISSION_MAX_QUEUE, config.ADMISSION_TICKET_TTL, config.ADMISSION_PRIORITY_STEP)
+
+# Function to get a model-call slot for this session, or None while it waits in the queue
+def admit(kind):
+    controller = get_admission()
+    ticket = st.session_state.get("admission_ticket")
+    if ticket is None:
+        try:
+            ticket = controller.enqueue(st.session_state.session_id, config.ADMISSION_PRIORITIES[kind])
+        except admission.QueueFull:
+            st.session_state.queue_status = admission.Status(False, None, None)
+            return None
+        st.session_state.admission_ticket = ticket
+    status = controller.poll(ticket)
+    if status.admitted and controller.claim(ticket):
+        del st.session_state.admission_ticket
+        st.session_state.pop("queue_status", None)
+        return ticket
+    if status.admitted or status.position is None:
+        # Expired before it was used; queue again on the next poll
+        del st.session_state.admission_ticket
+    st.session_state.queue_status = status
+    return None
+
+# Function to give up this session's place in the queue (e.g. when leaving the simulation)
+def leave_queue():
+    ticket = st.session_state.pop("admission_ticket", None)
+    if ticket is not None:
+        get_admission().release(ticket)
+    st.session_state.pop("queue_status", None)
+    st.session_state.pop("pending_send", None)
+
+# Function to poll the waiting room and rerun once it's this session's turn
+@st.fragment(run_every=config.ADMISSION_POLL_SECONDS)
+def poll_admission():
+    ticket = st.session_state.get("admission_ticket")
+    if ticket is None or get_admission().poll(ticket).admitted:
+        st.rerun()
+
+# Function to get the thread pool shared by every session's shift-mode calls
+@st.cache_resource
+def get_shift_executor():
+    return ThreadPoolExecutor(max_workers=config.SHIFT_WORKERS, thread_name_prefix="shift")
+
+# Function to get this session's shift runner (bounded concurrency per session)
+def get_shift():
+    if 'shift' not in st.session_state:
+        st.session_state.shift = shift.Shift(get_shift_executor(), config.SHIFT_MAX_CONCURRENCY, get_admission(), st.session_state.session_id)
+    return st.session_state.shift
+
+# Function to run func(*args, thread_id=thread_id) for a ticket thread in the background. It waits
+# for an admission slot with the priority of `kind` before it takes a shift worker, and the session
+# stays resident (not spilled) until the call has finished.
+def submit_shift_call(thread_id, kind, func, *args):
+    session_id = st.session_state.session_id
+    sessions = get_session_manager()
+    sessions.pin(session_id)
+    future = get_shift().submit(thread_id, functools.partial(func, thread_id=thread_id), *args, priority=config.ADMISSION_PRIORITIES[kind])
+    future.add_done_callback(lambda future: sessions.unpin(session_id))
+    return future
+
+# Function to send a reply on the active ticket thread without waiting for it
+def send_shift_reply(send_key, user_input):
+    conversation = current_conversation()
+    thread_id = conversation.active_thread
+    if send_key in conversation.completed_sends:
+        metrics.increment("sends.duplicate_dropped")
+        return
+    if get_shift().busy(thread_id):
+        st.warning("Still waiting for a reply on this ticket. Work on another one in the meantime!")
+        return
     
-    # Create a conversation history for Gemini in the expected format
-    gemini_history = []
+    ticket = conversation.opening_ticket()
+    preliminary = get_engine().preliminary_feedback(ticket, user_input)
+    if preliminary:
+        st.info(preliminary)
     
-    # Construct conversation history
-    for message in chat_history:
-        if message["role"] == "user":
-            gemini_history.append({"role": "user", "parts": [message["content"]]})
-        else:  # assistant
-            gemini_history.append({"role": "model", "parts": [message["content"]]})
+    # The user's email shows in the thread straight away; the reply arrives in the background
+    stop_sla_clock(conversation.threads[thread_id])
+    history = conversation.chat_history.fork()
+    with st.session_state.send_lock:
+        conversation.chat_history.append({"role": "user", "content": user_input})
+        conversation.completed_sends.add(send_key)
+        st.session_state.composer_nonce = uuid.uuid4().hex
+    submit_shift_call(thread_id, "reply", get_engine().generate_unique, st.session_state.selected_role, user_input,
+                      history, get_session_backend(), conversation.scenario_index)
+
+# Function to get the process-wide scheduler for ticket arrivals and SLA timers
+@st.cache_resource
+def get_scheduler():
+    return scheduler.EventScheduler(get_shift_executor())
+
+# Function to schedule the tickets that arrive during a shift, generated ahead of time
+# (skipped once the session has been spilled, i.e. nobody is there to read them). Each
+# one waits for an admission slot before it takes a shift worker.
+def schedule_arrivals(role, backend, scenario_index):
+    session_id = st.session_state.session_id
+    sessions, controller = get_session_manager(), get_admission()
+    arrive_at = time.time()
+    for _ in range(config.SHIFT_SCHEDULED_TICKETS):
+        arrive_at += random.uniform(*config.ARRIVAL_INTERVAL_SECONDS)
+        thread_id = shift.new_thread_id()  # Picked now so the recorded calls are filed under it
+        def generate(thread_id=thread_id):
+            with sessions.pinned(session_id):
+                if not sessions.is_resident(session_id):
+                    return None
+                return get_engine().generate_unique(role, "", [], backend, scenario_index, thread_id=thread_id)
+        start_generation = lambda generate=generate: controller.submit(
+            get_shift_executor(), session_id, config.ADMISSION_PRIORITIES["arrival"], generate)
+        get_scheduler().spawn(session_id, scheduler.ticket_arrival(
+            get_scheduler(), session_id, arrive_at, config.PREGENERATE_LEAD_SECONDS, start_generation, thread_id))
+
+# Function to start a ticket's SLA clock, using the local classifier to pick its priority
+def start_sla_clock(thread):
+    priority, _ = get_engine().classifier.predict(thread["chat_history"][0]["content"])
+    sla_seconds = config.SLA_SECONDS[priority]
+    thread["priority"] = priority
+    thread["sla_deadline"] = time.time() + sla_seconds
+    thread["sla_timer"] = get_scheduler().call_later(
+        st.session_state.session_id, sla_seconds, get_scheduler().post, st.session_state.session_id,
+        {"type": "escalation", "thread_id": thread["id"], "priority": priority, "sla_seconds": sla_seconds})
+
+# Function to stop a ticket's SLA clock once the learner has replied
+def stop_sla_clock(thread):
+    timer = thread.pop("sla_timer", None)
+    if timer is not None:
+        get_scheduler().cancel(timer)
+        thread.pop("sla_deadline", None)
+
+# Function to file finished background replies and scheduled events into their ticket threads
+def collect_shift_results():
+    conversation = current_conversation()
+    arrived = False
+    for thread_id, result in get_shift().collect():
+        thread = conversation.threads.get(thread_id)
+        if thread is None:
+            continue  # The shift was ended while this reply was generating
+        if isinstance(result, BaseException):
+            result = f"Error generating response: {str(result)}"
+        thread["chat_history"].append({"role": "assistant", "content": result})
+        thread["unread"] = thread_id != conversation.active_thread
+        if len(thread["chat_history"]) == 1:
+            start_sla_clock(thread)
+        conversation.email_counter += 1
+        arrived = True
     
-    try:
-        # Create a new Gemini model instance
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-pro",
-            generation_config={
-                "max_output_tokens": 1200,
-                "temperature": 0.7,
-            }
-        )
-        
-        # Start a chat session
-        chat = model.start_chat(history=gemini_history)
-        
-        # Get the system prompt ready
-        system_prompt = role_prompts[role]
-        
-        # For the first message, include the system prompt
-        if not chat_history:
-            response = chat.send_message(f"{system_prompt}\n\nStart the simulation now. Format your response as an email that has just landed in the user's inbox.")
+    for event in get_scheduler().drain(st.session_state.session_id):
+        if event["type"] == "ticket":
+            thread = shift.new_thread(f"Ticket {len(conversation.threads) + 1}", event.get("thread_id"))
+            thread["chat_history"].append({"role": "assistant", "content": event["content"]})
+            thread["unread"] = True
+            conversation.threads[thread["id"]] = thread
+            start_sla_clock(thread)
+        elif event["type"] == "escalation" and event["thread_id"] in conversation.threads:
+            thread = conversation.threads[event["thread_id"]]
+            thread.pop("sla_timer", None)
+            thread["sla_breached"] = True
+            thread["chat_history"].append({"role": "assistant", "content": scheduler.escalation_email(
+                thread["title"], event["priority"], event["sla_seconds"])})
+            thread["unread"] = event["thread_id"] != conversation.active_thread
+            metrics.increment(f"sla.breached.{event['priority']}")
         else:
-            # Check for special commands
-            if user_input.startswith("[HINT]"):
-                # Extract the current scenario from the last assistant message
-                last_message = chat_history[-1]["content"] if chat_history else ""
-                hint_prompt = f"""
-                The user has requested a hint. Based on the current scenario:
-                
-                {last_message}
-                
-                Please provide a metaphorical story or analogy that would help them understand how to approach this technical problem. 
-                Make it relatable to everyday life. Start with "METAPHORICAL HINT:" and then tell a brief story that explains the core concepts needed.
-                Keep the metaphor simple and engaging, focusing on the problem-solving approach rather than technical details.
-                """
-                response = chat.send_message(hint_prompt)
-            elif "I don't know how to respond" in user_input or "I'm new" in user_input or "I'm a fresher" in user_input:
-                prompt = "The user is indicating they're new to this role and need guidance. Please provide detailed explanations and options for how to proceed."
-                response = chat.send_message(f"{prompt}\n\nUser message: {user_input}")
-            else:
-                # Format responses as emails in an ongoing conversation
-                email_prompt = f"""
-                Based on the user's response: "{user_input}"
-                
-                Generate your next response as a follow-up email in the conversation. If this is from a customer, it should look like a reply email. If it's from a manager or colleague, it should look like a new email about the situation.
-                
-                Include realistic email headers (From, To, Subject, Time) and format it like a genuine email, but focus on the educational aspects in the content.
-                """
-                response = chat.send_message(f"{email_prompt}")
-            
-        return response.text
-    except Exception as e:
-        return f"Error generating response: {str(e)}"
-
-# Function to create a virtual desktop HTML
-def create_virtual_desktop(role, current_email=None, unread_count=1):
-    # Get current time for display
-    current_time = datetime.now().strftime("%I:%M %p")
-    current_date = datetime.now().strftime("%A, %B %d, %Y")
-    
-    # If no current email provided, use a placeholder
-    if not current_email:
-        current_email = """
-        <div class="email-header">
-            <div class="email-subject">Welcome to Your First Day!</div>
-            <div class="email-meta">
-                <div>From: IT Onboarding &lt;onboarding@company.com&gt;</div>
-                <div>Just now</div>
-            </div>
-            <div class="email-meta">
-                <div>To: You &lt;you@company.com&gt;</div>
-            </div>
-        </div>
-        <div class="email-body">
-            <p>Welcome to your first day as a Support Engineer!</p>
-            <p>This simulation will guide you through realistic scenarios you might encounter. Check your inbox regularly for new support tickets.</p>
-            <p>Use the learning aids in the sidebar when you need help.</p>
-            <p>Your first support ticket should arrive shortly. Good luck!</p>
-        </div>
-        """
-    
-    html = f"""
-    <style>
-        :root {{
-            --desktop-bg: #1e3c72;
-            --icon-hover: rgba(255, 255, 255, 0.1);
-            --window-header: #2a4d8f;
-            --window-bg: #f5f5f5;
-            --sidebar-bg: #e5e5e5;
-        }}
-        
-        .virtual-desktop {{
-            background: linear-gradient(to right, #1e3c72, #2a5298);
-            border-radius: 10px;
-            height: 85vh;
-            position: relative;
-            overflow: hidden;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            margin-bottom: 20px;
-        }}
-        
-        .desktop-icons {{
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            gap: 25px;
-            padding: 25px;
-            width: fit-content;
-        }}
-        
-        .desktop-icon {{
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            width: 100px;
-            text-align: center;
-            padding: 8px;
-            border-radius: 5px;
-            color: white;
-            cursor: pointer;
-        }}
-        
-        .desktop-icon:hover {{
-            background-color: var(--icon-hover);
-        }}
-        
-        .icon-img {{
-            width: 50px;
-            height: 50px;
-            margin-bottom: 8px;
-        }}
-        
-        .icon-text {{
-            font-size: 16px;
-            text-shadow: 1px 1px 2px rgba(0,0,0,0.5);
-        }}
-        
-        .window {{
-            position: absolute;
-            background-color: var(--window-bg);
-            border-radius: 8px;
-            box-shadow: 0 5px 25px rgba(0,0,0,0.3);
-            overflow: hidden;
-            top: 50px;
-            left: 150px;
-            width: calc(100% - 180px);
-            height: calc(100% - 100px);
-        }}
-        
-        .window-header {{
-            background-color: var(--window-header);
-            color: white;
-            padding: 12px 18px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        
-        .window-title {{
-            font-size: 16px;
-            font-weight: 500;
-        }}
-        
-        .window-controls {{
-            display: flex;
-            gap: 12px;
-        }}
-        
-        .window-control {{
-            width: 15px;
-            height: 15px;
-            border-radius: 50%;
-        }}
-        
-        .minimize {{
-            background-color: #ffbd2e;
-        }}
-        
-        .maximize {{
-            background-color: #28c941;
-        }}
-        
-        .close {{
-            background-color: #ff5f57;
-        }}
-        
-        .window-content {{
-            height: calc(100% - 45px);
-            display: flex;
-        }}
-        
-        .email-sidebar {{
-            width: 180px;
-            background-color: var(--sidebar-bg);
-            height: 100%;
-            padding: 15px 0;
-            border-right: 1px solid #ddd;
-        }}
-        
-        .sidebar-item {{
-            padding: 12px 18px;
-            cursor: pointer;
-            font-size: 16px;
-        }}
-        
-        .sidebar-item.active {{
-            background-color: #d1d1d1;
-            font-weight: bold;
-        }}
-        
-        .email-list {{
-            width: 220px;  /* Reduced width */
-            height: 100%;
-            overflow-y: auto;
-            border-right: 1px solid #ddd;
-        }}
-        
-        .email-item {{
-            padding: 10px 12px;  /* Smaller padding */
-            border-bottom: 1px solid #eee;
-            cursor: pointer;
-        }}
-        
-        .email-item.active {{
-            background-color: #f0f7ff;
-        }}
-        
-        .email-item .sender {{
-            font-weight: bold;
-            font-size: 13px;  /* Smaller font */
-            margin-bottom: 4px;
-        }}
-        
-        .email-item .subject {{
-            font-size: 12px;  /* Smaller font */
-            margin-bottom: 4px;
-        }}
-        
-        .email-item .preview {{
-            font-size: 11px;  /* Smaller font */
-            color: #666;
-            white-space: nowrap;
-            overflow: hidden;
-            text-overflow: ellipsis;
-        }}
-        
-        .email-item .time {{
-            font-size: 10px;  /* Smaller font */
-            color: #999;
-            margin-top: 4px;
-        }}
-        
-        .email-content {{
-            flex: 1;
-            display: flex;
-            flex-direction: column;
-            height: 100%;
-            overflow: hidden;
-        }}
-        
-        .email-toolbar {{
-            padding: 10px;
-            border-bottom: 1px solid #ddd;
-            display: flex;
-            gap: 10px;
-        }}
-        
-        .email-toolbar-button {{
-            padding: 8px 15px;
-            background-color: #f0f0f0;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 14px;
-        }}
-        
-        .email-toolbar-button:hover {{
-            background-color: #e0e0e0;
-        }}
-        
-        .email-display {{
-            flex: 1;
-            padding: 25px;
-            overflow-y: auto;
-            font-size: 16px;
-        }}
-        
-        .email-composer {{
-            display: none;
-            flex: 1;
-            padding: 25px;
-            overflow-y: auto;
-            font-size: 16px;
-            background-color: #fcfcfc;
-        }}
-        
-        .compose-header {{
-            margin-bottom: 20px;
-        }}
-        
-        .compose-header input {{
-            width: 100%;
-            padding: 8px;
-            margin-bottom: 10px;
-            border: 1px solid #ddd;
-            border-radius: 4px;
-            font-size: 15px;
-        }}
-        
-        .compose-body {{
-            border: 1px solid #ddd;
-            border-radius: 4px;
-            padding: 10px;
-            height: calc(100% - 170px);
-            overflow-y: auto;
-        }}
-        
-        .compose-body textarea {{
-            width: 100%;
-            height: 100%;
-            border: none;
-            resize: none;
-            font-size: 15px;
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-        }}
-        
-        .compose-actions {{
-            margin-top: 15px;
-            display: flex;
-            justify-content: space-between;
-        }}
-        
-        .compose-button {{
-            padding: 8px 15px;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 14px;
-        }}
-        
-        .send-button {{
-            background-color: #0078d4;
-            color: white;
-        }}
-        
-        .cancel-button {{
-            background-color: #f0f0f0;
-        }}
-        
-        .help-button {{
-            background-color: #f0ad4e;
-            color: white;
-        }}
-        
-        .email-header {{
-            padding-bottom: 20px;
-            border-bottom: 1px solid #eee;
-            margin-bottom: 20px;
-        }}
-        
-        .email-subject {{
-            font-size: 22px;
-            font-weight: bold;
-            margin-bottom: 15px;
-        }}
-        
-        .email-meta {{
-            margin-bottom: 8px;
-            font-size: 15px;
-        }}
-        
-        .email-body {{
-            font-size: 16px;
-            line-height: 1.6;
-        }}
-        
-        .email-body p {{
-            margin-bottom: 16px;
-        }}
-        
-        .email-body ul {{
-            margin-left: 20px;
-            margin-bottom: 16px;
-        }}
-        
-        .email-body li {{
-            margin-bottom: 8px;
-        }}
-        
-        .taskbar {{
-            position: absolute;
-            bottom: 0;
-            left: 0;
-            width: 100%;
-            height: 40px;
-            background-color: #0a1e42;
-            display: flex;
-            align-items: center;
-            padding: 0 20px;
-            color: white;
-            font-size: 14px;
-        }}
-        
-        .start-button {{
-            background-color: #2a5298;
-            color: white;
-            border: none;
-            padding: 5px 15px;
-            border-radius: 3px;
-            margin-right: 20px;
-            font-size: 14px;
-        }}
-        
-        .taskbar-time {{
-            position: absolute;
-            right: 20px;
-        }}
-        
-        .email-badge {{
-            background-color: #ff4c4c;
-            color: white;
-            border-radius: 50%;
-            width: 20px;
-            height: 20px;
-            font-size: 12px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            position: absolute;
-            top: -5px;
-            right: -5px;
-        }}
-        
-        /* Modal dialog for help options */
-        .modal {{
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background-color: rgba(0, 0, 0, 0.5);
-            z-index: 1000;
-            justify-content: center;
-            align-items: center;
-        }}
-        
-        .modal-content {{
-            background-color: white;
-            padding: 25px;
-            border-radius: 8px;
-            box-shadow: 0 5px 25px rgba(0, 0, 0, 0.3);
-            width: 500px;
-            max-width: 80%;
-        }}
-        
-        .modal-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 20px;
-        }}
-        
-        .modal-title {{
-            font-size: 20px;
-            font-weight: bold;
-        }}
-        
-        .modal-close {{
-            background: none;
-            border: none;
-            font-size: 20px;
-            cursor: pointer;
-        }}
-        
-        .modal-body {{
-            margin-bottom: 20px;
-        }}
-        
-        .help-options {{
-            display: flex;
-            flex-direction: column;
-            gap: 15px;
-        }}
-        
-        .help-option {{
-            padding: 12px;
-            border-radius: 4px;
-            background-color: #f5f5f5;
-            cursor: pointer;
-            transition: background-color 0.2s;
-        }}
-        
-        .help-option:hover {{
-            background-color: #e0e0e0;
-        }}
-        
-        .help-icon {{
-            margin-right: 10px;
-        }}
-        
-        /* Desktop notification */
-        .desktop-notification {{
-            position: absolute;
-            bottom: 50px;
-            right: 20px;
-            background-color: rgba(0, 0, 0, 0.8);
-            color: white;
-            padding: 15px 20px;
-            border-radius: 5px;
-            font-size: 16px;
-            max-width: 300px;
-            animation: fadeInOut 5s forwards;
-            z-index: 100;
-        }}
-        
-        @keyframes fadeInOut {{
-            0% {{ opacity: 0; transform: translateY(20px); }}
-            10% {{ opacity: 1; transform: translateY(0); }}
-            90% {{ opacity: 1; transform: translateY(0); }}
-            100% {{ opacity: 0; transform: translateY(20px); }}
-        }}
-    </style>
-    
-    <div class="virtual-desktop" id="virtual-desktop">
-        <div class="desktop-icons">
-            <div class="desktop-icon" id="email-icon" onclick="document.getElementById('response-area').style.display='block';">
-                <div style="position: relative;">
-                    <svg class="icon-img" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white">
-                        <path d="M20 4H4c-1.1 0-1.99.9-1.99 2L2 18c0 1.1.9 2 2 2h16c1.1 0 2-.9 2-2V6c0-1.1-.9-2-2-2zm0 4l-8 5-8-5V6l8 5 8-5v2z"/>
-                    </svg>
-                    <div class="email-badge">{unread_count}</div>
-                </div>
-                <div class="icon-text">Email</div>
-            </div>
-            
-            <div class="desktop-icon">
-                <svg class="icon-img" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white">
-                    <path d="M20 6h-4V4c0-1.1-.9-2-2-2h-4c-1.1 0-2 .9-2 2v2H4c-1.1 0-2 .9-2 2v12c0 1.1.9 2 2 2h16c1.1 0 2-.9 2-2V8c0-1.1-.9-2-2-2zm-8 0h-4V4h4v2z"/>
-                </svg>
-                <div class="icon-text">Ticketing</div>
-            </div>
-            
-            <div class="desktop-icon">
-                <svg class="icon-img" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24" fill="white">
-                    <path d="M19 3H5c-1.1 0-2 .9-2 2v14c0 1.1.9 2 2 2h14c1.1 0 2-.9 2-2V5c0-1.1-.9-2-2-2zm-5 14h-2V9h-2V7h4v10z"/>
-                </svg>
-                <div class="icon-text">Knowledge Base</div>
-            </div>
-        </div>
-        
-        <div class="window">
-            <div class="window-header">
-                <div class="window-title">{role} - Work Email</div>
-                <div class="window-controls">
-                    <div class="window-control minimize"></div>
-                    <div class="window-control maximize"></div>
-                    <div class="window-control close"></div>
-                </div>
-            </div>
-            <div class="window-content">
-                <div class="email-sidebar">
-                    <div class="sidebar-item active">Inbox ({unread_count})</div>
-                    <div class="sidebar-item">Sent</div>
-                    <div class="sidebar-item">Drafts</div>
-                    <div class="sidebar-item">Tasks</div>
-                </div>
-                <div class="email-list">
-                    <div class="email-item active">
-                        <div class="sender">Support System</div>
-                        <div class="subject">New Ticket Assigned</div>
-                        <div class="preview">You have a new support ticket...</div>
-                        <div class="time">Just now</div>
-                    </div>
-                </div>
-                <div class="email-content">
-                    <div class="email-toolbar">
-                        <button class="email-toolbar-button" onclick="showEmailDisplay()">View</button>
-                        <button class="email-toolbar-button" onclick="showEmailComposer()">Reply</button>
-                        <button class="email-toolbar-button" onclick="showHelpModal()">Help Options</button>
-                    </div>
-                    <div class="email-display" id="email-display">
-                        {current_email}
-                    </div>
-                    <div class="email-composer" id="email-composer">
-                        <div class="compose-header">
-                            <input type="text" value="Re: Support Ticket #{unread_count}" disabled>
-                            <input type="text" value="To: Support System <support@company.com>" disabled>
-                        </div>
-                        <div class="compose-body">
-                            <textarea id="compose-textarea" placeholder="Type your response here..."></textarea>
-                        </div>
-                        <div class="compose-actions">
-                            <div>
-                                <button class="compose-button cancel-button" onclick="showEmailDisplay()">Cancel</button>
-                            </div>
-                            <div>
-                                <button class="compose-button help-button" onclick="showHelpModal()">Need Help?</button>
-                                <button class="compose-button send-button" onclick="sendEmail()">Send</button>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <!-- Help Modal -->
-        <div class="modal" id="help-modal">
-            <div class="modal-content">
-                <div class="modal-header">
-                    <div class="modal-title">Learning Aids</div>
-                    <button class="modal-close" onclick="closeHelpModal()">&times;</button>
-                </div>
-                <div class="modal-body">
-                    <div class="help-options">
-                        <div class="help-option" onclick="provideHelp('hint')">
-                            <span class="help-icon">💡</span> Get a Metaphorical Hint
-                        </div>
-                        <div class="help-option" onclick="provideHelp('dont-know')">
-                            <span class="help-icon">🆘</span> I don't know what to do
-                        </div>
-                        <div class="help-option" onclick="provideHelp('best-practices')">
-                            <span class="help-icon">📚</span> Show me best practices
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-
-        <div class="desktop-notification" id="notification" style="display:none;">
-            <strong>New Email:</strong> You have a new support ticket assigned to you.
-        </div>
-
-        <div class="taskbar">
-            <button class="start-button">Start</button>
-            <span>{role} Simulator</span>
-            <div class="taskbar-time">{current_time} | {current_date}</div>
-        </div>
-    </div>
-
-   <script>
-    // Show notification after a brief delay
-    setTimeout(function() {{
-        document.getElementById('notification').style.display = 'block';
-        // Hide after 5 seconds
-        setTimeout(function() {{
-            document.getElementById('notification').style.display = 'none';
-        }}, 5000);
-    }}, 2000);
-
-    // Function to show email display and hide composer
-    function showEmailDisplay() {{
-        document.getElementById('email-display').style.display = 'block';
-        document.getElementById('email-composer').style.display = 'none';
-    }}
-    
-    // Function to show email composer and hide display
-    function showEmailComposer() {{
-        document.getElementById('email-display').style.display = 'none';
-        document.getElementById('email-composer').style.display = 'block';
-    }}
-    
-    // Function to show help modal
-    function showHelpModal() {{
-        document.getElementById('help-modal').style.display = 'flex';
-    }}
-    
-    // Function to close help modal
-    function closeHelpModal() {{
-        document.getElementById('help-modal').style.display = 'none';
-    }}
-    
-    // Function to provide help based on option selected
-    function provideHelp(type) {{
-        let helpText = '';
-        
-        if (type === 'hint') {{
-            document.getElementById('compose-textarea').value = "[HINT] I need a metaphorical explanation for this problem";
-        }} else if (type === 'dont-know') {{
-            document.getElementById('compose-textarea').value = "I'm not sure how to handle this situation as I'm new to this role. Can you guide me through what an experienced support engineer would do here?";
-        }}else if (type === 'best-practices') {{
-            document.getElementById('compose-textarea').value = "Can you explain the best practices for handling this type of issue?";
-        }}
-        
-        showEmailComposer();
-        closeHelpModal();
-    }}
-    
-    // Function to send email response
-    function sendEmail() {{
-        const responseText = document.getElementById('compose-textarea').value;
-        
-        if (responseText) {{
-            window.parent.postMessage({
-                type: 'streamlit:componentValue',
-                value: {{
-                    email_response: responseText
-                }}
-            }, '*');
-            
-            document.getElementById('compose-textarea').value = '';
-            
-            showEmailDisplay();
-        }}
-    }}
-    
-    // Event listener for messages from Streamlit
-    window.addEventListener('message', function(event) {{
-        if (event.data.type === 'streamlit:emailUpdate') {{
-            
-            document.getElementById('email-display').innerHTML = event.data.content;
-        }}
-    }});
-</script>
-    """
-    return html
+            continue
+        conversation.email_counter += 1
+        arrived = True
+    if arrived:
+        update_analytics()
+    return arrived
+
+# Function to redraw the role page once the warm-up has finished
+@st.fragment(run_every=1)
+def wait_for_warm_up():
+    if get_warm_up().ready.is_set():
+        st.rerun()
+
+# Function to poll for background replies while a shift is running
+@st.fragment(run_every=config.SHIFT_POLL_SECONDS)
+def poll_shift():
+    if collect_shift_results():
+        st.rerun()  # Redraw the desktop and inbox with the new emails
+
+# Function to get the process-wide analytics connection (schema created once) and its lock
+@st.cache_resource
+def get_analytics_db():
+    return etl.connect(config.ANALYTICS_DB_PATH, check_same_thread=False), threading.Lock()
 
-# Function to handle messages from the virtual desktop
+# Function to fold this session's newly recorded turns into the dashboard aggregates
+def update_analytics():
+    if not config.RECORD_DIR:
+        return
+    path = os.path.join(config.RECORD_DIR, f"{st.session_state.session_id}.jsonl")
+    if not os.path.exists(path):
+        return
+    connection, lock = get_analytics_db()
+    with lock:
+        try:
+            # Watermarks are shared with the nightly ETL, so no turn is counted twice
+            etl.load_file(connection, path, on_batch=aggregates.apply_batch, on_retract=aggregates.retract_batch)
+        except Exception:
+            connection.rollback()  # The connection outlives this call; don't leave half a reload pending
+            raise
+
+# Widget callbacks. They run before the script, so every user action below
+# costs exactly one script run and nothing needs to call st.rerun().
+
+# Function to note the start of a new user action for the rerun counter
+def begin_action():
+    if st.session_state.get("runs_since_action"):
+        metrics.observe("app.runs_per_action", st.session_state.runs_since_action)
+    st.session_state.runs_since_action = 0
+
+# Function to save the API key submitted in the key form
+def save_api_key():
+    begin_action()
+    if st.session_state.api_key_input:
+        st.session_state.api_key = st.session_state.api_key_input
+        st.session_state.pop("backend", None)
+        st.session_state.api_key_entered = True
+    else:
+        st.session_state.api_key_error = True
+
+# Function to start a simulation for the chosen role
+def start_role(role):
+    begin_action()
+    leave_queue()
+    st.session_state.selected_role = role
+    get_scheduler().cancel_session(st.session_state.session_id)
+    conversation = current_conversation()
+    conversation.threads = {}
+    conversation.select_thread(None)
+
+# Function to start a shift: several tickets generated concurrently
+def start_shift(role):
+    begin_action()
+    leave_queue()
+    st.session_state.selected_role = role
+    st.session_state.pop("shift", None)
+    get_scheduler().cancel_session(st.session_state.session_id)
+    conversation = current_conversation()
+    conversation.threads = shift.new_threads(config.SHIFT_TICKETS)
+    conversation.select_thread(next(iter(conversation.threads)))
+    for thread_id in conversation.threads:
+        submit_shift_call(thread_id, "start", get_engine().generate_unique, role, "", [],
+                          get_session_backend(), conversation.scenario_index)
+    schedule_arrivals(role, get_session_backend(), conversation.scenario_index)
+
+# Function to switch to the ticket picked in the shift inbox
+def select_ticket():
+    begin_action()
+    conversation = current_conversation()
+    conversation.select_thread(st.session_state.ticket_choice)
+    conversation.threads[conversation.active_thread]["unread"] = False
+
+# Function to rewind to just before the chosen reply, on a new branch
+def rewind_branch():
+    begin_action()
+    current_conversation().fork_branch(st.session_state.rewind_choice)
+    st.session_state.pop("branch_choice", None)
+
+# Function to switch to the branch picked in the branch list
+def select_branch():
+    begin_action()
+    current_conversation().select_branch(st.session_state.branch_choice)
+
+# Function to return to role selection
+def start_over():
+    begin_action()
+    leave_queue()
+    st.session_state.selected_role = None
+    st.session_state.pop("shift", None)
+    get_scheduler().cancel_session(st.session_state.session_id)
+    conversation = current_conversation()
+    conversation.threads = {}
+    conversation.select_thread(None)
+
+# Function to open or close the trainer dashboard
+def toggle_dashboard(show):
+    begin_action()
+    st.session_state.show_dashboard = show
+
+# Function to queue a message to be sent during this run
+def queue_message(message):
+    begin_action()
+    message = message.strip()
+    if message:
+        key = singleflight.idempotency_key(st.session_state.session_id, st.session_state.composer_nonce, message)
+        st.session_state.pending_send = (key, message)
+
+# Function to queue the text submitted from the composer form
+def queue_reply():
+    queue_message(st.session_state.composer_text)
 
 
 # Initialize session state
 if 'selected_role' not in st.session_state:
     st.session_state.selected_role = None
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
 if 'api_key_entered' not in st.session_state:
-    st.session_state.api_key_entered = False
+    # With a shared key pool learners can start without a key of their own
+    st.session_state.api_key = ""
+    st.session_state.api_key_entered = bool(config.GEMINI_API_KEYS)
 if 'learning_mode' not in st.session_state:
     st.session_state.learning_mode = True
-if 'email_counter' not in st.session_state:
-    st.session_state.email_counter = 1
 if 'email_response' not in st.session_state:
     st.session_state.email_response = None
 if 'component_value' not in st.session_state:
     st.session_state.component_value = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'composer_nonce' not in st.session_state:
+    st.session_state.composer_nonce = uuid.uuid4().hex  # Rotated after every completed send
+if 'send_lock' not in st.session_state:
+    st.session_state.send_lock = threading.Lock()
+if 'script_runs' not in st.session_state:
+    st.session_state.script_runs = 0
+    st.session_state.runs_since_action = 0
+
+# Count script runs so we can check that each user action costs exactly one
+st.session_state.script_runs += 1
+st.session_state.runs_since_action += 1
+metrics.increment("app.script_runs")
+
+# Warm the process up in the background while the first pages are shown
+get_warm_up()
+
+# Heavy per-session state lives in the session manager so idle sessions can be spilled
+conversation = current_conversation()
 
 # Main app layout (minimalist with focus on the virtual desktop)
 st.markdown("""
@@ -833,148 +520,197 @@ if not st.session_state.api_key_entered:
     st.write("### Enter your Google Gemini API Key")
     st.write("You can get a key from [Google AI Studio](https://makersuite.google.com/app/apikey)")
     
-    api_key = st.text_input("API Key", type="password")
-    if st.button("Save API Key"):
-        if api_key:
-            st.session_state.api_key = api_key
-            st.session_state.api_key_entered = True
-            st.rerun()
-        else:
-            st.error("Please enter a valid API key")
+    with st.form("api_key_form"):
+        st.text_input("API Key", type="password", key="api_key_input")
+        st.form_submit_button("Save API Key", on_click=save_api_key)
+    if st.session_state.pop("api_key_error", False):
+        st.error("Please enter a valid API key")
     
     st.stop()
 
+# Trainer dashboard (reads only the pre-aggregated rows, never the transcripts)
+elif st.session_state.get("show_dashboard"):
+    st.title("Learner Progress Dashboard")
+    st.button("⬅ Back to roles", on_click=toggle_dashboard, args=(False,))
+    dashboard_role = st.selectbox("Role", list(roles))
+    
+    connection, lock = get_analytics_db()
+    with lock:
+        summary = aggregates.role_summary(connection, dashboard_role)
+        learners = aggregates.learner_summaries(connection, dashboard_role)
+    
+    if summary is None:
+        st.info("No recorded simulations for this role yet.")
+    else:
+        cols = st.columns(4)
+        cols[0].metric("Tickets", summary["sessions"])
+        cols[1].metric("Turns per ticket", f"{summary['turns_per_ticket']:.1f}" if summary["turns_per_ticket"] else "-")
+        cols[2].metric("Priority accuracy", f"{summary['priority_accuracy']:.0%}" if summary["priority_accuracy"] is not None else "-")
+        cols[3].metric("Median time to respond", f"{summary['p50_time_to_respond_s']:.0f}s" if summary["p50_time_to_respond_s"] is not None else "-")
+        cols = st.columns(4)
+        cols[0].metric("Hints", summary["hints"])
+        cols[1].metric("Newcomer help", summary["newcomer_help"])
+        cols[2].metric("Best practices", summary["best_practices"])
+        cols[3].metric("p95 model latency", f"{summary['p95_latency_ms'] / 1000:.1f}s" if summary["p95_latency_ms"] is not None else "-")
+        st.write("### Learners")
+        st.dataframe(learners, width="stretch")
+
 # Role selection page
 elif st.session_state.selected_role is None:
     st.title("Career Simulator")
+    st.button("📊 Trainer Dashboard", on_click=toggle_dashboard, args=(True,))
     st.subheader("Select a role to begin simulation:")
     
+    # Simulations start once the process has warmed up (pregenerated scenarios ready, indexes loaded)
+    warming_up = not get_warm_up().ready.is_set()
+    if warming_up:
+        st.info("The simulator is warming up, roles can be started in a moment...")
+        wait_for_warm_up()
+    
     # Display role options in columns
     cols = st.columns(2)
     for i, (role, description) in enumerate(roles.items()):
         with cols[i % 2]:
             st.write(f"### {role}")
             st.write(description)
-            if st.button(f"Start {role} Simulation", key=f"btn_{role}"):
-                st.session_state.selected_role = role
-                st.session_state.chat_history = []
-                st.rerun()
+            st.button(f"Start {role} Simulation", key=f"btn_{role}", on_click=start_role, args=(role,), disabled=warming_up)
+            st.button(f"Start {role} Shift ({config.SHIFT_TICKETS} tickets)", key=f"shift_{role}", on_click=start_shift, args=(role,),
+                      disabled=warming_up)
 
 # Simulation page
 else:
     # Minimal top interface - just a small header
     st.write(f"## {st.session_state.selected_role} Virtual Workspace")
     
-    # Create current email content from latest simulation response
-    current_email = None
-    if st.session_state.chat_history:
-        latest_response = st.session_state.chat_history[-1]["content"] if st.session_state.chat_history[-1]["role"] == "assistant" else None
-        if latest_response:
-            current_email = f"""
-            <div class="email-header">
-                <div class="email-subject">Support Ticket #{st.session_state.email_counter}</div>
-                <div class="email-meta">
-                    <div>From: Support System &lt;support@company.com&gt;</div>
-                    <div>Just now</div>
-                </div>
-                <div class="email-meta">
-                    <div>To: You &lt;you@company.com&gt;</div>
-                </div>
-            </div>
-            <div class="email-body">
-                {latest_response.replace('\n', '<br>')}
-            </div>
-            """
+    # Initialize simulation if chat history is empty (shift tickets are generated in the background)
+    # Model calls wait for a slot from admission control; until then the desktop shows the queue
+    if len(conversation.chat_history) == 0 and not conversation.threads:
+        ticket = admit("start")
+        if ticket is not None:
+            try:
+                with st.spinner("Setting up your workspace..."):
+                    initial_response = get_engine().generate_unique(st.session_state.selected_role, "", [], get_session_backend(), conversation.scenario_index)
+                    conversation.chat_history.append({"role": "assistant", "content": initial_response})
+            finally:
+                get_admission().release(ticket)
     
-    # Render virtual desktop (now much larger)
-    desktop_html = create_virtual_desktop(
-        st.session_state.selected_role, 
-        current_email=current_email,
-        unread_count=st.session_state.email_counter
+    # Send anything queued by the composer or learning aids before drawing the
+    # desktop, so the reply shows up in this same run
+    pending_send = st.session_state.pop("pending_send", None)
+    if conversation.threads:
+        collect_shift_results()
+        if pending_send:
+            send_shift_reply(*pending_send)
+    elif pending_send:
+        ticket = admit("reply")
+        if ticket is None:
+            st.session_state.pending_send = pending_send  # Sent once a slot is free
+        else:
+            try:
+                send_reply(*pending_send)
+            finally:
+                get_admission().release(ticket)
+    
+    # Shift inbox: one entry per ticket thread. The radio labels stay fixed (a changing label
+    # loses the selection); status and SLA countdown are shown in a line below them.
+    if conversation.threads:
+        def ticket_status(thread_id):
+            thread = conversation.threads[thread_id]
+            if get_shift().busy(thread_id):
+                status = "⏳"
+            elif thread.get("unread"):
+                status = "🆕"
+            else:
+                status = "📨"
+            label = f"{status} {thread['title']}"
+            if thread.get("sla_breached"):
+                label += f" · {thread['priority']} SLA breached"
+            elif thread.get("sla_deadline"):
+                minutes_left = max(0, int((thread["sla_deadline"] - time.time()) // 60))
+                label += f" · {thread['priority']} {minutes_left}m left"
+            return label
+        
+        thread_ids = list(conversation.threads)
+        st.radio("Inbox", thread_ids, index=thread_ids.index(conversation.active_thread),
+                 format_func=lambda thread_id: conversation.threads[thread_id]["title"],
+                 key="ticket_choice", on_change=select_ticket, horizontal=True)
+        st.caption("  |  ".join(ticket_status(thread_id) for thread_id in thread_ids))
+        poll_shift()
+    
+    # Render virtual desktop; after the first load only the current email is sent
+    desktop.virtual_desktop(
+        st.session_state.selected_role,
+        email=desktop.email_args(conversation.chat_history, conversation.email_counter),
+        unread_count=conversation.email_counter,
+        queue=st.session_state.get("queue_status")
     )
-    component_value = components.html(desktop_html, height=700, key="virtual_desktop")
-
-# Handle messages from the virtual desktop
-if component_value:
-    st.session_state.component_value = component_value
-    handle_virtual_desktop_message()  # Increased height for better visibility
+    if "queue_status" in st.session_state:
+        poll_admission()
     
     # Response area (appears below the virtual desktop)
     st.write("### Your Response")
     
-    # Initialize simulation if chat history is empty
-    if len(st.session_state.chat_history) == 0:
-        initial_response = generate_simulation(st.session_state.selected_role, "", [], st.session_state.api_key)
-        st.session_state.chat_history.append({"role": "assistant", "content": initial_response})
-        st.rerun()
-    
-    # User input
-    if 'help_clicked' in st.session_state:
-        user_input = st.session_state.help_clicked
-        del st.session_state.help_clicked
-    else:
-        user_input = st.text_area("Compose your reply:", height=150)
-        
-    col1, col2, col3 = st.columns([1, 1, 4])
-    with col1:
-        send_button = st.button("Send Email", type="primary")
-    with col2:
-        help_button = st.button("Need Help?")
+    # Composer is a form, so typing doesn't rerun the script; only sending does
+    with st.form("composer", clear_on_submit=True):
+        st.text_area("Compose your reply:", height=150, key="composer_text")
+        st.form_submit_button("Send Email", type="primary", on_click=queue_reply)
     
     # Help options
-    if help_button:
-        with st.expander("Learning Aids", expanded=True):
-            st.write("Select an option below:")
-            help_cols = st.columns(3)
-            with help_cols[0]:
-                if st.button("💡 Get a Metaphorical Hint"):
-                    st.session_state.help_clicked = "[HINT] I need a metaphorical explanation for this problem"
-                    st.rerun()
-            with help_cols[1]:
-                if st.button("🆘 I don't know what to do"):
-                    help_response = "I'm not sure how to handle this situation as I'm new to this role. Can you guide me through what an experienced support engineer would do here?"
-                    st.session_state.help_clicked = help_response
-                    st.rerun()
-            with help_cols[2]:
-                if st.button("📚 Show me best practices"):
-                    best_practices = "Can you explain the best practices for handling this type of issue?"
-                    st.session_state.help_clicked = best_practices
-                    st.rerun()
-            
-            if st.button("🔄 Start Over"):
-                st.session_state.selected_role = None
-                st.session_state.chat_history = []
-                st.rerun()
+    with st.expander("Need Help? Learning Aids", expanded=False):
+        st.write("Select an option below:")
+        help_cols = st.columns(3)
+        with help_cols[0]:
+            st.button("💡 Get a Metaphorical Hint", on_click=queue_message, args=(engine.HELP_MESSAGES["hint"],))
+        with help_cols[1]:
+            st.button("🆘 I don't know what to do", on_click=queue_message, args=(engine.HELP_MESSAGES["newcomer"],))
+        with help_cols[2]:
+            st.button("📚 Show me best practices", on_click=queue_message, args=(engine.HELP_MESSAGES["best_practices"],))
+        
+        st.button("🔄 Start Over", on_click=start_over)
     
-    # Process user input when send button is clicked
-    if send_button and user_input:
-        # Add user message to chat history
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
-        
-        # Show a spinner while generating response
-        with st.spinner("Sending email and waiting for response..."):
-            # Generate response
-            ai_response = generate_simulation(
-                st.session_state.selected_role,
-                user_input,
-                st.session_state.chat_history[:-1],  # Exclude the just-added user message
-                st.session_state.api_key
-            )
-            
-            # Add AI response to chat history
-            st.session_state.chat_history.append({"role": "assistant", "content": ai_response})
-            st.session_state.email_counter += 1
-            time.sleep(1)  # Brief pause for effect
-            
-        st.rerun()
+    # Rewind to an earlier reply on a new branch, switch branches and compare their outcomes
+    if not conversation.threads and (len(conversation.chat_history) > 2 or len(conversation.branches) > 1):
+        with st.expander("Rewind & Compare", expanded=False):
+            branch_names = list(conversation.branches)
+            if len(branch_names) > 1:
+                st.radio("Branch", branch_names, index=branch_names.index(conversation.active_branch),
+                         key="branch_choice", on_change=select_branch, horizontal=True)
+            messages = list(conversation.chat_history)
+            replies = [i for i, message in enumerate(messages) if message["role"] == "user"]
+            if replies:
+                st.selectbox("Try a different answer instead of", replies, key="rewind_choice",
+                             format_func=lambda i: f"Reply {replies.index(i) + 1}: {messages[i]['content'][:60]}")
+                st.button("⏪ Rewind here", on_click=rewind_branch)
+            if len(branch_names) > 1:
+                other = st.selectbox("Compare with", [name for name in branch_names if name != conversation.active_branch], key="compare_choice")
+                shared, mine, theirs = conversation.compare_branches(conversation.active_branch, other)
+                st.caption(f"Both branches share the first {shared} message{'s' if shared != 1 else ''}; here is what happened after that.")
+                for column, name, branch_messages in zip(st.columns(2), (conversation.active_branch, other), (mine, theirs)):
+                    with column:
+                        st.markdown(f"**{name}**")
+                        for message in branch_messages:
+                            st.markdown(f"{'📤' if message['role'] == 'user' else '📥'} {message['content']}")
     
     # Collapsible history section at the bottom
-    if len(st.session_state.chat_history) > 2:
+    if len(conversation.chat_history) > 2:
         with st.expander("Previous Email Thread", expanded=False):
-            for i in range(len(st.session_state.chat_history)-2):
-                message = st.session_state.chat_history[i]
+            # One pass over the transcript; indexing it message by message walks the tree each time
+            for message in conversation.chat_history[:-2]:
                 if message["role"] == "assistant":
                     st.markdown(f"📥 **From: Support System**\n\n{message['content']}")
                     st.write("---")
                 else:
-                    st.markdown(f"📤 **Your Reply**\n\n{message['content']}")
\ No newline at end of file
+                    st.markdown(f"📤 **Your Reply**\n\n{message['content']}")
+
+if st.session_state.selected_role is not None and 'backend' in st.session_state:
+    ledger, _ = get_cost_tracking()
+    st.caption(f"Session cost so far: ${ledger.spent('session', st.session_state.session_id):.4f}")
+
+if st.session_state.get("profiling"):
+    with st.sidebar.expander("Profiler", expanded=True):
+        st.caption(f"Profiles are written to {os.path.join(config.PROFILE_DIR, st.session_state.session_id)}")
+        for summary in reversed(get_profile_summaries().get(st.session_state.session_id, ())):
+            st.code(summary, language=None)
+
+if config.SHOW_RERUN_COUNTER:
+    st.caption(f"Script runs: {st.session_state.script_runs} (for the last action: {st.session_state.runs_since_action})")
@@ -0,0 +1,158 @@
+import json
+import os
+
+# Central place for tunable settings. Every value can be overridden with an
+# environment variable of the same name so deployments don't need code edits.
+
+# Near-duplicate detection for generated scenarios
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", "0.6"))  # estimated Jaccard similarity
+MAX_REGENERATIONS = int(os.environ.get("MAX_REGENERATIONS", "2"))  # extra attempts before accepting a duplicate
+SCENARIO_CORPUS_PATH = os.environ.get("SCENARIO_CORPUS_PATH", "scenario_corpus.jsonl")
+
+# Local priority classifier for instant triage feedback
+PRIORITY_MODEL_PATH = os.environ.get("PRIORITY_MODEL_PATH", "priority_model.json")
+PRIORITY_LOG_PATH = os.environ.get("PRIORITY_LOG_PATH", "priority_log.jsonl")
+
+# Model routing: each request type gets its own model and generation config.
+# Override the whole table with MODEL_ROUTES='{"hint": {"model": "...", ...}, ...}'.
+MODEL_ROUTES = {
+    "scenario_start": {"model": "gemini-1.5-pro", "max_output_tokens": 1200, "temperature": 0.7},
+    "follow_up": {"model": "gemini-1.5-pro", "max_output_tokens": 1200, "temperature": 0.7},
+    "hint": {"model": "gemini-1.5-flash", "max_output_tokens": 400, "temperature": 0.8},
+    "best_practices": {"model": "gemini-1.5-flash", "max_output_tokens": 600, "temperature": 0.5},
+    "newcomer": {"model": "gemini-1.5-flash", "max_output_tokens": 800, "temperature": 0.5},
+}
+if os.environ.get("MODEL_ROUTES"):
+    MODEL_ROUTES = {**MODEL_ROUTES, **json.loads(os.environ["MODEL_ROUTES"])}
+
+# Show the script rerun counter at the bottom of the page (developer aid)
+SHOW_RERUN_COUNTER = os.environ.get("SHOW_RERUN_COUNTER", "0") == "1"
+
+# Session memory control: idle sessions are compressed and spilled to disk
+SESSION_SPILL_DIR = os.environ.get("SESSION_SPILL_DIR", ".sessions")
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", "900"))  # seconds
+SESSION_MAX_RESIDENT_MB = float(os.environ.get("SESSION_MAX_RESIDENT_MB", "256"))
+SESSION_SPILL_TTL = float(os.environ.get("SESSION_SPILL_TTL", str(7 * 24 * 3600)))  # seconds
+
+# Model backend: "gemini" for the hosted API, "replay" to play back a recorded session,
+# "stub" for canned offline responses (load tests)
+BACKEND = os.environ.get("BACKEND", "gemini")
+STUB_LATENCY = float(os.environ.get("STUB_LATENCY", "0"))  # seconds per stub call
+STUB_SLOW_RATE = float(os.environ.get("STUB_SLOW_RATE", "0"))  # share of stub calls that are slow
+STUB_SLOW_SECONDS = float(os.environ.get("STUB_SLOW_SECONDS", "0"))
+REPLAY_PATH = os.environ.get("REPLAY_PATH", "")
+REPLAY_SPEED = float(os.environ.get("REPLAY_SPEED", "1.0"))  # multiplier on recorded latencies, 0 = no delay
+RECORD_DIR = os.environ.get("RECORD_DIR", "")  # when set, every session is recorded to <dir>/<session_id>.jsonl
+
+# Transcript analytics
+ANALYTICS_DB_PATH = os.environ.get("ANALYTICS_DB_PATH", "analytics.db")
+ETL_BATCH_SIZE = int(os.environ.get("ETL_BATCH_SIZE", "500"))
+
+# Shift mode: several ticket threads per session, generated concurrently
+SHIFT_TICKETS = int(os.environ.get("SHIFT_TICKETS", "3"))
+SHIFT_MAX_CONCURRENCY = int(os.environ.get("SHIFT_MAX_CONCURRENCY", "3"))  # per session
+SHIFT_WORKERS = int(os.environ.get("SHIFT_WORKERS", "32"))  # shared pool for all sessions
+SHIFT_POLL_SECONDS = float(os.environ.get("SHIFT_POLL_SECONDS", "2"))
+
+# Timed ticket arrivals and SLA clocks during a shift
+SHIFT_SCHEDULED_TICKETS = int(os.environ.get("SHIFT_SCHEDULED_TICKETS", "3"))  # extra tickets that arrive during the shift
+ARRIVAL_INTERVAL_SECONDS = (float(os.environ.get("ARRIVAL_MIN_SECONDS", "120")), float(os.environ.get("ARRIVAL_MAX_SECONDS", "300")))
+PREGENERATE_LEAD_SECONDS = float(os.environ.get("PREGENERATE_LEAD_SECONDS", "60"))
+SLA_SECONDS = {"P1": 180, "P2": 420, "P3": 900, "P4": 1800}  # time to first reply before an escalation email
+if os.environ.get("SLA_SECONDS"):
+    SLA_SECONDS = {**SLA_SECONDS, **json.loads(os.environ["SLA_SECONDS"])}
+
+# Cost accounting: USD per 1M (input, output) tokens, and (soft, hard) USD quotas per scope.
+# Over the soft quota requests fall back to QUOTA_FALLBACK_MODEL or cached scenarios.
+MODEL_PRICES = {
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+COST_QUOTAS = {
+    "session": (0.50, 1.00),
+    "user": (2.00, 5.00),
+}
+if os.environ.get("COST_QUOTAS"):
+    COST_QUOTAS = {**COST_QUOTAS, **{scope: tuple(limits) for scope, limits in json.loads(os.environ["COST_QUOTAS"]).items()}}
+QUOTA_FALLBACK_MODEL = os.environ.get("QUOTA_FALLBACK_MODEL", "gemini-1.5-flash")
+QUOTA_FALLBACK_MAX_TOKENS = int(os.environ.get("QUOTA_FALLBACK_MAX_TOKENS", "600"))
+COST_LEDGER_PATH = os.environ.get("COST_LEDGER_PATH", "cost_ledger.json")
+
+# HTTP/WebSocket API service (api.py)
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", "8080"))
+API_WORKERS = int(os.environ.get("API_WORKERS", "64"))  # threads for blocking model calls, shared by all sessions
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "")  # service key; clients may also pass their own
+STREAM_CHUNK_CHARS = int(os.environ.get("STREAM_CHUNK_CHARS", "80"))
+
+# Batch runs (batch.py): requests per minute allowed per model, shared by all conversations
+RATE_LIMITS = {
+    "gemini-1.5-pro": 360,
+    "gemini-1.5-flash": 1000,
+}
+if os.environ.get("RATE_LIMITS"):
+    RATE_LIMITS = {**RATE_LIMITS, **json.loads(os.environ["RATE_LIMITS"])}
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "8"))
+
+# Evaluation harness (evaluate.py): optional LLM judge and its result cache
+JUDGE_MODEL = os.environ.get("JUDGE_MODEL", "gemini-1.5-pro")
+JUDGE_CACHE_PATH = os.environ.get("JUDGE_CACHE_PATH", "judge_cache.jsonl")
+
+# Where the virtual desktop's content-hashed static assets are built, and the URL prefix they are
+# loaded from (empty: Streamlit's component server; e.g. "http://localhost:8080/assets/desktop/" for
+# api.py, which sends them with a one-year immutable Cache-Control header)
+DESKTOP_BUILD_DIR = os.environ.get("DESKTOP_BUILD_DIR", ".desktop_build")
+DESKTOP_ASSET_BASE_URL = os.environ.get("DESKTOP_ASSET_BASE_URL", "")
+
+# Warm-up at server start: opening scenarios pregenerated per role (needs GEMINI_API_KEY
+# with the gemini backend; 0 disables)
+WARMUP_PREGENERATE = int(os.environ.get("WARMUP_PREGENERATE", "0"))
+
+# Admission control: model calls running at once per process, and a bounded waiting room.
+# Each priority level (lower first) is worth ADMISSION_PRIORITY_STEP seconds of head start,
+# so learners mid-conversation go ahead of new starts without starving them. Shift tickets
+# scheduled to arrive later are generated ahead of time, so they can wait the longest.
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", "16"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "500"))
+ADMISSION_TICKET_TTL = float(os.environ.get("ADMISSION_TICKET_TTL", "30"))  # seconds without a poll before a place is dropped
+ADMISSION_POLL_SECONDS = float(os.environ.get("ADMISSION_POLL_SECONDS", "1"))
+ADMISSION_PRIORITY_STEP = float(os.environ.get("ADMISSION_PRIORITY_STEP", "10"))  # seconds
+ADMISSION_PRIORITIES = {
+    "reply": 0,
+    "start": 1,
+    "arrival": 2,
+}
+if os.environ.get("ADMISSION_PRIORITIES"):
+    ADMISSION_PRIORITIES = {**ADMISSION_PRIORITIES, **json.loads(os.environ["ADMISSION_PRIORITIES"])}
+
+# Hedged model calls (off unless configured), per request type: (hedge after, hard deadline)
+# in seconds. A call still running at "hedge after" (set it near the type's p95, see
+# evaluate.py) is duplicated on HEDGE_API_KEY (or the same key) with HEDGE_ALTERNATE_MODELS,
+# and the first answer wins. Openings and hints that miss the hard deadline get pregenerated
+# content; null means no hard deadline. Every duplicate is paid for (and charged to the
+# learner's quota), so at p95 hedging adds about 5% to a type's spend, more with a pricier
+# alternate model. A duplicate is only sent when it can have a rate limit token and an
+# admission slot straight away. For example: HEDGE_DEADLINES='{"scenario_start": [10, 25], "hint": [5, 12]}'
+HEDGE_DEADLINES = {}
+if os.environ.get("HEDGE_DEADLINES") is not None:
+    HEDGE_DEADLINES = {request_type: tuple(deadlines) for request_type, deadlines in json.loads(os.environ["HEDGE_DEADLINES"]).items()}
+HEDGE_ALTERNATE_MODELS = json.loads(os.environ.get("HEDGE_ALTERNATE_MODELS", "{}"))  # model -> model for the duplicate
+HEDGE_API_KEY = os.environ.get("HEDGE_API_KEY", "")
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", "16"))  # threads shared by all hedged attempts, originals and duplicates
+
+# Shared key pool for deployments where learners don't bring their own key, as JSON:
+# GEMINI_API_KEYS='[{"name": "project-a", "key": "...", "rpm": 360}, ...]'. Calls that would
+# use the service key are spread over the pool by unused quota and recent errors; a key that
+# is rate limited is quarantined for KEY_QUARANTINE_SECONDS, doubling up to the maximum.
+GEMINI_API_KEYS = json.loads(os.environ.get("GEMINI_API_KEYS", "[]"))
+KEY_QUARANTINE_SECONDS = float(os.environ.get("KEY_QUARANTINE_SECONDS", "5"))
+KEY_MAX_QUARANTINE_SECONDS = float(os.environ.get("KEY_MAX_QUARANTINE_SECONDS", "300"))
+KEY_POOL_MAX_WAIT = float(os.environ.get("KEY_POOL_MAX_WAIT", "30"))  # seconds to wait for a usable key
+
+# Opt-in sampling profiler (profiler.py): opening the app with ?profile=<PROFILE_TOKEN> profiles
+# every script run and model call of that session until ?profile=off. An empty token disables it.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "15"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "5"))  # summaries shown in the profiler panel
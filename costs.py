@@ -0,0 +1,148 @@
+import atexit
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import metrics
+
+# Local token estimation, per-session and per-user cost accounting and quotas.
+# Tokens are estimated from text length with a chars-per-token ratio that is
+# calibrated from the usage metadata Gemini returns with each response, so no
+# extra API calls are needed. Over a soft quota requests degrade to a cheaper
+# model (or a cached opening scenario); over a hard quota they are refused.
+
+class QuotaExceeded(Exception):
+    pass
+
+class TokenEstimator:
+    def __init__(self, chars_per_token=4.0, smoothing=0.1):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+
+    # Function to estimate the number of tokens in a piece of text
+    def estimate(self, text):
+        return math.ceil(len(text or "") / self.chars_per_token) if text else 0
+
+    # Function to move the ratio towards an observed (characters, tokens) pair
+    def calibrate(self, chars, tokens):
+        if chars <= 0 or tokens <= 0:
+            return
+        with self._lock:
+            observed = chars / tokens
+            self.chars_per_token += self.smoothing * (observed - self.chars_per_token)
+
+class CostLedger:
+    def __init__(self, prices, quotas, path=None, save_interval=30):
+        self.prices = prices  # model -> (USD per 1M input tokens, USD per 1M output tokens)
+        self.quotas = quotas  # scope -> (soft USD, hard USD); scopes: session, user
+        self.path = path
+        self.save_interval = save_interval
+        self._spent = {}  # "scope:id" -> USD
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._spent = json.load(f)
+        if path:
+            atexit.register(self.save)  # Charges since the last periodic save aren't lost on shutdown
+
+    # Function to price a call
+    def cost(self, model_name, input_tokens, output_tokens):
+        input_price, output_price = self.prices.get(model_name, max(self.prices.values()))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    # Function to read cumulative spend for a scope id
+    def spent(self, scope, scope_id):
+        with self._lock:
+            return self._spent.get(f"{scope}:{scope_id}", 0.0)
+
+    # Function to work out the quota state for a set of scopes: "ok", "soft" or "hard"
+    def status(self, scopes):
+        state = "ok"
+        for scope, scope_id in scopes.items():
+            soft, hard = self.quotas.get(scope, (None, None))
+            spent = self.spent(scope, scope_id)
+            if hard is not None and spent >= hard:
+                return "hard"
+            if soft is not None and spent >= soft:
+                state = "soft"
+        return state
+
+    # Function to add a call's cost to every scope it belongs to
+    def charge(self, scopes, amount):
+        with self._lock:
+            for scope, scope_id in scopes.items():
+                key = f"{scope}:{scope_id}"
+                self._spent[key] = self._spent.get(key, 0.0) + amount
+            self._dirty = True
+            due = self.path and time.time() - self._last_save >= self.save_interval
+        metrics.increment("cost.usd_total", amount)
+        if due:
+            self.save()
+
+    # Function to persist the ledger so quotas survive restarts
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._spent)
+            self._dirty = False
+            self._last_save = time.time()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+class MeteredBackend:
+    def __init__(self, inner, ledger, estimator, scopes, fallback_model=None, fallback_max_tokens=None, cached_scenarios=None):
+        self.inner = inner
+        self.ledger = ledger
+        self.estimator = estimator
+        self.scopes = scopes
+        self.fallback_model = fallback_model
+        self.fallback_max_tokens = fallback_max_tokens
+        self.cached_scenarios = cached_scenarios or {}
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        state = self.ledger.status(self.scopes)
+        if state == "hard":
+            metrics.increment("cost.refused")
+            raise QuotaExceeded("You have reached your usage limit for the simulator. Please contact your trainer to continue.")
+        if state == "soft":
+            # Degrade: serve a cached opening scenario, or use the cheaper model with a smaller cap
+            cached = self.cached_scenarios.get(metadata.get("role"))
+            if metadata.get("request_type") == "scenario_start" and cached:
+                metrics.increment("cost.degraded.cached")
+                return random.choice(cached)
+            metrics.increment("cost.degraded.model")
+            model_name = self.fallback_model or model_name
+            if self.fallback_max_tokens:
+                generation_config = {**generation_config, "max_output_tokens": min(
+                    generation_config.get("max_output_tokens", self.fallback_max_tokens), self.fallback_max_tokens)}
+        
+        prompt_chars = len(message) + sum(len(part) for turn in history for part in turn["parts"])
+        usage = {}
+        # A hedged call also charges its duplicate attempts, including ones that finish later
+        charge_extra = lambda model, extra_output, extra_usage: self._charge(model, prompt_chars, extra_output, extra_usage)
+        output = self.inner.send(model_name, generation_config, history, message, usage=usage, charge_extra=charge_extra, **metadata)
+        # A hedged call may have been answered by its alternate model
+        self._charge(usage.get("model", model_name), prompt_chars, output, usage)
+        return output
+
+    # Function to charge one model response, preferring the token counts the API reported
+    # (which also calibrate the estimator)
+    def _charge(self, model_name, prompt_chars, output, usage):
+        if usage.get("prompt_tokens"):
+            self.estimator.calibrate(prompt_chars, usage["prompt_tokens"])
+            input_tokens = usage["prompt_tokens"]
+        else:
+            input_tokens = math.ceil(prompt_chars / self.estimator.chars_per_token)
+        output_tokens = usage.get("output_tokens") or self.estimator.estimate(output)
+        self.ledger.charge(self.scopes, self.ledger.cost(model_name, input_tokens, output_tokens))
+        metrics.increment("tokens.input", input_tokens)
+        metrics.increment("tokens.output", output_tokens)
@@ -0,0 +1,30 @@
+import streamlit.components.v1 as components
+
+from desktop_assets import build_assets
+
+# The virtual desktop is a custom component built from assets/desktop/ (see
+# desktop_assets.py). After the first load the browser keeps the ~20 KB of
+# CSS/JS and each script run sends just the current email as component args.
+# Streamlit serves component files with "Cache-Control: public" and no
+# max-age, so browsers may still revalidate them. With DESKTOP_ASSET_BASE_URL
+# pointing at the API service's /assets/desktop/ (or any server sending a
+# long max-age) the hashed files are cached for a year instead.
+
+_component = components.declare_component("virtual_desktop", path=build_assets())
+
+# Function to describe the latest simulation email for the desktop
+def email_args(chat_history, email_counter):
+    if not chat_history or chat_history[-1]["role"] != "assistant":
+        return None
+    return {
+        "subject": f"Support Ticket #{email_counter}",
+        "sender": "Support System <support@company.com>",
+        "body": chat_history[-1]["content"],
+    }
+
+# Function to render the virtual desktop (without an email it shows the welcome message).
+# queue is an admission.Status while the session waits for a model slot.
+def virtual_desktop(role, email=None, unread_count=1, queue=None, key="virtual_desktop"):
+    if queue is not None:
+        queue = {"position": queue.position, "eta_seconds": queue.eta_seconds}
+    return _component(role=role, email=email, unread_count=unread_count, queue=queue, key=key, default=None)
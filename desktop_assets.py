@@ -0,0 +1,42 @@
+import hashlib
+import os
+import re
+
+import config
+
+# Build step for the virtual desktop's static files, shared by the Streamlit
+# component (desktop.py) and the API service, which can serve the hashed
+# files with a long-lived cache header. The page, stylesheet and script live
+# in assets/desktop/ and are copied into a build directory with
+# content-hashed names (desktop.<hash>.css / .js), so a changed file always
+# gets a new URL and the old one can be cached for good.
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "desktop")
+HASHED_ASSETS = ("desktop.css", "desktop.js")
+HASHED_NAME = re.compile(r"^desktop\.[0-9a-f]{12}\.(css|js)$")
+
+# Function to write a file atomically so a concurrent build never serves half of it
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Function to copy the desktop assets into build_dir under content-hashed names. index.html
+# loads them from base_url when one is given (e.g. the API's /assets/desktop/), else alongside it.
+def build_assets(build_dir=None, base_url=None):
+    build_dir = build_dir or config.DESKTOP_BUILD_DIR
+    base_url = base_url if base_url is not None else config.DESKTOP_ASSET_BASE_URL
+    os.makedirs(build_dir, exist_ok=True)
+    with open(os.path.join(ASSET_DIR, "index.html"), "rb") as f:
+        index = f.read()
+    for name in HASHED_ASSETS:
+        with open(os.path.join(ASSET_DIR, name), "rb") as f:
+            data = f.read()
+        base, ext = os.path.splitext(name)
+        hashed_name = f"{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+        if not os.path.exists(os.path.join(build_dir, hashed_name)):
+            _write(os.path.join(build_dir, hashed_name), data)
+        index = index.replace(f'"{name}"'.encode(), f'"{base_url}{hashed_name}"'.encode())
+    _write(os.path.join(build_dir, "index.html"), index)
+    return build_dir
@@ -0,0 +1,282 @@
+import random
+import threading
+import uuid
+from collections import defaultdict, deque
+
+import config
+import dedup
+import metrics
+import priority_classifier
+from backends import DeadlineExceeded
+from prompts import fallback_hints, roles, role_prompts
+from session_store import Conversation
+
+# Headless simulation engine: role registry, prompt building, model routing,
+# duplicate-free scenario generation and help commands, with no Streamlit
+# dependency. check.py is a thin UI on top of it; batch runs, services and
+# benchmarks use it directly with any backend from backends.py.
+
+# Messages sent by the "Need Help?" learning aids
+HELP_MESSAGES = {
+    "hint": "[HINT] I need a metaphorical explanation for this problem",
+    "newcomer": "I'm not sure how to handle this situation as I'm new to this role. Can you guide me through what an experienced support engineer would do here?",
+    "best_practices": "Can you explain the best practices for handling this type of issue?",
+}
+
+ERROR_PREFIX = "Error generating response:"
+
+# Function to work out which kind of request a user message is
+def classify_request(user_input, chat_history):
+    if not chat_history:
+        return "scenario_start"
+    if user_input.startswith("[HINT]"):
+        return "hint"
+    if "I don't know how to respond" in user_input or "I'm new" in user_input or "I'm a fresher" in user_input:
+        return "newcomer"
+    if "best practices" in user_input.lower():
+        return "best_practices"
+    return "follow_up"
+
+# Function to convert chat history into the Gemini history format
+def to_gemini_history(chat_history):
+    return [
+        {"role": "user" if message["role"] == "user" else "model", "parts": [message["content"]]}
+        for message in chat_history
+    ]
+
+class SimulationEngine:
+    def __init__(self, role_descriptions=None, prompts=None, model_routes=None, corpus_path=None,
+                 duplicate_threshold=None, max_regenerations=None, classifier_path=None):
+        self.roles = dict(role_descriptions if role_descriptions is not None else roles)
+        self.role_prompts = dict(prompts if prompts is not None else role_prompts)
+        self.model_routes = model_routes if model_routes is not None else config.MODEL_ROUTES
+        self.corpus_path = corpus_path if corpus_path is not None else config.SCENARIO_CORPUS_PATH
+        self.duplicate_threshold = duplicate_threshold if duplicate_threshold is not None else config.DUPLICATE_THRESHOLD
+        self.max_regenerations = max_regenerations if max_regenerations is not None else config.MAX_REGENERATIONS
+        self.classifier_path = classifier_path if classifier_path is not None else config.PRIORITY_MODEL_PATH
+        self._corpus_index = None
+        self._classifier = None
+        self._lock = threading.Lock()
+        self._pregenerated = defaultdict(deque)  # role -> opening scenarios ready to hand out
+
+    # Function to add or replace a role
+    def register_role(self, name, description, prompt):
+        self.roles[name] = description
+        self.role_prompts[name] = prompt
+
+    # Function to create a fresh conversation for a headless session
+    def new_conversation(self, session_id=None):
+        return Conversation(session_id or uuid.uuid4().hex, threshold=self.duplicate_threshold)
+
+    # The scenario corpus index and priority classifier are loaded on first use
+    @property
+    def corpus_index(self):
+        with self._lock:
+            if self._corpus_index is None:
+                self._corpus_index = dedup.load_corpus_index(self.corpus_path, self.duplicate_threshold)
+            return self._corpus_index
+
+    @property
+    def classifier(self):
+        with self._lock:
+            if self._classifier is None:
+                self._classifier = priority_classifier.load_classifier(self.classifier_path)
+            return self._classifier
+
+    # Function to pick the model and generation config for a request type
+    def route(self, request_type):
+        route = self.model_routes.get(request_type, self.model_routes["follow_up"])
+        generation_config = {key: value for key, value in route.items() if key != "model"}
+        return route["model"], generation_config
+
+    # Function to build the message sent to the model for a request
+    def build_prompt(self, role, request_type, user_input, chat_history):
+        # For the first message, include the system prompt
+        if request_type == "scenario_start":
+            return f"{self.role_prompts[role]}\n\nStart the simulation now. Format your response as an email that has just landed in the user's inbox."
+        if request_type == "hint":
+            # Extract the current scenario from the last assistant message
+            last_message = chat_history[-1]["content"] if chat_history else ""
+            return f"""
+                The user has requested a hint. Based on the current scenario:
+
+                {last_message}
+
+                Please provide a metaphorical story or analogy that would help them understand how to approach this technical problem.
+                Make it relatable to everyday life. Start with "METAPHORICAL HINT:" and then tell a brief story that explains the core concepts needed.
+                Keep the metaphor simple and engaging, focusing on the problem-solving approach rather than technical details.
+                """
+        if request_type == "best_practices":
+            # Ground the advice in the ticket the learner is working on, not the latest feedback
+            ticket = next((message["content"] for message in chat_history if message["role"] == "assistant"), "")
+            return f"""
+                The user has asked for the best practices for handling this type of issue. The ticket they are working on:
+
+                {ticket}
+
+                Explain the best practices an experienced support engineer follows for issues like this one, from triage and
+                priority through communication with the customer to escalation and follow-up. Start with "BEST PRACTICES:" and
+                use a short numbered list. Do not write it as an email and do not solve the ticket for them.
+                """
+        if request_type == "newcomer":
+            prompt = "The user is indicating they're new to this role and need guidance. Please provide detailed explanations and options for how to proceed."
+            return f"{prompt}\n\nUser message: {user_input}"
+        # Format responses as emails in an ongoing conversation
+        return f"""
+                Based on the user's response: "{user_input}"
+
+                Generate your next response as a follow-up email in the conversation. If this is from a customer, it should look like a reply email. If it's from a manager or colleague, it should look like a new email about the situation.
+
+                Include realistic email headers (From, To, Subject, Time) and format it like a genuine email, but focus on the educational aspects in the content.
+                """
+
+    # Function to generate one simulation response (errors come back as an error email,
+    # except a missed hard deadline when raise_deadline is set). thread_id names the shift
+    # ticket thread the call is for, and regenerate marks a retry of a duplicate response.
+    # Backends that can stream pass each piece of the reply to on_chunk as it arrives.
+    def generate(self, role, user_input, chat_history, backend, raise_deadline=False, regenerate=False, thread_id=None, on_chunk=None):
+        # Cheap requests (hints, guidance) go to a smaller, faster model
+        request_type = classify_request(user_input, chat_history)
+        model_name, generation_config = self.route(request_type)
+        metrics.increment(f"routing.{request_type}.{model_name}")
+        try:
+            message = self.build_prompt(role, request_type, user_input, chat_history)
+            return backend.send(model_name, generation_config, to_gemini_history(chat_history), message,
+                                role=role, request_type=request_type, user_input=user_input,
+                                thread_id=thread_id, regenerate=regenerate, on_chunk=on_chunk)
+        except Exception as e:
+            if raise_deadline and isinstance(e, DeadlineExceeded):
+                raise
+            return f"{ERROR_PREFIX} {str(e)}"
+
+    # Function to generate opening scenarios ahead of time (e.g. during warm-up)
+    # so the first learners after a deploy don't wait for one
+    def pregenerate(self, role, backend, count):
+        pool_index = dedup.MinHashIndex(self.duplicate_threshold)
+        for _ in range(count):
+            response = self.generate_unique(role, "", [], backend, pool_index, use_pregenerated=False)
+            if not response.startswith(ERROR_PREFIX):
+                self._pregenerated[role].append(response)
+        metrics.set_gauge(f"scenarios.pregenerated.{role}", len(self._pregenerated[role]))
+        return len(self._pregenerated[role])
+
+    # Function to hand out a pregenerated opening that is new to this session, if any
+    def _take_pregenerated(self, role, session_index):
+        try:
+            response = self._pregenerated[role].popleft()
+        except IndexError:
+            return None
+        sig = dedup.signature(response)
+        if session_index.is_duplicate(sig)[0]:
+            self._pregenerated[role].append(response)
+            return None
+        session_index.add(uuid.uuid4().hex, sig)
+        metrics.increment("scenarios.pregenerated_used")
+        metrics.set_gauge(f"scenarios.pregenerated.{role}", len(self._pregenerated[role]))
+        return response
+
+    # Function to pick pregenerated content for a call that missed its hard deadline:
+    # an opening from the pool or the corpus, or a canned hint. Returns None for other requests.
+    def _deadline_fallback(self, role, request_type, session_index):
+        if request_type == "hint":
+            metrics.increment("hedge.fallback.hint")
+            return random.choice(fallback_hints)
+        if request_type != "scenario_start":
+            return None
+        response = self._take_pregenerated(role, session_index)
+        if response is None:
+            stored = dedup.load_corpus_scenarios(self.corpus_path).get(role, [])
+            random.shuffle(stored)
+            for candidate in stored:
+                sig = dedup.signature(candidate)
+                if not session_index.is_duplicate(sig)[0]:
+                    session_index.add(uuid.uuid4().hex, sig)
+                    response = candidate
+                    break
+        if response is not None:
+            metrics.increment("hedge.fallback.scenario_start")
+        return response
+
+    # Function to generate a scenario and regenerate it if it repeats an earlier ticket
+    def generate_unique(self, role, user_input, chat_history, backend, session_index, use_pregenerated=True, thread_id=None, on_chunk=None):
+        request_type = classify_request(user_input, chat_history)
+        if request_type == "scenario_start" and use_pregenerated:
+            response = self._take_pregenerated(role, session_index)
+            if response is not None:
+                return response
+        try:
+            response = self.generate(role, user_input, chat_history, backend, raise_deadline=True, thread_id=thread_id, on_chunk=on_chunk)
+        except DeadlineExceeded as e:
+            response = self._deadline_fallback(role, request_type, session_index) if use_pregenerated else None
+            if response is not None:
+                return response
+            response = f"{ERROR_PREFIX} {str(e)}"
+        if request_type not in ("scenario_start", "follow_up"):
+            return response
+
+        # Follow-ups are only compared within their own session; the shared corpus holds opening tickets
+        corpus_index = self.corpus_index if request_type == "scenario_start" else None
+        for attempt in range(self.max_regenerations + 1):
+            if response.startswith(ERROR_PREFIX):
+                return response
+            sig = dedup.signature(response)
+            duplicate_in_session, _ = session_index.is_duplicate(sig)
+            duplicate_in_corpus = corpus_index is not None and corpus_index.is_duplicate(sig)[0]
+            metrics.increment("dedup.checks")
+            if not (duplicate_in_session or duplicate_in_corpus):
+                break
+            metrics.increment("dedup.duplicates")
+            if attempt == self.max_regenerations:
+                break  # Out of attempts, keep the last response rather than leave the user waiting
+            metrics.increment("dedup.regenerations")
+            if on_chunk is not None:
+                on_chunk(None)  # Whatever was streamed is being replaced
+            response = self.generate(role, user_input, chat_history, backend, regenerate=True, thread_id=thread_id, on_chunk=on_chunk)
+        metrics.set_gauge("dedup.duplicate_rate", metrics.ratio("dedup.duplicates", "dedup.checks"))
+
+        key = uuid.uuid4().hex
+        session_index.add(key, sig)
+        if corpus_index is not None:
+            corpus_index.add(key, sig)
+            dedup.append_to_corpus(self.corpus_path, key, role, response, sig)
+        return response
+
+    # Function to give instant feedback on a P1-P4 answer before the model grades it
+    def preliminary_feedback(self, ticket, user_input):
+        answer = priority_classifier.extract_priority(user_input)
+        if not answer or not ticket:
+            return None
+        predicted, confidence = self.classifier.predict(ticket)
+        if predicted == answer:
+            return f"Preliminary check: {answer} looks right ({confidence:.0%} confidence). Detailed feedback is on its way..."
+        return f"Preliminary check: you chose {answer}, the quick classifier suggests {predicted} ({confidence:.0%} confidence). Detailed feedback is on its way..."
+
+    # Function to start a conversation with an opening scenario
+    def start(self, conversation, role, backend):
+        response = self.generate_unique(role, "", [], backend, conversation.scenario_index)
+        conversation.chat_history.append({"role": "assistant", "content": response})
+        return response
+
+    # Function to get the reply to a learner message: the one already generated for the same
+    # message at this point of the history (after rewinding to a branch point), or a new one
+    def respond(self, role, user_input, history, backend, session_index, on_chunk=None):
+        cached = history.cached_reply({"role": "user", "content": user_input}, lambda reply: not reply.startswith(ERROR_PREFIX))
+        if cached is not None:
+            metrics.increment("branches.reused_replies")
+            return cached
+        return self.generate_unique(role, user_input, history, backend, session_index, on_chunk=on_chunk)
+
+    # Function to send a learner reply and record both sides of the turn; on_chunk(text) sees
+    # the reply as it streams in, and on_chunk(None) means discard what was streamed so far
+    def reply(self, conversation, role, user_input, backend, on_chunk=None):
+        # The turn is recorded on the branch it was sent from, even if the active one changes meanwhile
+        branch = conversation.chat_history
+        response = self.respond(role, user_input, branch.fork(), backend, conversation.scenario_index, on_chunk)
+        branch.append({"role": "user", "content": user_input})
+        branch.append({"role": "assistant", "content": response})
+        conversation.email_counter += 1
+        return response
+
+    # Function to run a learning aid ("hint", "newcomer" or "best_practices")
+    def help(self, conversation, role, kind, backend):
+        return self.reply(conversation, role, HELP_MESSAGES[kind], backend)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import sqlite3
+
+import aggregates
+import config
+from priority_classifier import extract_graded_priority, extract_priority
+
+# Incremental ETL from recorded session transcripts (RECORD_DIR, one JSONL file
+# per session) into a local SQLite analytics database. Each file has a
+# watermark (byte offset, last turn index, and when each ticket thread last got
+# an email), so nightly runs only read lines appended since the previous run. Lines are streamed and inserted in
+# batches inside the same transaction as the watermark update, together with
+# the dashboard aggregates (see aggregates.py).
+#
+#   python etl.py [--source recordings] [--db analytics.db]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    turn_index INTEGER NOT NULL,
+    learner_id TEXT,
+    role TEXT,
+    recorded_at REAL,
+    request_type TEXT,
+    help_type TEXT,
+    model TEXT,
+    is_regeneration INTEGER NOT NULL DEFAULT 0,
+    user_input_chars INTEGER,
+    output_chars INTEGER,
+    priority_answer TEXT,
+    graded_priority TEXT,
+    priority_correct INTEGER,
+    latency_ms REAL,
+    time_to_respond_s REAL,
+    PRIMARY KEY (session_id, turn_index)
+);
+CREATE INDEX IF NOT EXISTS turns_learner ON turns (learner_id, role);
+CREATE TABLE IF NOT EXISTS watermarks (
+    source TEXT PRIMARY KEY,
+    byte_offset INTEGER NOT NULL,
+    last_turn_index INTEGER NOT NULL,
+    threads TEXT
+);
+"""
+
+HELP_TYPES = {"hint": "hint", "newcomer": "newcomer", "best_practices": "best_practices"}
+
+INSERT_TURN = """
+INSERT OR REPLACE INTO turns (session_id, turn_index, learner_id, role, recorded_at, request_type, help_type, model,
+    is_regeneration, user_input_chars, output_chars, priority_answer, graded_priority, priority_correct,
+    latency_ms, time_to_respond_s)
+VALUES (:session_id, :turn_index, :learner_id, :role, :recorded_at, :request_type, :help_type, :model,
+    :is_regeneration, :user_input_chars, :output_chars, :priority_answer, :graded_priority, :priority_correct,
+    :latency_ms, :time_to_respond_s)
+"""
+
+# Function to open the analytics database and make sure the schema (and the aggregate tables) exists.
+# A connection shared between threads (check_same_thread=False) must be used under a lock.
+def connect(path, check_same_thread=True):
+    connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+    connection.executescript(SCHEMA)
+    # Databases from before per-thread state lack the threads column
+    if "threads" not in {column[1] for column in connection.execute("PRAGMA table_info(watermarks)")}:
+        connection.execute("ALTER TABLE watermarks ADD COLUMN threads TEXT")
+    aggregates.ensure_schema(connection)
+    return connection
+
+# Function to turn one recorded turn into a fact row
+def extract_facts(session_id, turn_index, record, state):
+    user_input = record.get("user_input") or ""
+    output = record.get("output") or ""
+    request_type = record.get("request_type")
+    latency_ms = record.get("latency_ms")
+    recorded_at = record.get("recorded_at")
+    
+    # A regeneration retries a duplicate response, so it isn't a new learner action
+    is_regeneration = bool(record.get("regenerate"))
+    
+    # Time from the previous email landing on this ticket thread to this reply being sent
+    time_to_respond_s = None
+    last_recorded_at = state["threads"].get(record.get("thread_id") or "")
+    if last_recorded_at is not None and recorded_at is not None and not is_regeneration:
+        sent_at = recorded_at - (latency_ms or 0) / 1000
+        time_to_respond_s = max(0.0, sent_at - last_recorded_at)
+    
+    priority_answer = extract_priority(user_input) if request_type == "follow_up" else None
+    graded_priority = extract_graded_priority(output, priority_answer) if priority_answer else None
+    return {
+        "session_id": session_id,
+        "turn_index": turn_index,
+        "learner_id": record.get("learner_id"),
+        "role": record.get("role"),
+        "recorded_at": recorded_at,
+        "request_type": request_type,
+        "help_type": HELP_TYPES.get(request_type),
+        "model": record.get("model"),
+        "is_regeneration": int(is_regeneration),
+        "user_input_chars": len(user_input),
+        "output_chars": len(output),
+        "priority_answer": priority_answer,
+        "graded_priority": graded_priority,
+        "priority_correct": None if graded_priority is None else int(graded_priority == priority_answer),
+        "latency_ms": latency_ms,
+        "time_to_respond_s": time_to_respond_s,
+    }
+
+# Function to load the watermark for a transcript file; threads maps each ticket
+# thread ("" outside shift mode) to when its last email was recorded
+def read_watermark(connection, source):
+    row = connection.execute(
+        "SELECT byte_offset, last_turn_index, threads FROM watermarks WHERE source = ?",
+        (source,),
+    ).fetchone()
+    if row is None:
+        return _empty_watermark()
+    return {"byte_offset": row[0], "last_turn_index": row[1], "threads": json.loads(row[2] or "{}")}
+
+def _empty_watermark():
+    return {"byte_offset": 0, "last_turn_index": -1, "threads": {}}
+
+def _write_watermark(connection, source, state):
+    connection.execute(
+        "INSERT OR REPLACE INTO watermarks (source, byte_offset, last_turn_index, threads) VALUES (?, ?, ?, ?)",
+        (source, state["byte_offset"], state["last_turn_index"], json.dumps(state["threads"])),
+    )
+
+# Function to read back the fact rows already loaded for a session
+def _loaded_turns(connection, session_id):
+    cursor = connection.execute("SELECT * FROM turns WHERE session_id = ?", (session_id,))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+# Function to load new turns from one transcript file, returning how many were loaded.
+# on_batch(connection, rows) sees each batch of new fact rows; on_retract(connection, rows)
+# sees the rows dropped when a file is reloaded, so aggregates built from them stay right.
+def load_file(connection, path, on_batch=None, batch_size=500, on_retract=None):
+    source = os.path.abspath(path)
+    session_id = os.path.splitext(os.path.basename(path))[0]
+    state = read_watermark(connection, source)
+    if os.path.getsize(path) < state["byte_offset"]:
+        # File was truncated or replaced: reload it from the start. This is committed
+        # together with the first reloaded batch and the reset watermark.
+        if on_retract:
+            on_retract(connection, _loaded_turns(connection, session_id))
+        connection.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        state = _empty_watermark()
+    
+    loaded = 0
+    batch = []
+    with open(path, "rb") as f:
+        f.seek(state["byte_offset"])
+        for raw_line in f:
+            if not raw_line.endswith(b"\n"):
+                break  # Partially written line, pick it up next run
+            state["byte_offset"] += len(raw_line)
+            if not raw_line.strip():
+                continue
+            record = json.loads(raw_line)
+            if record.get("type") != "turn":
+                continue
+            turn_index = state["last_turn_index"] + 1
+            batch.append(extract_facts(session_id, turn_index, record, state))
+            state["last_turn_index"] = turn_index
+            state["threads"][record.get("thread_id") or ""] = record.get("recorded_at")
+            if len(batch) >= batch_size:
+                loaded += _flush(connection, source, state, batch, on_batch)
+                batch = []
+    loaded += _flush(connection, source, state, batch, on_batch)
+    return loaded
+
+def _flush(connection, source, state, batch, on_batch):
+    with connection:
+        connection.executemany(INSERT_TURN, batch)
+        _write_watermark(connection, source, state)
+        if on_batch and batch:
+            on_batch(connection, batch)
+    return len(batch)
+
+# Function to run the ETL over every transcript in a directory
+def run(source_dir, db_path, on_batch=None, batch_size=500, on_retract=None):
+    connection = connect(db_path)
+    total = 0
+    try:
+        for name in sorted(os.listdir(source_dir)):
+            if name.endswith(".jsonl"):
+                total += load_file(connection, os.path.join(source_dir, name), on_batch, batch_size, on_retract)
+    finally:
+        connection.close()
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Load recorded transcripts into the analytics database")
+    parser.add_argument("--source", default=config.RECORD_DIR or "recordings", help="directory of recorded sessions")
+    parser.add_argument("--db", default=config.ANALYTICS_DB_PATH)
+    parser.add_argument("--batch-size", type=int, default=config.ETL_BATCH_SIZE)
+    args = parser.parse_args()
+    loaded = run(args.source, args.db, on_batch=aggregates.apply_batch, batch_size=args.batch_size,
+                 on_retract=aggregates.retract_batch)
+    print(f"Loaded {loaded} new turns into {args.db}")
+
+if __name__ == "__main__":
+    main()
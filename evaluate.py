@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import threading
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import batch
+import config
+from engine import ERROR_PREFIX, SimulationEngine
+from singleflight import idempotency_key
+
+# Evaluation harness for reply quality and prompt-rule compliance. Runs a suite
+# of scripted conversations through batch.py, then scores every reply:
+#
+#   - fast local structural checks for the rules in role_prompts (feedback, a
+#     LEARNING GUIDE section, 2-3 next-step options, hints starting with
+#     "METAPHORICAL HINT:", openings that ask for a P1-P4 priority)
+#   - optionally, an LLM judge's 1-5 score, cached by (model, rubric, turn) so
+#     re-running after a prompt or model change only judges replies that changed
+#
+# The summary has pass rates per check and request type plus latency per
+# request type, and can be diffed against a previous summary with --baseline.
+
+JUDGE_RUBRIC_VERSION = 1
+JUDGE_PROMPT = """You are grading one reply from a career simulator that trains new Support Engineers.
+Learner request type: {request_type}
+Learner message: {user_input}
+
+Simulator reply:
+{response}
+
+Score the reply from 1 (unusable) to 5 (excellent) for realism, educational value and
+whether it follows the simulator's rules: feedback on the learner's answer, a LEARNING
+GUIDE section, and 2-3 clearly explained next-step options (hints must instead be a
+metaphor starting with "METAPHORICAL HINT:").
+Answer with JSON only: {{"score": <1-5>, "reason": "<one sentence>"}}"""
+
+_OPTIONS_HEADING = re.compile(r"options|next steps|what (?:would|will|should) you do", re.IGNORECASE)
+_NUMBERED_ITEM = re.compile(r"(?:^|\s)(?:option\s*)?([1-9])[).:]", re.IGNORECASE)
+_PRIORITY = re.compile(r"\bP[1-4]\b|priority", re.IGNORECASE)
+
+# Function to count the numbered next-step options in a reply
+def count_options(text):
+    heading = _OPTIONS_HEADING.search(text)
+    if heading is None:
+        return 0
+    return len(set(_NUMBERED_ITEM.findall(text[heading.end():])))
+
+# Structural checks per request type: check name -> predicate on the reply text
+_HAS_OPTIONS = ("has_2_to_3_options", lambda text: 2 <= count_options(text) <= 3)
+CHECKS = {
+    "scenario_start": [
+        ("asks_for_priority", lambda text: bool(_PRIORITY.search(text))),
+    ],
+    "follow_up": [
+        ("has_feedback", lambda text: "feedback" in text.lower()),
+        ("has_learning_guide", lambda text: "LEARNING GUIDE" in text.upper()),
+        _HAS_OPTIONS,
+    ],
+    "hint": [
+        ("starts_with_metaphorical_hint", lambda text: text.lstrip(" \n*#").upper().startswith("METAPHORICAL HINT:")),
+    ],
+    "newcomer": [
+        ("has_learning_guide", lambda text: "LEARNING GUIDE" in text.upper()),
+        _HAS_OPTIONS,
+    ],
+    "best_practices": [
+        ("starts_with_best_practices", lambda text: text.lstrip(" \n*#").upper().startswith("BEST PRACTICES:")),
+    ],
+}
+
+# Function to run the local checks on one reply; returns {check name: passed}
+def structural_checks(request_type, response):
+    results = {"not_error": not response.startswith(ERROR_PREFIX) and bool(response.strip())}
+    if results["not_error"]:
+        for name, check in CHECKS.get(request_type, []):
+            results[name] = check(response)
+    return results
+
+class JudgeCache:
+    # Append-only JSONL cache of judge results, keyed by a hash of what was judged
+    def __init__(self, path):
+        self.path = path
+        self._results = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in filter(str.strip, f):
+                    record = json.loads(line)
+                    self._results[record["key"]] = record["result"]
+
+    def get(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "result": result}) + "\n")
+
+# Function to ask the judge model to score one turn, using the cache when possible
+def judge_turn(record, backend, model_name, cache):
+    key = idempotency_key(model_name, JUDGE_RUBRIC_VERSION, record["request_type"], record["user_input"], record["response"])
+    cached = cache.get(key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    prompt = JUDGE_PROMPT.format(**record)
+    try:
+        output = backend.send(model_name, {"temperature": 0, "max_output_tokens": 200}, [], prompt,
+                              role=record["role"], request_type="judge", user_input=record["user_input"])
+        verdict = json.loads(output[output.index("{"):output.rindex("}") + 1])
+        result = {"score": int(verdict["score"]), "reason": str(verdict.get("reason", ""))}
+    except Exception as e:
+        # Unparseable verdicts and failed calls aren't cached, so they are retried next run
+        return {"score": None, "reason": f"Judge failed: {e}", "cached": False}
+    cache.put(key, result)
+    return {**result, "cached": False}
+
+# Function to aggregate scored turns into pass rates and latencies
+def summarize(records):
+    checks = defaultdict(lambda: [0, 0])
+    seconds = defaultdict(list)
+    scores = defaultdict(list)
+    for record in records:
+        seconds[record["request_type"]].append(record["seconds"])
+        for name, passed in record["checks"].items():
+            tally = checks[f"{record['request_type']}.{name}"]
+            tally[0] += passed
+            tally[1] += 1
+        if record.get("judge", {}).get("score") is not None:
+            scores[record["request_type"]].append(record["judge"]["score"])
+    all_checks = [passed for record in records for passed in record["checks"].values()]
+    summary = {
+        "turns": len(records),
+        "pass_rate": round(sum(all_checks) / len(all_checks), 4) if all_checks else None,
+        "checks": {name: round(passed / total, 4) for name, (passed, total) in sorted(checks.items())},
+        "latency": {
+            request_type: {
+                "p50_seconds": round(statistics.median(values), 3),
+                "p95_seconds": round(sorted(values)[max(0, int(len(values) * 0.95) - 1)], 3),
+            }
+            for request_type, values in sorted(seconds.items())
+        },
+    }
+    if scores:
+        summary["judge_mean"] = {request_type: round(statistics.mean(values), 2) for request_type, values in sorted(scores.items())}
+    return summary
+
+# Function to print how a summary moved against a baseline summary
+def print_comparison(summary, baseline):
+    rows = [("pass_rate", baseline.get("pass_rate"), summary.get("pass_rate"))]
+    rows += [(f"check {name}", baseline.get("checks", {}).get(name), rate) for name, rate in summary["checks"].items()]
+    rows += [(f"p95 {request_type}", baseline.get("latency", {}).get(request_type, {}).get("p95_seconds"), values["p95_seconds"])
+             for request_type, values in summary["latency"].items()]
+    rows += [(f"judge {request_type}", baseline.get("judge_mean", {}).get(request_type), mean)
+             for request_type, mean in summary.get("judge_mean", {}).items()]
+    for name, before, after in rows:
+        delta = f"{after - before:+.4g}" if before is not None and after is not None else "n/a"
+        print(f"{name}: {before} -> {after} ({delta})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Score simulator replies for quality and prompt-rule compliance")
+    parser.add_argument("suite", nargs="?", default="eval_suite.jsonl", help="conversation scripts (batch.py format)")
+    parser.add_argument("--results", help="score an existing batch.py results file instead of running the suite")
+    parser.add_argument("--out", default="eval_results.jsonl", help="per-turn scores")
+    parser.add_argument("--summary", default="eval_summary.json")
+    parser.add_argument("--baseline", help="earlier summary to compare against")
+    parser.add_argument("--judge", action="store_true", help="also score replies with an LLM judge")
+    parser.add_argument("--judge-model", default=config.JUDGE_MODEL)
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS)
+    parser.add_argument("--api-key", default=config.GEMINI_API_KEY)
+    args = parser.parse_args()
+
+    limiters = backends.rate_limiters(config.RATE_LIMITS)
+    if args.results:
+        with open(args.results, encoding="utf-8") as f:
+            records = [json.loads(line) for line in filter(str.strip, f)]
+    else:
+        # The suite's scenarios and raw results are scratch files, removed with the directory
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            simulation_engine = SimulationEngine(corpus_path=os.path.join(scratch_dir, "scenario_corpus.jsonl"))
+            scripts = batch.load_scripts(args.suite, simulation_engine.role_prompts)
+            results_path = os.path.join(scratch_dir, "results.jsonl")
+            with open(results_path, "w", encoding="utf-8") as out:
+                run_summary = batch.run(scripts, out, simulation_engine, args.api_key, args.workers, config.RATE_LIMITS)
+            print(", ".join(f"{key}={value}" for key, value in run_summary.items()))
+            with open(results_path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+
+    for record in records:
+        record["checks"] = structural_checks(record["request_type"], record["response"])
+
+    if args.judge:
+        cache = JudgeCache(config.JUDGE_CACHE_PATH)
+        backend = backends.RateLimitedBackend(backends.create_backend(args.api_key, uuid.uuid4().hex, config, limiters=limiters), limiters)
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="judge") as executor:
+            verdicts = executor.map(lambda record: judge_turn(record, backend, args.judge_model, cache), records)
+            for record, verdict in zip(records, verdicts):
+                record["judge"] = verdict
+        cached = sum(record["judge"]["cached"] for record in records)
+        print(f"judged={len(records)}, cached={cached}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    summary = summarize(records)
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print_comparison(summary, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+import api
+import config
+import costs
+import metrics
+import session_store
+from engine import SimulationEngine
+
+# Load test for the API service against the offline stub backend. Runs the
+# service in-process on a local port, drives it with simulated learners
+# (start a simulation, reply several times, ask for a hint, and stream one
+# reply over the WebSocket), and reports throughput, latency and how many
+# concurrent sessions one core sustains at the measured CPU cost.
+
+# Function to play one learner's session against the service
+async def learner(client, base_url, replies, latencies):
+    async def timed(method, path, **kwargs):
+        start = time.perf_counter()
+        async with client.request(method, base_url + path, **kwargs) as response:
+            body = await response.json()
+            response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        return body
+
+    session = await timed("POST", "/sessions", json={"role": "Support Engineer"})
+    path = f"/sessions/{session['session_id']}"
+    for i in range(replies):
+        await timed("POST", f"{path}/replies", json={"text": f"I would classify this as P{i % 4 + 1}", "idempotency_key": str(i)})
+    await timed("POST", f"{path}/help/hint")
+
+    start = time.perf_counter()
+    async with client.ws_connect(base_url + path + "/ws") as ws:
+        await ws.send_json({"type": "reply", "text": "Escalating to the on-call engineer", "idempotency_key": "ws"})
+        async for message in ws:
+            if message.json()["type"] == "done":
+                break
+    latencies.append((time.perf_counter() - start) * 1000)
+
+async def run(sessions, replies, latency, workers, max_concurrent, slow_rate=0.0, slow_seconds=0.0, hedge_deadlines=None):
+    config.STUB_LATENCY = latency
+    config.STUB_SLOW_RATE = slow_rate
+    config.STUB_SLOW_SECONDS = slow_seconds
+    if hedge_deadlines is not None:
+        config.HEDGE_DEADLINES = hedge_deadlines
+    config.ADMISSION_MAX_CONCURRENT = max_concurrent
+    config.BACKEND = "stub"
+    config.RECORD_DIR = ""
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    service = api.SimulatorService(
+        simulation_engine=SimulationEngine(corpus_path=os.path.join(workdir, "corpus.jsonl")),
+        sessions=session_store.SessionManager(os.path.join(workdir, "sessions")),
+        executor=ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api"),
+        ledger=costs.CostLedger(config.MODEL_PRICES, config.COST_QUOTAS),
+    )
+    runner = web.AppRunner(api.create_app(service))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    latencies = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as client:
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(learner(client, base_url, replies, latencies) for _ in range(sessions)))
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    await runner.cleanup()
+
+    # CPU time includes the load generator, so per-core capacity is a lower bound
+    cpu_share = cpu / wall
+    latencies.sort()
+    waits = sorted(metrics.snapshot()["observations"].get("admission.wait_ms", [0]))
+    counters = metrics.snapshot()["counters"]
+    metrics.reset()
+    return {
+        "sessions": sessions,
+        "requests": len(latencies),
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(latencies) / wall, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "cpu_cores_used": round(cpu_share, 2),
+        "cpu_ms_per_request": round(cpu * 1000 / len(latencies), 2),
+        "concurrent_sessions_per_core": int(sessions / cpu_share) if cpu_share else sessions,
+        "queued_calls": counters.get("admission.queued_total", 0),
+        "rejected_calls": counters.get("admission.rejected", 0),
+        "admission_wait_p95_ms": round(waits[max(0, int(len(waits) * 0.95) - 1)], 1),
+        "hedged_calls": sum(value for name, value in counters.items() if name.startswith("hedge.sent.")),
+        "hedges_won": sum(value for name, value in counters.items() if name.startswith("hedge.won.")),
+        "deadline_fallbacks": sum(value for name, value in counters.items() if name.startswith("hedge.fallback.")),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API service against the stub backend")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 200, 500], help="concurrent learners per run")
+    parser.add_argument("--replies", type=int, default=5, help="replies per learner")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated model latency in seconds")
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS, help="model call threads")
+    parser.add_argument("--max-concurrent", type=int, default=config.ADMISSION_MAX_CONCURRENT,
+                        help="admission control limit on model calls in flight")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of model calls that are slow, to exercise hedging")
+    parser.add_argument("--slow-seconds", type=float, default=10.0, help="latency of a slow model call")
+    parser.add_argument("--hedge-deadlines", type=json.loads, default=None,
+                        help="hedging to test, as JSON in the HEDGE_DEADLINES format (default: the configured value)")
+    args = parser.parse_args()
+    for sessions in args.sessions:
+        # Model calls block a worker for their whole latency, so give every admitted call one
+        result = asyncio.run(run(sessions, args.replies, args.latency, max(args.workers, args.max_concurrent), args.max_concurrent,
+                                 args.slow_rate, args.slow_seconds, args.hedge_deadlines))
+        print(", ".join(f"{key}={value}" for key, value in result.items()))
+
+if __name__ == "__main__":
+    main()
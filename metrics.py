@@ -0,0 +1,56 @@
+import threading
+from collections import defaultdict, deque
+
+# Lightweight in-process metrics: counters, gauges and rolling observations.
+# Everything is kept in memory and read back through snapshot().
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_observations = defaultdict(lambda: deque(maxlen=1000))
+
+# Function to increment a counter
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+# Function to set a gauge to an absolute value
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+# Function to record a single observation (latency, size, ...)
+def observe(name, value):
+    with _lock:
+        _observations[name].append(value)
+
+# Function to compute a ratio between two counters (0.0 when the denominator is empty)
+def ratio(numerator, denominator):
+    with _lock:
+        total = _counters.get(denominator, 0)
+        return _counters.get(numerator, 0) / total if total else 0.0
+
+# Function to compute a percentile over the recorded observations
+def percentile(name, pct):
+    with _lock:
+        values = sorted(_observations.get(name, ()))
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+# Function to return a copy of all metrics
+def snapshot():
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "observations": {name: list(values) for name, values in _observations.items()},
+        }
+
+# Function to clear all metrics (used by benchmarks between runs)
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _observations.clear()
@@ -0,0 +1,120 @@
+import json
+import math
+import os
+import random
+import re
+
+# Local P1-P4 ticket priority classifier. It gives learners instant preliminary
+# feedback on their triage answer while the full LLM grading is generated.
+# The model is a multinomial logistic regression over word unigrams and bigrams,
+# stored as plain JSON. Until a trained model exists it falls back to
+# hand-picked keyword weights.
+
+PRIORITIES = ("P1", "P2", "P3", "P4")
+
+# Starting weights used when no trained model is available
+DEFAULT_KEYWORDS = {
+    "P1": {"outage": 2.0, "down": 1.5, "all users": 2.0, "production": 1.2, "data loss": 2.5, "security": 1.5,
+           "breach": 2.5, "critical": 1.5, "cannot log": 1.2, "entire": 1.0, "revenue": 1.2, "urgent": 1.0},
+    "P2": {"many users": 1.5, "several": 1.0, "degraded": 1.5, "slow": 1.0, "failing": 1.2, "deadline": 1.2,
+           "workaround": -0.5, "high": 1.0, "intermittent": 0.8, "team": 0.6},
+    "P3": {"single user": 1.5, "one user": 1.5, "workaround": 1.5, "sometimes": 0.8, "minor": 1.0,
+           "medium": 1.0, "occasionally": 1.0, "sync": 0.6},
+    "P4": {"cosmetic": 2.0, "typo": 2.0, "feature request": 2.0, "question": 1.2, "low": 1.0,
+           "alignment": 1.5, "colour": 1.0, "color": 1.0, "suggestion": 1.5, "how do": 1.2},
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_PRIORITY = re.compile(r"\bP\s?([1-4])\b", re.IGNORECASE)
+_GRADED = re.compile(
+    r"(?:correct|appropriate|right|actual|should be|would be|better|is a|classif\w*(?: this)? as)[^.\n]{0,40}?\bP\s?([1-4])\b",
+    re.IGNORECASE,
+)
+_PRAISE = re.compile(r"\b(correct|well done|good job|great job|spot on|exactly right)\b", re.IGNORECASE)
+_CRITICISM = re.compile(r"\b(incorrect|not quite|actually|however|should have)\b", re.IGNORECASE)
+
+# Function to turn text into unigram and bigram features
+def features(text):
+    words = _WORD.findall(text.lower())
+    feats = set(words)
+    feats.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return feats
+
+# Function to find the first priority (P1-P4) mentioned in a message
+def extract_priority(text):
+    match = _PRIORITY.search(text or "")
+    return f"P{match.group(1)}" if match else None
+
+# Function to work out which priority the model's grading says is correct
+def extract_graded_priority(feedback, user_answer=None):
+    match = _GRADED.search(feedback or "")
+    if match:
+        return f"P{match.group(1)}"
+    if user_answer and _PRAISE.search(feedback or "") and not _CRITICISM.search(feedback or ""):
+        return user_answer
+    return None
+
+class PriorityClassifier:
+    def __init__(self, weights=None, bias=None):
+        self.weights = weights or {label: {} for label in PRIORITIES}
+        self.bias = bias or {label: 0.0 for label in PRIORITIES}
+
+    @classmethod
+    def from_keywords(cls, keywords=DEFAULT_KEYWORDS):
+        return cls({label: dict(keywords.get(label, {})) for label in PRIORITIES})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["weights"], data["bias"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"weights": self.weights, "bias": self.bias}, f)
+
+    # Function to compute class probabilities for a ticket
+    def predict_proba(self, text, feats=None):
+        feats = feats if feats is not None else features(text)
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(f, 0.0) for f in feats)
+            for label in PRIORITIES
+        }
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {label: value / total for label, value in exp_scores.items()}
+
+    # Function to predict the most likely priority and its probability
+    def predict(self, text):
+        proba = self.predict_proba(text)
+        label = max(proba, key=proba.get)
+        return label, proba[label]
+
+    # Function to train with stochastic gradient descent on (text, label) pairs
+    def fit(self, texts, labels, epochs=30, learning_rate=0.2, l2=1e-4, seed=0):
+        examples = [(features(text), label) for text, label in zip(texts, labels)]
+        rng = random.Random(seed)
+        for _ in range(epochs):
+            rng.shuffle(examples)
+            for feats, label in examples:
+                proba = self.predict_proba(None, feats)
+                for candidate in PRIORITIES:
+                    gradient = proba[candidate] - (1.0 if candidate == label else 0.0)
+                    self.bias[candidate] -= learning_rate * gradient
+                    weights = self.weights[candidate]
+                    for f in feats:
+                        w = weights.get(f, 0.0)
+                        weights[f] = w - learning_rate * (gradient + l2 * w)
+        return self
+
+# Function to load the trained model, falling back to the keyword baseline
+def load_classifier(path):
+    if path and os.path.exists(path):
+        return PriorityClassifier.load(path)
+    return PriorityClassifier.from_keywords()
+
+# Function to append a graded triage answer to the training log
+def log_grading(path, ticket, answer, feedback):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ticket": ticket, "answer": answer, "feedback": feedback}) + "\n")
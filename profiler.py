@@ -0,0 +1,171 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+_sequence = itertools.count(1)  # keeps profile file names unique within the process
+
+# Opt-in sampling profiler for finding out where a slow script run or model
+# call spends its time (Streamlit, the desktop, history rendering, the model
+# call...). A background thread looks at the profiled thread's stack every
+# few milliseconds; nothing is traced while profiling is off, so leaving it
+# in production costs one check per run. Each profile is written as:
+#
+#   <name>.speedscope.json  open at https://www.speedscope.app
+#   <name>.folded           collapsed stacks for flamegraph.pl / inferno
+#   <name>.txt              top functions by total and self time
+
+class SamplingProfiler:
+    # Samples one thread (the current one by default) until stop(), or until
+    # until_frame is no longer on its stack (e.g. a Streamlit script run ended,
+    # however it ended). on_finish is called with the profiler afterwards.
+    def __init__(self, name, interval=0.005, thread_id=None, until_frame=None, on_finish=None):
+        self.name = name
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.until_frame = until_frame
+        self.on_finish = on_finish
+        self.samples = []  # (stack of (function, file, line) from the outermost call, seconds)
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        start = last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            running = self.until_frame is None
+            while frame is not None:
+                running = running or frame is self.until_frame
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if not running:
+                break
+            stack.reverse()
+            self.samples.append((tuple(stack), now - last))
+            last = now
+        self.seconds = time.perf_counter() - start
+        self.until_frame = None  # Don't keep the finished run's frame alive
+        metrics.increment("profiler.profiles")
+        metrics.increment("profiler.samples", len(self.samples))
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    # Function to total the seconds each function was on the stack (total) and on top of it (self)
+    def times(self):
+        total, own = Counter(), Counter()
+        for stack, seconds in self.samples:
+            for frame in set(stack):
+                total[frame] += seconds
+            own[stack[-1]] += seconds
+        return total, own
+
+    # Function to describe the profile as text: the top functions by self time, then by
+    # total time leaving out the frames every sample shares (the thread and script entry points)
+    def summary(self, n=15):
+        total, own = self.times()
+        sampled = sum(seconds for _, seconds in self.samples)
+        lines = [f"{self.name}: {self.seconds * 1000:.1f} ms, {len(self.samples)} samples",
+                 f"{'self ms':>10} {'total ms':>10}  function"]
+        for frame, seconds in own.most_common(n):
+            lines.append(_summary_line(frame, seconds, total[frame]))
+        branches = [(frame, seconds) for frame, seconds in total.most_common() if seconds < sampled - 1e-9][:n]
+        if branches:
+            lines.append(f"{'total ms':>10} {'self ms':>10}  function (below the shared entry points)")
+            lines += [_summary_line(frame, seconds, own[frame]) for frame, seconds in branches]
+        return "\n".join(lines)
+
+    # Function to build a speedscope "sampled" profile
+    def speedscope(self):
+        frames, index = [], {}
+        samples = []
+        for stack, _ in self.samples:
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            samples.append([index[frame] for frame in stack])
+        weights = [seconds for _, seconds in self.samples]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "career-simulator profiler",
+            "shared": {"frames": frames},
+            "profiles": [{"type": "sampled", "name": self.name, "unit": "seconds",
+                          "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights}],
+        }
+
+    # Function to build collapsed stacks ("outer;inner;leaf microseconds" per line) for flamegraph tools
+    def folded(self):
+        stacks = Counter()
+        for stack, seconds in self.samples:
+            stacks[";".join(f"{function} ({os.path.basename(filename)}:{line})" for function, filename, line in stack)] += seconds
+        return "".join(f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in stacks.items())
+
+    # Function to write the speedscope, folded and summary files; returns their paths
+    def write(self, directory, top_n=15):
+        os.makedirs(directory, exist_ok=True)
+        # Milliseconds and a sequence number, so two calls of one type in the same second don't collide
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}.{int(self.started_at * 1000) % 1000:03d}"
+        base = os.path.join(directory, f"{stamp}-{next(_sequence)}-{self.name}")
+        paths = [f"{base}.speedscope.json", f"{base}.folded", f"{base}.txt"]
+        with open(paths[0], "w", encoding="utf-8") as f:
+            json.dump(self.speedscope(), f)
+        with open(paths[1], "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        with open(paths[2], "w", encoding="utf-8") as f:
+            f.write(self.summary(top_n) + "\n")
+        return paths
+
+# Function to format one summary row: two times in ms, then the function and where it is defined
+def _summary_line(frame, first_seconds, second_seconds):
+    function, filename, line = frame
+    return f"{first_seconds * 1000:10.1f} {second_seconds * 1000:10.1f}  {function} ({os.path.basename(filename)}:{line})"
+
+class ProfiledBackend:
+    # Profiles every model call (in the thread that makes it) and writes one profile per call
+    def __init__(self, inner, directory, interval=0.005, top_n=15, on_profile=None):
+        self.inner = inner
+        self.directory = directory
+        self.interval = interval
+        self.top_n = top_n
+        self.on_profile = on_profile
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        sampler = SamplingProfiler(f"model-{metadata.get('request_type') or 'call'}", self.interval).start()
+        try:
+            return self.inner.send(model_name, generation_config, history, message, **metadata)
+        finally:
+            sampler.stop()
+            sampler.write(self.directory, self.top_n)
+            if self.on_profile is not None:
+                self.on_profile(sampler)
+
+# Function to profile the rest of the calling script run (the caller's frame stays on the
+# stack until the run ends); the files are written once it finishes
+def profile_script_run(name, directory, interval=0.005, top_n=15, on_profile=None):
+    def finish(sampler):
+        sampler.write(directory, top_n)
+        if on_profile is not None:
+            on_profile(sampler)
+    return SamplingProfiler(name, interval, until_frame=sys._getframe(1), on_finish=finish).start()
@@ -0,0 +1,49 @@
+# Role catalogue and system prompts. Kept in their own module so they are built
+# once per process instead of on every Streamlit rerun of check.py.
+
+# Define roles and their descriptions
+roles = {
+    "Support Engineer": "Technical support specialist who resolves customer issues, troubleshoots technical problems, and coordinates with development teams.",
+    "Front-end Developer": "Software engineer who builds user interfaces and interactive components for web applications.",
+    "Data Analyst": "Professional who processes and analyzes data to derive insights and support business decisions.",
+    "Project Manager": "Professional who plans, executes, and closes projects while managing scope, resources, and timelines."
+}
+
+# Role-specific simulation prompts with learning mode
+role_prompts = {
+    "Support Engineer": """
+    You are simulating a realistic work environment for a Support Engineer, but with an educational component for someone completely new to the role. Act as both the system generating support scenarios AND various stakeholders (customers, managers, developers).
+    
+    Follow these rules:
+    1. Create realistic support tickets with technical problems of varying complexity
+    2. Require the user to classify priority (P1/Critical, P2/High, P3/Medium, P4/Low)
+    3. After the user responds, ALWAYS provide:
+       a) Feedback on their answer
+       b) A detailed "LEARNING GUIDE" section that explains how an experienced support engineer would approach this situation
+       c) Give them 2-3 options for what they might do next (with clear explanations)
+    4. Present new challenges based on their decisions
+    5. Track and remember their previous actions within this session
+    
+    Keep scenarios focused on common software issues like:
+    - Authentication problems
+    - Performance slowdowns
+    - Integration errors
+    - Data sync issues
+    - UI/UX problems
+    - API failures
+    
+    Start by introducing yourself as the simulation system, explaining that you will provide guidance for beginners, and present the first simple ticket.
+    """
+}
+
+# Pre-written hints, served when a hint request misses its hard deadline
+fallback_hints = [
+    "METAPHORICAL HINT: Imagine you're a doctor in a busy clinic. Before treating anyone, you ask where it hurts, when it started and what changed recently. "
+    "Then you check the vital signs before ordering expensive tests. Do the same here: gather the symptoms, find out what changed, and rule out the simple causes first.",
+    "METAPHORICAL HINT: Think of a plumber called to a house with no water in the kitchen. They don't rip out the walls; they check whether the other taps work, "
+    "then follow the pipe back from the tap to the main valve until they find where the water stops. Trace your problem the same way, one connection at a time.",
+    "METAPHORICAL HINT: Picture an air traffic controller with several planes asking to land. They don't take them in the order they called; they land the one "
+    "low on fuel first and keep everyone else informed. Decide what is most urgent, act on it, and tell the people who are waiting what happens next.",
+    "METAPHORICAL HINT: Imagine a detective arriving at a scene. They write down what they see before touching anything, ask witnesses for exact times, "
+    "and only then form a theory they can test. Collect the facts and timestamps first, then test one explanation at a time.",
+]
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import backends
+import config
+
+# Replays a recorded session through check.py against the offline replay
+# backend, using Streamlit's headless AppTest runner. Reports per-turn script
+# time split into recorded model latency and app overhead (state handling and
+# rendering), so runs can be compared across versions with no network.
+#
+#   python replay.py recordings/<session_id>.jsonl --speed 0 --report replay_report.json
+
+# Function to find a button (including form submit buttons) by its label
+def find_button(app, label):
+    return next(button for button in app.button if button.label == label)
+
+# Function to run one script execution and return its wall time in milliseconds
+def timed_run(app):
+    start = time.perf_counter()
+    app.run()
+    return (time.perf_counter() - start) * 1000
+
+# Function to drive the app through every recorded turn
+def replay(path, speed=0.0, timeout=60):
+    from streamlit.testing.v1 import AppTest
+    
+    # The app reads config at run time, and AppTest runs check.py in this process
+    config.BACKEND = "replay"
+    config.REPLAY_PATH = path
+    config.REPLAY_SPEED = speed
+    config.RECORD_DIR = ""
+    config.SCENARIO_CORPUS_PATH = os.path.join(tempfile.mkdtemp(), "scenario_corpus.jsonl")
+    
+    turns = backends.load_replay(path)
+    if not turns:
+        raise ValueError(f"No recorded turns in {path}")
+    role = turns[0]["role"]
+    
+    app = AppTest.from_file("check.py", default_timeout=timeout)
+    results = [{"step": "first_paint", "script_ms": timed_run(app), "model_ms": 0.0}]
+    app.text_input(key="api_key_input").input("replay")
+    find_button(app, "Save API Key").click()
+    results.append({"step": "save_api_key", "script_ms": timed_run(app), "model_ms": 0.0})
+    
+    # Starting the role generates the opening scenario (first recorded turn)
+    app.button(key=f"btn_{role}").click()
+    results.append({"step": "scenario_start", "script_ms": timed_run(app), "model_ms": turns[0]["latency_ms"] * speed})
+    
+    # Each user reply is typed into the composer once; regenerated duplicates are
+    # recorded as extra turns for the same input and history and are skipped here
+    sent = set()
+    for turn in turns:
+        if turn["request_type"] == "scenario_start" or (turn["user_input"], turn["history_length"]) in sent:
+            continue
+        sent.add((turn["user_input"], turn["history_length"]))
+        app.text_area(key="composer_text").input(turn["user_input"])
+        find_button(app, "Send Email").click()
+        results.append({"step": turn["request_type"], "script_ms": timed_run(app), "model_ms": turn["latency_ms"] * speed})
+    
+    for result in results:
+        result["overhead_ms"] = result["script_ms"] - result["model_ms"]
+    return results
+
+# Function to summarise per-turn results
+def summarise(results):
+    overheads = [r["overhead_ms"] for r in results]
+    return {
+        "turns": len(results),
+        "total_script_ms": sum(r["script_ms"] for r in results),
+        "total_model_ms": sum(r["model_ms"] for r in results),
+        "median_overhead_ms": statistics.median(overheads),
+        "max_overhead_ms": max(overheads),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the app")
+    parser.add_argument("path", help="recording written with RECORD_DIR set")
+    parser.add_argument("--speed", type=float, default=0.0, help="multiplier on recorded latencies (0 = none)")
+    parser.add_argument("--report", help="write the per-turn report to this JSON file")
+    args = parser.parse_args()
+    
+    results = replay(args.path, args.speed)
+    summary = summarise(results)
+    for result in results:
+        print(f"{result['step']:>16}: script {result['script_ms']:8.1f} ms  model {result['model_ms']:8.1f} ms  overhead {result['overhead_ms']:8.1f} ms")
+    print(json.dumps(summary, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "turns": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
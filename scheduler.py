@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import defaultdict, deque
+
+import metrics
+
+# Server-side event scheduler for timed ticket arrivals and SLA escalations.
+# One asyncio event loop on a single daemon thread holds every session's
+# timers (the loop keeps them in a heap, so thousands cost next to nothing).
+# Timers never touch Streamlit state directly: they post events into a
+# per-session mailbox, which the session drains on its next run.
+
+class EventScheduler:
+    def __init__(self, executor=None, mailbox_size=100):
+        self.executor = executor
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="event-scheduler", daemon=True)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._handles = {}  # handle id -> (session_id, asyncio handle or task)
+        self._by_session = defaultdict(set)
+        self._mailboxes = defaultdict(lambda: deque(maxlen=mailbox_size))
+        self._thread.start()
+
+    # Function to run a callback on the loop after a delay; returns a handle id
+    def call_later(self, session_id, delay, callback, *args):
+        handle_id = next(self._ids)
+        
+        def fire():
+            self._forget(handle_id)
+            metrics.increment("scheduler.fired")
+            callback(*args)
+        
+        def arm():
+            self._remember(handle_id, session_id, self._loop.call_later(max(0.0, delay), fire))
+        
+        self._loop.call_soon_threadsafe(arm)
+        return handle_id
+
+    # Function to run a coroutine on the loop for a session; returns a handle id
+    def spawn(self, session_id, coroutine):
+        handle_id = next(self._ids)
+        
+        async def run():
+            try:
+                await coroutine
+            finally:
+                self._forget(handle_id)
+        
+        def start():
+            self._remember(handle_id, session_id, self._loop.create_task(run()))
+        
+        self._loop.call_soon_threadsafe(start)
+        return handle_id
+
+    # Function to run blocking work (e.g. a model call) on the executor from a coroutine
+    async def run_blocking(self, func, *args):
+        return await self._loop.run_in_executor(self.executor, func, *args)
+
+    # Function to cancel one timer or task
+    def cancel(self, handle_id):
+        self._loop.call_soon_threadsafe(self._cancel, handle_id)
+
+    # Function to cancel everything scheduled for a session and empty its mailbox
+    def cancel_session(self, session_id):
+        with self._lock:
+            handle_ids = list(self._by_session.get(session_id, ()))
+            self._mailboxes.pop(session_id, None)
+        for handle_id in handle_ids:
+            self.cancel(handle_id)
+
+    # Function to deliver an event to a session's mailbox (safe from any thread)
+    def post(self, session_id, event):
+        with self._lock:
+            self._mailboxes[session_id].append(event)
+        metrics.increment(f"scheduler.events.{event.get('type', 'unknown')}")
+
+    # Function to take every pending event for a session
+    def drain(self, session_id):
+        with self._lock:
+            mailbox = self._mailboxes.pop(session_id, None)
+        return list(mailbox or ())
+
+    # Function to count scheduled timers and tasks
+    def pending(self):
+        with self._lock:
+            return len(self._handles)
+
+    def _remember(self, handle_id, session_id, handle):
+        with self._lock:
+            self._handles[handle_id] = (session_id, handle)
+            self._by_session[session_id].add(handle_id)
+            metrics.set_gauge("scheduler.pending", len(self._handles))
+
+    def _forget(self, handle_id):
+        with self._lock:
+            session_id, _ = self._handles.pop(handle_id, (None, None))
+            handles = self._by_session.get(session_id)
+            if handles is not None:
+                handles.discard(handle_id)
+                if not handles:
+                    del self._by_session[session_id]
+            metrics.set_gauge("scheduler.pending", len(self._handles))
+
+    def _cancel(self, handle_id):
+        with self._lock:
+            entry = self._handles.get(handle_id)
+        if entry is not None:
+            entry[1].cancel()
+            self._forget(handle_id)
+
+# Coroutine that pre-generates a ticket ahead of its arrival time, then delivers it on time.
+# start_generation() starts the work (e.g. once admitted, on an executor) and returns a
+# concurrent.futures.Future of the ticket; None as the ticket drops it (e.g. the session is gone).
+async def ticket_arrival(scheduler, session_id, arrive_at, lead_seconds, start_generation, thread_id=None):
+    await asyncio.sleep(max(0.0, arrive_at - lead_seconds - time.time()))
+    start = time.time()
+    content = await asyncio.wrap_future(start_generation())
+    if content is None:
+        metrics.increment("scheduler.dropped_arrivals")
+        return
+    metrics.observe("scheduler.pregeneration_s", time.time() - start)
+    if time.time() > arrive_at:
+        metrics.increment("scheduler.late_arrivals")
+    await asyncio.sleep(max(0.0, arrive_at - time.time()))
+    scheduler.post(session_id, {"type": "ticket", "content": content, "thread_id": thread_id, "arrived_at": time.time()})
+
+# Function to build an escalation email for a ticket that breached its SLA
+def escalation_email(title, priority, sla_seconds):
+    minutes = max(1, round(sla_seconds / 60))
+    return (
+        f"From: Team Lead <lead@company.com>\n"
+        f"To: You <you@company.com>\n"
+        f"Subject: ESCALATION - {title} has breached its {priority} SLA\n"
+        f"Time: {time.strftime('%I:%M %p')}\n\n"
+        f"Hi,\n\n"
+        f"{title} was classified as {priority}, which we have to respond to within {minutes} minutes. "
+        f"That window has now passed without a reply and the customer has chased us.\n\n"
+        f"Please send an update on this ticket as soon as you can: acknowledge the delay, "
+        f"share what you know so far and when they can expect the next update.\n\n"
+        f"Thanks,\nTeam Lead"
+    )
@@ -0,0 +1,310 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import dedup
+import metrics
+from transcript import Transcript
+
+# Per-session conversation state kept outside st.session_state so it can be
+# evicted. Sessions idle for longer than the timeout, or the least recently
+# used ones when the process goes over its memory ceiling, are compressed and
+# spilled to disk. They are transparently rehydrated the next time the
+# session runs. A session pinned by a request in progress (e.g. waiting on a
+# model call) is never spilled, so the turn it records isn't lost.
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+MAIN_BRANCH = "main"
+
+class Conversation:
+    def __init__(self, session_id, chat_history=None, email_counter=1, completed_sends=None, scenario_signatures=None, threshold=0.6,
+                 threads=None, active_thread=None, role=None, branches=None, active_branch=None, send_replies=None):
+        self.session_id = session_id
+        self.role = role
+        self.chat_history = Transcript(chat_history or [])
+        # Branches of a single-ticket simulation: name -> Transcript, all forks of one tree.
+        # Rebuilding them from their messages shares their common prefixes again.
+        self.branches = {MAIN_BRANCH: self.chat_history}
+        for name, messages in (branches or {}).items():
+            if name != MAIN_BRANCH:
+                self.branches[name] = self.chat_history.fork(0)
+                self.branches[name].extend(messages)
+        self.active_branch = active_branch if active_branch in self.branches else MAIN_BRANCH
+        self.chat_history = self.branches[self.active_branch]
+        # Shift mode: independent ticket threads; chat_history is the active thread's history
+        self.threads = threads or {}
+        for thread in self.threads.values():
+            thread["chat_history"] = Transcript(thread["chat_history"])
+        self.active_thread = active_thread
+        if active_thread in self.threads:
+            self.chat_history = self.threads[active_thread]["chat_history"]
+        self.email_counter = email_counter
+        self.completed_sends = set(completed_sends or ())
+        self.send_replies = send_replies or {}  # API sends: idempotency key -> the reply it got
+        self.scenario_index = dedup.MinHashIndex(threshold)
+        for key, sig in scenario_signatures or ():
+            self.scenario_index.add(key, tuple(sig))
+
+    # Function to serialise the conversation for spilling
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "role": self.role,
+            "chat_history": list(self.branches[MAIN_BRANCH]),
+            "branches": {name: list(branch) for name, branch in self.branches.items() if name != MAIN_BRANCH},
+            "active_branch": self.active_branch,
+            "threads": {thread_id: {**thread, "chat_history": list(thread["chat_history"])} for thread_id, thread in self.threads.items()},
+            "active_thread": self.active_thread,
+            "email_counter": self.email_counter,
+            "completed_sends": sorted(self.completed_sends),
+            "send_replies": dict(self.send_replies),
+            "scenario_signatures": [[key, list(sig)] for key, sig in self.scenario_index.items()],
+        }
+
+    # Function to get the ticket the active thread opened with (its first assistant message)
+    def opening_ticket(self):
+        return next((message["content"] for message in self.chat_history if message["role"] == "assistant"), "")
+
+    # Function to switch the active ticket thread (or back to single-thread mode with None)
+    def select_thread(self, thread_id):
+        self.active_thread = thread_id
+        if thread_id:
+            self.chat_history = self.threads[thread_id]["chat_history"]
+        else:
+            self.chat_history = Transcript()
+            self.branches = {MAIN_BRANCH: self.chat_history}
+            self.active_branch = MAIN_BRANCH
+
+    # Function to rewind to the first `length` messages on a new branch and make it active;
+    # the new branch shares those messages with the one it came from
+    def fork_branch(self, length, name=None):
+        name = name or f"Branch {len(self.branches) + 1}"
+        if name in self.branches:
+            raise ValueError(f"Branch {name!r} already exists")
+        self.branches[name] = self.chat_history.fork(length)
+        self.select_branch(name)
+        metrics.increment("branches.forked")
+        return name
+
+    # Function to switch to another branch
+    def select_branch(self, name):
+        self.active_branch = name
+        self.chat_history = self.branches[name]
+
+    # Function to compare two branches: (messages in common, what each has after that)
+    def compare_branches(self, name_a, name_b):
+        a, b = self.branches[name_a], self.branches[name_b]
+        shared = a.common_length(b)
+        return shared, a[shared:], b[shared:]
+
+    # Function to estimate how much memory the conversation holds
+    def approximate_bytes(self):
+        histories = [thread["chat_history"] for thread in self.threads.values()] or list(self.branches.values())
+        seen = set()  # branches share nodes; count each once
+        size = sum(history.approximate_bytes(seen) for history in histories)
+        size += len(self.completed_sends) * 130
+        size += sum(130 + len(reply) for reply in self.send_replies.values())
+        size += len(self.scenario_index) * (dedup.NUM_PERM * 36 + dedup.BANDS * 120)
+        return size
+
+class SessionManager:
+    def __init__(self, spill_dir, idle_timeout=900, max_resident_bytes=256 * 1024 * 1024,
+                 spill_ttl=7 * 24 * 3600, sweep_interval=30, min_resident_seconds=60, threshold=0.6, on_evict=None):
+        self.spill_dir = spill_dir
+        self.idle_timeout = idle_timeout
+        self.max_resident_bytes = max_resident_bytes
+        self.spill_ttl = spill_ttl
+        self.sweep_interval = sweep_interval
+        self.min_resident_seconds = min_resident_seconds
+        self.threshold = threshold
+        self.on_evict = on_evict  # called with the session id when a session is spilled or its spill file expires
+        self._resident = OrderedDict()  # session_id -> Conversation, least recently used first
+        self._last_active = {}
+        self._pins = {}  # session_id -> requests in progress using it
+        self._spilling = {}  # session_id -> (Conversation, marker) being written to disk outside the lock
+        self._lock = threading.RLock()
+        self._last_sweep = 0.0
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _spill_path(self, session_id):
+        if not _SESSION_ID.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.spill_dir, f"{session_id}.json.z")
+
+    # Function to get a session's conversation, rehydrating or creating it as needed
+    def checkout(self, session_id, now=None):
+        return self._load(session_id, now, create=True)
+
+    # Function to get an existing session's conversation (rehydrated if it was spilled), or
+    # None for a session that is neither in memory nor on disk; nothing is created for it
+    def get(self, session_id, now=None):
+        return self._load(session_id, now, create=False)
+
+    def _load(self, session_id, now, create):
+        now = now if now is not None else time.time()
+        with self._lock:
+            conversation = self._resident.get(session_id)
+            if conversation is None:
+                # A session still being spilled is taken back as is; the spill drops its file
+                spilling = self._spilling.pop(session_id, None)
+                conversation = spilling[0] if spilling else self._rehydrate(session_id)
+                if conversation is None:
+                    if not create:
+                        return None
+                    conversation = Conversation(session_id, threshold=self.threshold)
+                self._resident[session_id] = conversation
+            self._resident.move_to_end(session_id)
+            self._last_active[session_id] = now
+        self.maybe_sweep(now)
+        return conversation
+
+    def _rehydrate(self, session_id):
+        path = self._spill_path(session_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        os.remove(path)
+        metrics.increment("sessions.rehydrated")
+        return Conversation(
+            session_id,
+            chat_history=data["chat_history"],
+            email_counter=data["email_counter"],
+            completed_sends=data["completed_sends"],
+            scenario_signatures=data["scenario_signatures"],
+            threshold=self.threshold,
+            threads=data.get("threads"),
+            active_thread=data.get("active_thread"),
+            role=data.get("role"),
+            branches=data.get("branches"),
+            active_branch=data.get("active_branch"),
+            send_replies=data.get("send_replies"),
+        )
+
+    # Function to keep a session resident while a request uses it: with manager.pinned(session_id): ...
+    @contextmanager
+    def pinned(self, session_id):
+        self.pin(session_id)
+        try:
+            yield
+        finally:
+            self.unpin(session_id)
+
+    # Function to keep a session resident until a matching unpin(), e.g. across a background call
+    def pin(self, session_id):
+        with self._lock:
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+
+    def unpin(self, session_id):
+        with self._lock:
+            self._pins[session_id] -= 1
+            if not self._pins[session_id]:
+                del self._pins[session_id]
+            if session_id in self._resident:
+                self._last_active[session_id] = time.time()  # idle from when the request finished
+
+    # Function to compress a resident session to disk and drop it from memory
+    def spill(self, session_id):
+        with self._lock:
+            snapshot = self._detach(session_id)
+        return snapshot is not None and self._write_spill(session_id, *snapshot)
+
+    # Function to move a resident session to the spilling set, under the lock. Returns the
+    # spill's marker and a snapshot of the session, or None if it is pinned or not resident.
+    def _detach(self, session_id):
+        if session_id in self._pins or session_id not in self._resident:
+            return None
+        conversation = self._resident.pop(session_id)
+        self._last_active.pop(session_id, None)
+        marker = object()
+        self._spilling[session_id] = (conversation, marker)
+        return marker, conversation.to_dict()
+
+    # Function to compress and write a detached session outside the lock. A checkout meanwhile
+    # takes the conversation back from the spilling set, and then the written file is discarded.
+    def _write_spill(self, session_id, marker, data):
+        payload = zlib.compress(json.dumps(data).encode("utf-8"), 6)
+        path = self._spill_path(session_id)
+        tmp_path = f"{path}.{id(marker)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        with self._lock:
+            if self._spilling.get(session_id, (None, None))[1] is not marker:
+                os.remove(tmp_path)
+                metrics.increment("sessions.spill_reclaimed")
+                return False
+            os.replace(tmp_path, path)
+            del self._spilling[session_id]
+        metrics.increment("sessions.spilled_total")
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+        return True
+
+    # Function to check whether a session is in memory (nobody has used it for a while if not)
+    def is_resident(self, session_id):
+        with self._lock:
+            return session_id in self._resident
+
+    # Function to run a sweep at most once per sweep interval
+    def maybe_sweep(self, now=None):
+        now = now if now is not None else time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+    # Function to spill idle sessions, enforce the memory ceiling and expire old spill files
+    def sweep(self, now=None):
+        now = now if now is not None else time.time()
+        self._last_sweep = now
+        # Victims are chosen and detached under the lock, so a session checked out meanwhile
+        # isn't spilled; compressing and writing them happens after it is released
+        detached = {}
+        with self._lock:
+            for session_id in [sid for sid, last in self._last_active.items() if now - last > self.idle_timeout]:
+                snapshot = self._detach(session_id)
+                if snapshot is not None:
+                    detached[session_id] = snapshot
+
+            # Over the ceiling: spill least recently used sessions that aren't mid-interaction
+            sizes = {sid: conversation.approximate_bytes() for sid, conversation in self._resident.items()}
+            resident_bytes = sum(sizes.values())
+            for victim in list(self._resident):
+                if resident_bytes <= self.max_resident_bytes:
+                    break
+                if victim in self._pins or now - self._last_active.get(victim, 0) <= self.min_resident_seconds:
+                    continue
+                detached[victim] = self._detach(victim)
+                resident_bytes -= sizes[victim]
+
+        for session_id, snapshot in detached.items():
+            self._write_spill(session_id, *snapshot)
+
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if now - os.path.getmtime(path) > self.spill_ttl:
+                os.remove(path)
+                if self.on_evict is not None and name.endswith(".json.z"):
+                    self.on_evict(name[:-len(".json.z")])
+        self._report(resident_bytes)
+
+    # Function to total the estimated memory of all resident sessions
+    def resident_bytes(self):
+        with self._lock:
+            return sum(conversation.approximate_bytes() for conversation in self._resident.values())
+
+    # Function to count resident and spilled sessions
+    def counts(self):
+        with self._lock:
+            resident = len(self._resident)
+        spilled = sum(1 for name in os.listdir(self.spill_dir) if name.endswith(".json.z"))
+        return resident, spilled
+
+    def _report(self, resident_bytes):
+        resident, spilled = self.counts()
+        metrics.set_gauge("sessions.resident", resident)
+        metrics.set_gauge("sessions.spilled", spilled)
+        metrics.set_gauge("sessions.resident_bytes", resident_bytes)
@@ -0,0 +1,99 @@
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+import metrics
+from transcript import Transcript
+
+# Shift mode: a learner works several independent ticket threads at once.
+# Work for a session is fanned out onto a shared thread pool, but each session
+# has at most max_concurrency calls running; the rest wait in a per-session
+# queue (not on a pool worker), so one busy session can't starve the others.
+# With admission control a call then waits for a model slot in the admission
+# queue, again without a pool worker, and takes one only once admitted.
+# Within a thread replies stay in order, since a thread accepts no new work
+# while it has a call in flight.
+
+class Shift:
+    def __init__(self, executor, max_concurrency=3, admission=None, owner=None):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.admission = admission  # optional AdmissionController, with owner as the tickets' owner
+        self.owner = owner
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queue = deque()
+        self._pending = {}  # thread_id -> Future
+
+    # Function to check whether a ticket thread has a call in flight or an uncollected reply
+    def busy(self, thread_id):
+        with self._lock:
+            return thread_id in self._pending
+
+    # Function to run func(*args) for a ticket thread in the background (admitted at `priority`)
+    def submit(self, thread_id, func, *args, priority=0):
+        with self._lock:
+            if thread_id in self._pending:
+                return self._pending[thread_id]
+            future = Future()
+            self._pending[thread_id] = future
+            self._queue.append((future, func, args, priority))
+            metrics.increment("shift.submitted")
+        self._drain()
+        return future
+
+    # Function to fan out the same kind of call over several ticket threads
+    def fan_out(self, thread_ids, func, *args, priority=0):
+        return [self.submit(thread_id, func, *args, priority=priority) for thread_id in thread_ids]
+
+    # Function to start queued work while the session is under its concurrency limit
+    def _drain(self):
+        while True:
+            with self._lock:
+                if self._running >= self.max_concurrency or not self._queue:
+                    return
+                future, func, args, priority = self._queue.popleft()
+                self._running += 1
+            try:
+                if self.admission is not None:
+                    work = self.admission.submit(self.executor, self.owner, priority, func, *args)
+                else:
+                    work = self.executor.submit(func, *args)
+            except Exception as e:  # e.g. the admission queue is full
+                work = Future()
+                work.set_exception(e)
+            work.add_done_callback(lambda work, future=future: self._finish(future, work))
+
+    def _finish(self, future, work):
+        try:
+            future.set_result(work.result())
+        except BaseException as e:
+            future.set_exception(e)
+        with self._lock:
+            self._running -= 1
+        self._drain()
+
+    # Function to take the results of every finished call as (thread_id, result or exception)
+    def collect(self):
+        finished = []
+        with self._lock:
+            for thread_id, future in list(self._pending.items()):
+                if future.done():
+                    del self._pending[thread_id]
+                    finished.append((thread_id, future.exception() or future.result()))
+        return finished
+
+# Function to pick an id for a new ticket thread
+def new_thread_id():
+    return uuid.uuid4().hex[:8]
+
+# Function to create one ticket thread (with an id picked ahead of time, e.g. for a scheduled arrival)
+def new_thread(title, thread_id=None):
+    thread_id = thread_id or new_thread_id()
+    return {"id": thread_id, "title": title, "chat_history": Transcript()}
+
+# Function to create the ticket threads for a new shift
+def new_threads(count):
+    threads = [new_thread(f"Ticket {i + 1}") for i in range(count)]
+    return {thread["id"]: thread for thread in threads}
@@ -0,0 +1,51 @@
+import hashlib
+import threading
+
+import metrics
+
+# Single-flight call coalescing: concurrent callers asking for the same key
+# share one execution of the underlying function instead of each making their
+# own model call. Keys come from idempotency_key() so the same logical send
+# (e.g. a double-clicked "Send Email") always maps to the same key.
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    # Function to run func once per key among concurrent callers and share its result
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        
+        if not leader:
+            metrics.increment("singleflight.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        metrics.increment("singleflight.executed")
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+# Function to derive a stable idempotency key from the parts that identify a send
+def idempotency_key(*parts):
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
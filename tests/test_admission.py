@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionController, QueueFull
+
+def test_free_slots_admit_at_once_and_the_rest_queue():
+    controller = AdmissionController(max_concurrent=2, max_queue=10)
+    first, second, third = (controller.enqueue(owner) for owner in "abc")
+    assert first.state == second.state == "admitted"
+    assert third.state == "queued"
+    assert controller.poll(third).position == 1
+    assert controller.counts() == (2, 1)
+
+def test_queue_is_ordered_by_arrival_with_priority_head_start():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, priority_step=10.0)
+    running = controller.enqueue("running")
+    normal = controller.enqueue("normal", priority=1)
+    urgent = controller.enqueue("urgent", priority=0)
+    later = controller.enqueue("later", priority=1)
+    assert [controller.poll(ticket).position for ticket in (urgent, normal, later)] == [1, 2, 3]
+
+    admitted = []
+    for ticket in (running, urgent, normal):
+        controller.release(ticket)
+        admitted.append(next(t for t in (urgent, normal, later) if t.state == "admitted"))
+    assert admitted == [urgent, normal, later]
+
+def test_full_queue_raises():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.enqueue("a")
+    controller.enqueue("b")
+    with pytest.raises(QueueFull):
+        controller.enqueue("c")
+
+def test_unpolled_and_unclaimed_tickets_expire():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, ticket_ttl=0.05)
+    unclaimed = controller.enqueue("unclaimed")
+    abandoned = controller.enqueue("abandoned")
+    waiting = controller.enqueue("waiting")
+    for _ in range(3):
+        time.sleep(0.03)
+        controller.poll(waiting)
+    # The unclaimed slot went to the next ticket still being polled; the abandoned one was dropped
+    assert unclaimed.state == abandoned.state == "expired"
+    assert controller.poll(waiting).admitted
+    assert not controller.claim(unclaimed)
+    assert controller.poll(abandoned).position is None
+
+def test_claimed_ticket_does_not_expire():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, ticket_ttl=0.01)
+    ticket = controller.acquire("a")
+    time.sleep(0.03)
+    controller.enqueue("b")
+    assert ticket.state == "claimed"
+    assert controller.counts() == (1, 1)
+
+def test_try_acquire_never_queues():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    ticket = controller.try_acquire("hedge")
+    assert ticket.state == "claimed"
+    assert controller.try_acquire("hedge") is None
+    assert controller.counts() == (1, 0)
+    controller.release(ticket)
+    assert controller.counts() == (0, 0)
+
+def test_submit_runs_in_admission_order_without_holding_workers():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, ticket_ttl=0.01)
+    gate, order = threading.Event(), []
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = controller.submit(executor, "a", 0, lambda: gate.wait(5) and order.append("first"))
+        later = controller.submit(executor, "b", 1, order.append, "later")
+        urgent = controller.submit(executor, "c", 0, order.append, "urgent")
+        time.sleep(0.05)  # Longer than the ticket TTL: dispatched tickets aren't expired
+        assert controller.counts() == (1, 2)
+        gate.set()
+        for future in (first, later, urgent):
+            future.result(timeout=5)
+    assert order == ["first", "urgent", "later"]
+    assert controller.counts() == (0, 0)
+
+def test_cancelled_submit_gives_back_its_place():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+    running = controller.enqueue("running")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = controller.submit(executor, "a", 0, lambda: "never")
+        assert future.cancel()
+        assert controller.counts() == (1, 0)
+        controller.release(running)
+    assert controller.counts() == (0, 0)
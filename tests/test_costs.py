@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from costs import CostLedger, MeteredBackend, QuotaExceeded, TokenEstimator
+
+PRICES = {"pro": (1.25, 5.00), "flash": (0.075, 0.30)}
+QUOTAS = {"session": (0.50, 1.00), "user": (2.00, 5.00)}
+SCOPES = {"session": "s1", "user": "u1"}
+
+class EchoBackend:
+    def __init__(self):
+        self.calls = []
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        self.calls.append((model_name, generation_config))
+        return "reply"
+
+def test_cost_uses_model_prices_and_falls_back_to_the_dearest():
+    ledger = CostLedger(PRICES, QUOTAS)
+    assert ledger.cost("pro", 1_000_000, 0) == pytest.approx(1.25)
+    assert ledger.cost("flash", 0, 1_000_000) == pytest.approx(0.30)
+    assert ledger.cost("unknown", 1_000_000, 1_000_000) == pytest.approx(6.25)
+
+def test_status_crosses_soft_then_hard_thresholds():
+    ledger = CostLedger(PRICES, QUOTAS)
+    assert ledger.status(SCOPES) == "ok"
+    ledger.charge(SCOPES, 0.49)
+    assert ledger.status(SCOPES) == "ok"
+    ledger.charge(SCOPES, 0.01)
+    assert ledger.status(SCOPES) == "soft"
+    ledger.charge(SCOPES, 0.50)
+    assert ledger.status(SCOPES) == "hard"
+    # A new session of the same user starts under the session quota
+    assert ledger.status({"session": "s2", "user": "u1"}) == "ok"
+
+def test_any_scope_over_its_hard_quota_refuses():
+    ledger = CostLedger(PRICES, QUOTAS)
+    ledger.charge({"user": "u1"}, 5.00)
+    assert ledger.status({"session": "fresh", "user": "u1"}) == "hard"
+
+def test_metered_backend_degrades_then_refuses():
+    ledger = CostLedger(PRICES, QUOTAS)
+    inner = EchoBackend()
+    backend = MeteredBackend(inner, ledger, TokenEstimator(), SCOPES, fallback_model="flash", fallback_max_tokens=100,
+                             cached_scenarios={"Support Engineer": ["cached opening"]})
+
+    backend.send("pro", {"max_output_tokens": 800}, [], "hello")
+    assert inner.calls[-1] == ("pro", {"max_output_tokens": 800})
+
+    ledger.charge(SCOPES, 0.60)
+    backend.send("pro", {"max_output_tokens": 800}, [], "hello")
+    assert inner.calls[-1] == ("flash", {"max_output_tokens": 100})
+    calls = len(inner.calls)
+    assert backend.send("pro", {}, [], "start", request_type="scenario_start", role="Support Engineer") == "cached opening"
+    assert len(inner.calls) == calls
+
+    ledger.charge(SCOPES, 1.00)
+    with pytest.raises(QuotaExceeded):
+        backend.send("pro", {}, [], "hello")
+
+def test_ledger_is_saved_only_when_changed_and_reloaded(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    ledger = CostLedger(PRICES, QUOTAS, path, save_interval=3600)
+    ledger.save()
+    assert not (tmp_path / "ledger.json").exists()
+    ledger.charge(SCOPES, 0.25)
+    ledger.save()
+    assert json.loads((tmp_path / "ledger.json").read_text()) == {"session:s1": 0.25, "user:u1": 0.25}
+    assert CostLedger(PRICES, QUOTAS, path).spent("user", "u1") == 0.25
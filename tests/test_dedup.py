@@ -0,0 +1,52 @@
+import json
+
+import dedup
+
+TICKET = ("Subject: Login failures\nHi team, since this morning about forty users in the finance department "
+          "cannot log in to the reporting portal. They see an authentication error after entering their password. "
+          "Nothing changed on our side and this is blocking the month end close. Please advise urgently.")
+
+NEAR_COPY = TICKET.replace("forty", "fifty")
+
+UNRELATED = ("Subject: Slow dashboard\nHello, the analytics dashboard takes over a minute to load charts for the "
+             "sales team since yesterday's deployment. Exports also time out. Could someone look into the database "
+             "queries behind the weekly revenue report?")
+
+def test_signature_is_stable_and_ignores_headers():
+    assert dedup.signature(TICKET) == dedup.signature(TICKET)
+    assert dedup.signature("Subject: A\n" + UNRELATED) == dedup.signature("Subject: B\n" + UNRELATED)
+    assert len(dedup.signature(TICKET)) == dedup.NUM_PERM
+
+def test_near_copy_is_a_duplicate_and_unrelated_ticket_is_not():
+    index = dedup.MinHashIndex(threshold=0.6)
+    index.add("ticket", dedup.signature(TICKET))
+
+    duplicate, score = index.is_duplicate(dedup.signature(NEAR_COPY))
+    assert duplicate and score >= 0.6
+
+    duplicate, score = index.is_duplicate(dedup.signature(UNRELATED))
+    assert not duplicate and score < 0.6
+
+def test_threshold_decides_duplicates():
+    sig = dedup.signature(NEAR_COPY)
+    strict, loose = dedup.MinHashIndex(threshold=1.0), dedup.MinHashIndex(threshold=0.3)
+    for index in (strict, loose):
+        index.add("ticket", dedup.signature(TICKET))
+    assert not strict.is_duplicate(sig)[0]
+    assert loose.is_duplicate(sig)[0]
+
+def test_query_returns_best_match():
+    index = dedup.MinHashIndex()
+    index.add("unrelated", dedup.signature(UNRELATED))
+    index.add("ticket", dedup.signature(TICKET))
+    assert index.query(dedup.signature(NEAR_COPY))[0] == "ticket"
+    assert dedup.MinHashIndex().query(dedup.signature(TICKET)) == (None, 0.0)
+
+def test_corpus_records_from_an_older_signature_version_are_resigned(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    dedup.append_to_corpus(path, "current", "support", TICKET, dedup.signature(TICKET))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "old", "role": "support", "content": UNRELATED, "signature": [0] * dedup.NUM_PERM}) + "\n")
+
+    index = dedup.load_corpus_index(path)
+    assert dict(index.items()) == {"current": dedup.signature(TICKET), "old": dedup.signature(UNRELATED)}
@@ -0,0 +1,77 @@
+import pytest
+
+from backends import KeyPool, KeysExhausted, PooledBackend
+
+class ResourceExhausted(Exception):
+    pass
+
+class KeyBackend:
+    # Answers with its key, or raises a rate limit for keys listed in limited
+    limited = set()
+
+    def __init__(self, key):
+        self.key = key
+
+    def send(self, model_name, generation_config, history, message, **metadata):
+        if self.key in self.limited:
+            raise ResourceExhausted("429 quota exceeded")
+        return self.key
+
+def pool(max_wait=0.0):
+    return KeyPool([{"name": "a", "key": "key-a", "rpm": 600}, {"name": "b", "key": "key-b", "rpm": 600}],
+                   quarantine_seconds=60, max_quarantine_seconds=240, max_wait=max_wait)
+
+def test_rate_limited_key_is_quarantined_with_exponential_backoff():
+    key_pool = pool()
+    key_a = key_pool.keys[0]
+    backoffs = []
+    for _ in range(4):
+        key_a.in_flight += 1
+        key_pool.release(key_a, "rate_limited")
+        backoffs.append(key_a.quarantined_until)
+    assert [round(until - backoffs[0] + 60) for until in backoffs] == [60, 120, 240, 240]
+    assert all(key_pool.acquire() is key_pool.keys[1] for _ in range(5))
+
+def test_success_resets_the_backoff():
+    key_pool = pool()
+    key_a = key_pool.keys[0]
+    key_a.in_flight += 2
+    key_pool.release(key_a, "rate_limited")
+    key_pool.release(key_a, "ok")
+    assert key_a.strikes == 0
+
+def test_every_key_quarantined_raises_after_max_wait():
+    key_pool = pool()
+    for pooled_key in key_pool.keys:
+        pooled_key.in_flight += 1
+        key_pool.release(pooled_key, "rate_limited")
+    with pytest.raises(KeysExhausted):
+        key_pool.acquire()
+
+def test_pooled_backend_moves_to_another_key_on_a_rate_limit():
+    key_pool = pool()
+    KeyBackend.limited = {"key-a", "key-b"}
+    backend = PooledBackend(key_pool, KeyBackend)
+    with pytest.raises(ResourceExhausted):
+        backend.send("model", {}, [], "hello")
+
+    key_pool.keys[1].quarantined_until = 0.0
+    KeyBackend.limited = {"key-a"}
+    assert backend.send("model", {}, [], "hello") == "key-b"
+    assert key_pool.keys[0].quarantined_until > key_pool.keys[1].quarantined_until
+    assert [pooled_key.in_flight for pooled_key in key_pool.keys] == [0, 0]
+
+def test_errors_other_than_rate_limits_are_raised_without_quarantine():
+    key_pool = pool()
+
+    class Failing:
+        def __init__(self, key):
+            pass
+
+        def send(self, *args, **metadata):
+            raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        PooledBackend(key_pool, Failing).send("model", {}, [], "hello")
+    assert all(pooled_key.quarantined_until == 0.0 for pooled_key in key_pool.keys)
+    assert max(pooled_key.error_rate for pooled_key in key_pool.keys) > 0
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from session_store import SessionManager
+
+SESSION = "a" * 32
+OTHER = "b" * 32
+
+@pytest.fixture
+def manager(tmp_path):
+    return SessionManager(str(tmp_path), idle_timeout=60, sweep_interval=10 ** 9, min_resident_seconds=0)
+
+def spill_files(manager):
+    return sorted(name for name in os.listdir(manager.spill_dir) if name.endswith(".json.z"))
+
+def test_spilled_session_is_rehydrated_with_its_history(manager):
+    conversation = manager.checkout(SESSION, now=0)
+    conversation.role = "Support Engineer"
+    conversation.chat_history.extend([{"role": "user", "content": f"message {i}"} for i in range(10)])
+    conversation.completed_sends.add("send-1")
+    conversation.fork_branch(3, "retry")
+
+    assert manager.spill(SESSION)
+    assert not manager.is_resident(SESSION)
+    assert spill_files(manager) == [f"{SESSION}.json.z"]
+
+    restored = manager.checkout(SESSION, now=1)
+    assert restored is not conversation
+    assert restored.role == "Support Engineer"
+    assert restored.completed_sends == {"send-1"}
+    assert restored.active_branch == "retry"
+    assert list(restored.branches["main"]) == [{"role": "user", "content": f"message {i}"} for i in range(10)]
+    assert restored.compare_branches("main", "retry")[0] == 3
+    assert spill_files(manager) == []
+
+def test_get_does_not_create_sessions(manager):
+    assert manager.get(SESSION) is None
+    assert manager.counts() == (0, 0)
+    manager.checkout(SESSION, now=0)
+    manager.spill(SESSION)
+    assert manager.get(SESSION) is not None
+
+def test_sweep_spills_idle_sessions_only(manager):
+    manager.checkout(SESSION, now=0)
+    manager.checkout(OTHER, now=100)
+    manager.sweep(now=120)
+    assert not manager.is_resident(SESSION)
+    assert manager.is_resident(OTHER)
+
+def test_pinned_session_is_never_spilled(manager):
+    manager.checkout(SESSION, now=0)
+    with manager.pinned(SESSION):
+        assert not manager.spill(SESSION)
+        manager.sweep(now=1000)
+        assert manager.is_resident(SESSION)
+    assert manager.spill(SESSION)
+
+def test_pins_are_counted(manager):
+    manager.checkout(SESSION, now=0)
+    manager.pin(SESSION)
+    manager.pin(SESSION)
+    manager.unpin(SESSION)
+    assert not manager.spill(SESSION)
+    manager.unpin(SESSION)
+    assert manager.spill(SESSION)
+
+def test_memory_ceiling_spills_least_recently_used(tmp_path):
+    manager = SessionManager(str(tmp_path), idle_timeout=10 ** 6, sweep_interval=10 ** 9, min_resident_seconds=0)
+    for session_id, now in ((SESSION, 0), (OTHER, 1)):
+        conversation = manager.checkout(session_id, now=now)
+        conversation.chat_history.append({"role": "user", "content": "x" * 1000})
+    manager.max_resident_bytes = manager.checkout(OTHER, now=2).approximate_bytes()
+    manager.sweep(now=3)
+    assert not manager.is_resident(SESSION)
+    assert manager.is_resident(OTHER)
+
+def test_invalid_session_id_is_rejected(manager):
+    with pytest.raises(ValueError):
+        manager.checkout("../../etc/passwd")
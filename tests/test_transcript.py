@@ -0,0 +1,58 @@
+from transcript import Transcript
+
+def messages(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": content} for i, content in enumerate(contents)]
+
+def test_behaves_like_a_list_and_compresses_older_messages():
+    history = Transcript(messages(*(f"message {i}" for i in range(10))), keep_recent=4)
+    assert len(history) == 10
+    assert history[0]["content"] == "message 0"
+    assert history[-1]["content"] == "message 9"
+    assert history[2:4] == [{"role": "user", "content": "message 2"}, {"role": "assistant", "content": "message 3"}]
+    assert history.compressed_count() == 6
+    assert history.to_list() == messages(*(f"message {i}" for i in range(10)))
+
+def test_fork_shares_the_prefix_without_changing_the_original():
+    main = Transcript(messages("ticket", "answer", "feedback"))
+    branch = main.fork(2)
+    branch.append({"role": "assistant", "content": "other feedback"})
+    assert [message["content"] for message in main] == ["ticket", "answer", "feedback"]
+    assert [message["content"] for message in branch] == ["ticket", "answer", "other feedback"]
+    assert main.common_length(branch) == 2
+    assert main.fork().common_length(main) == 3
+    assert main.fork(0).common_length(main) == 0
+
+def test_shared_nodes_are_counted_once():
+    main = Transcript(messages("ticket " * 50, "answer " * 50))
+    branch = main.fork(1)
+    branch.append({"role": "assistant", "content": "another answer"})
+    seen = set()
+    shared = main.approximate_bytes(seen) + branch.approximate_bytes(seen)
+    assert shared < main.approximate_bytes() + branch.approximate_bytes()
+
+def test_editing_a_branch_is_copy_on_write():
+    main = Transcript(messages("ticket", "answer", "feedback"))
+    branch = main.fork()
+    branch[1] = {"role": "assistant", "content": "edited"}
+    del branch[2]
+    assert [message["content"] for message in main] == ["ticket", "answer", "feedback"]
+    assert [message["content"] for message in branch] == ["ticket", "edited"]
+
+def test_identical_choices_share_a_path_and_find_the_earlier_reply():
+    main = Transcript(messages("ticket"))
+    retry = main.fork()
+    main.extend([{"role": "user", "content": "P1"}, {"role": "assistant", "content": "error: timeout"}])
+    main.fork(1).extend([{"role": "user", "content": "P1"}, {"role": "assistant", "content": "Good call"}])
+
+    assert retry.cached_reply({"role": "user", "content": "P1"}) == "Good call"
+    usable = lambda reply: not reply.startswith("error")
+    assert retry.cached_reply({"role": "user", "content": "P1"}, usable) == "Good call"
+    assert retry.cached_reply({"role": "user", "content": "P2"}) is None
+
+    retry.append({"role": "user", "content": "P1"})
+    assert retry.common_length(main) == 2
+
+def test_cached_reply_skips_unusable_replies():
+    main = Transcript(messages("ticket"))
+    main.fork().extend([{"role": "user", "content": "P1"}, {"role": "assistant", "content": "error: timeout"}])
+    assert main.cached_reply({"role": "user", "content": "P1"}, lambda reply: not reply.startswith("error")) is None
@@ -0,0 +1,66 @@
+import argparse
+import json
+import random
+from collections import Counter
+
+import config
+from priority_classifier import (PRIORITIES, PriorityClassifier, extract_graded_priority)
+
+# Trains the local priority classifier on graded triage answers logged by the app
+# (config.PRIORITY_LOG_PATH) and reports how often it agrees with the LLM grading.
+#
+#   python train_priority_classifier.py [--log priority_log.jsonl] [--out priority_model.json]
+
+# Function to read (ticket, label) pairs from the grading log
+def load_examples(path):
+    examples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = extract_graded_priority(record["feedback"], record.get("answer"))
+            if label:
+                examples.append((record["ticket"], label))
+    return examples
+
+# Function to print accuracy and a confusion matrix for a classifier
+def report(name, classifier, examples):
+    confusion = Counter()
+    correct = 0
+    for text, label in examples:
+        predicted, _ = classifier.predict(text)
+        confusion[(label, predicted)] += 1
+        correct += predicted == label
+    accuracy = correct / len(examples) if examples else 0.0
+    print(f"{name}: accuracy {accuracy:.1%} on {len(examples)} graded tickets")
+    print("      predicted " + " ".join(f"{p:>4}" for p in PRIORITIES))
+    for actual in PRIORITIES:
+        print(f"  actual {actual}   " + " ".join(f"{confusion[(actual, p)]:>4}" for p in PRIORITIES))
+    return accuracy
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local P1-P4 priority classifier")
+    parser.add_argument("--log", default=config.PRIORITY_LOG_PATH, help="grading log written by the app")
+    parser.add_argument("--out", default=config.PRIORITY_MODEL_PATH, help="where to save the trained model")
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=30)
+    args = parser.parse_args()
+
+    examples = load_examples(args.log)
+    if not examples:
+        print(f"No graded tickets found in {args.log}")
+        return
+    random.Random(0).shuffle(examples)
+    split = max(1, int(len(examples) * (1 - args.test_fraction))) if len(examples) > 1 else len(examples)
+    train, test = examples[:split], examples[split:] or examples[:split]
+    print(f"Label distribution: {dict(Counter(label for _, label in examples))}")
+
+    report("keyword baseline", PriorityClassifier.from_keywords(), test)
+    classifier = PriorityClassifier.from_keywords().fit([t for t, _ in train], [l for _, l in train], epochs=args.epochs)
+    report("trained model", classifier, test)
+    classifier.save(args.out)
+    print(f"Saved model to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import zlib
+from collections.abc import MutableSequence
+
+# Chat history that keeps only the most recent messages as plain text. Older
+# messages are stored as zlib-compressed bytes and decompressed only when read
+# (shown in the thread view or sent back to the model). It behaves like the
+# plain list of {"role", "content"} dicts it replaces.
+#
+# Messages are nodes in a persistent tree: each node points at its parent and
+# is never changed, so a Transcript is just a pointer to its latest node.
+# fork() gives a new branch sharing every message so far without copying, and
+# switching branches swaps one pointer. Appending a message a branch already
+# has at that point reuses the existing node, so identical choices share one
+# path and an earlier model reply to the same answer can be found again.
+
+KEEP_RECENT = 4  # messages kept uncompressed at the end of the transcript
+COMPRESSION_LEVEL = 6
+
+# Preset dictionary of phrasing that recurs in simulated emails. Individual
+# messages are short, so priming zlib with it roughly doubles the ratio.
+ZDICT = (
+    "From: To: You <you@company.com> Subject: Re: Ticket # Time: AM PM Hi team, Hello, Thanks for the quick reply. "
+    "Best regards, Thanks, Support System <support@company.com> customer manager developer engineering on-call "
+    "P1/Critical P2/High P3/Medium P4/Low priority classify classification I would classify this as "
+    "FEEDBACK: Feedback on your answer LEARNING GUIDE: An experienced support engineer would first "
+    "OPTIONS: Option 1) 2) 3) What would you like to do next? next steps escalate acknowledge the customer "
+    "authentication login password reset performance slowdown integration error data sync API failure timeout "
+    "users affected since this morning business impact logs monitoring dashboards recent deployment reproduce "
+    "METAPHORICAL HINT: Imagine The user is indicating they're new to this role and need guidance. "
+    "the of and to a in that is for it with as on be this you your we our are have not "
+).encode("utf-8")
+
+class _Packed:
+    __slots__ = ("role", "data")
+
+    def __init__(self, role, content):
+        self.role = role
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=ZDICT)
+        self.data = compressor.compress(content.encode("utf-8")) + compressor.flush()
+
+    def unpack(self):
+        decompressor = zlib.decompressobj(zdict=ZDICT)
+        content = decompressor.decompress(self.data) + decompressor.flush()
+        return {"role": self.role, "content": content.decode("utf-8")}
+
+class _Node:
+    __slots__ = ("parent", "item", "depth", "children")
+
+    def __init__(self, parent, item):
+        self.parent = parent
+        self.item = item
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.children = None  # the only child node, or a list once the history branches here
+
+    def message(self):
+        return self.item.unpack() if isinstance(self.item, _Packed) else self.item
+
+    def child_nodes(self):
+        if self.children is None:
+            return []
+        return self.children if isinstance(self.children, list) else [self.children]
+
+    # Function to find the child holding exactly this message
+    def child(self, message):
+        for node in self.child_nodes():
+            if node.message() == message:
+                return node
+        return None
+
+    def add_child(self, node):
+        if self.children is None:
+            self.children = node
+        elif isinstance(self.children, list):
+            self.children.append(node)
+        else:
+            self.children = [self.children, node]
+
+class Transcript(MutableSequence):
+    def __init__(self, messages=(), keep_recent=KEEP_RECENT, tip=None):
+        self.keep_recent = keep_recent
+        self._tip = tip if tip is not None else _Node(None, None)  # the root node holds no message
+        self.extend(messages)
+
+    def __len__(self):
+        return self._tip.depth
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self._node_at(index).message()
+
+    def __setitem__(self, index, message):
+        messages = list(self)
+        messages[index] = dict(message)
+        self._rewrite(messages)
+
+    def __delitem__(self, index):
+        messages = list(self)
+        del messages[index]
+        self._rewrite(messages)
+
+    def __iter__(self):
+        for node in self._nodes():
+            yield node.message()
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"Transcript({len(self)} messages, {self.compressed_count()} compressed)"
+
+    def insert(self, index, message):
+        messages = list(self)
+        messages.insert(index, dict(message))
+        self._rewrite(messages)
+
+    def append(self, message):
+        message = dict(message)
+        # An identical message at this point is the same path through the tree
+        node = self._tip.child(message)
+        if node is None:
+            node = _Node(self._tip, message)
+            self._tip.add_child(node)
+        self._tip = node
+        self._compact()
+
+    # Function to start a branch that shares this history (or its first `length` messages)
+    def fork(self, length=None):
+        tip = self._tip if length is None else self._node_at(length - 1) if length > 0 else self._root()
+        return Transcript(keep_recent=self.keep_recent, tip=tip)
+
+    # Function to count the messages this branch shares with another branch of the same tree
+    def common_length(self, other):
+        a, b = self._tip, other._tip
+        while a.depth > b.depth:
+            a = a.parent
+        while b.depth > a.depth:
+            b = b.parent
+        while a is not b:
+            a, b = a.parent, b.parent
+            if a is None:
+                return 0
+        return a.depth
+
+    # Function to find the most recent reply already generated for this exact message at this
+    # point that `usable` accepts (e.g. not an error), if any
+    def cached_reply(self, message, usable=None):
+        user_node = self._tip.child(dict(message))
+        for reply in reversed(user_node.child_nodes() if user_node is not None else []):
+            content = reply.message()["content"]
+            if usable is None or usable(content):
+                return content
+        return None
+
+    # Function to return the messages as a plain list of dicts (for JSON)
+    def to_list(self):
+        return list(self)
+
+    # Function to count how many messages are currently stored compressed
+    def compressed_count(self):
+        return sum(1 for node in self._nodes() if isinstance(node.item, _Packed))
+
+    # Function to estimate the memory held by the stored messages; nodes in `seen`
+    # (shared with a branch already counted) are skipped
+    def approximate_bytes(self, seen=None):
+        size = 0
+        for node in self._nodes():
+            if seen is not None:
+                if id(node) in seen:
+                    continue
+                seen.add(id(node))
+            if isinstance(node.item, _Packed):
+                size += 64 + 72 + len(node.item.data)
+            else:
+                size += 64 + 232 + 49 + len(node.item["content"].encode("utf-8"))
+        return size
+
+    # Function to list the message nodes from the first to the latest
+    def _nodes(self):
+        nodes = []
+        node = self._tip
+        while node.parent is not None:
+            nodes.append(node)
+            node = node.parent
+        nodes.reverse()
+        return nodes
+
+    def _root(self):
+        node = self._tip
+        while node.parent is not None:
+            node = node.parent
+        return node
+
+    def _node_at(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("transcript index out of range")
+        node = self._tip
+        for _ in range(length - 1 - index):
+            node = node.parent
+        return node
+
+    # Function to replace the messages, keeping the unchanged prefix shared (copy on write)
+    def _rewrite(self, messages):
+        old_nodes = self._nodes()
+        shared = 0
+        while shared < min(len(old_nodes), len(messages)) and old_nodes[shared].message() == messages[shared]:
+            shared += 1
+        self._tip = old_nodes[shared - 1] if shared else self._root()
+        for message in messages[shared:]:
+            self.append(message)
+
+    # Function to compress everything older than the most recent messages.
+    # Shared nodes may be packed by any branch; their messages don't change.
+    def _compact(self):
+        node = self._tip
+        for _ in range(self.keep_recent):
+            if node.parent is None:
+                return
+            node = node.parent
+        while node.parent is not None and not isinstance(node.item, _Packed):
+            node.item = _Packed(node.item["role"], node.item["content"])
+            node = node.parent
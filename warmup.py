@@ -0,0 +1,116 @@
+import argparse
+import importlib
+import logging
+import threading
+import time
+import uuid
+
+import backends
+import config
+import metrics
+from engine import SimulationEngine
+
+# Warm-up stage run once at server start, so the first learner after a deploy
+# doesn't pay for cold imports, client setup, index loading or an empty
+# scenario pool. Prompts are plain f-strings built per call, so there is
+# nothing to precompute for them. Stages run in order on a background thread and readiness is
+# set only when they have all finished. A failed stage is logged and counted
+# rather than keeping the server unready forever. Durations are reported as
+# warmup.* gauges.
+
+logger = logging.getLogger(__name__)
+
+HEAVY_MODULES = ("google.generativeai",)
+
+class WarmUp:
+    def __init__(self, simulation_engine, backend_factory=None, pregenerate=None):
+        self.engine = simulation_engine
+        self.backend_factory = backend_factory  # returns a backend for pregeneration
+        self.pregenerate = config.WARMUP_PREGENERATE if pregenerate is None else pregenerate
+        self.stages = {}  # stage name -> milliseconds
+        self.error = None
+        self.ready = threading.Event()
+        metrics.set_gauge("warmup.ready", 0)
+
+    def _stage(self, name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            # A failed stage is logged and counted; the rest still run
+            self.error = self.error or e
+            metrics.increment("warmup.errors")
+            logger.exception("Warm-up stage %s failed", name)
+        self.stages[name] = (time.perf_counter() - start) * 1000
+        metrics.set_gauge(f"warmup.stage_ms.{name}", self.stages[name])
+
+    # Function to import the model SDK; only required when it is the configured backend
+    def import_modules(self):
+        for module in HEAVY_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                if config.BACKEND == "gemini":
+                    raise
+
+    # Function to construct the service key's client and a model per routed model and, with a key,
+    # open the connection with a free token count
+    def construct_clients(self):
+        if config.BACKEND != "gemini":
+            return
+        for model_name in {route["model"] for route in self.engine.model_routes.values()}:
+            model = backends.gemini_model(config.GEMINI_API_KEY, model_name)
+            if config.GEMINI_API_KEY:
+                model.count_tokens("warm up")
+
+    # Function to load the scenario corpus index and priority classifier from disk
+    def load_indexes(self):
+        self.engine.corpus_index
+        self.engine.classifier
+
+    # Function to fill the pregenerated scenario pool for every role that has a prompt
+    def pregenerate_scenarios(self):
+        for role in self.engine.roles:
+            if role not in self.engine.role_prompts:
+                logger.warning("Not pregenerating scenarios for role %s: it has no prompt", role)
+                metrics.increment("warmup.roles_skipped")
+                continue
+            self.engine.pregenerate(role, self.backend_factory(), self.pregenerate)
+
+    # Function to run every stage and mark readiness
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self._stage("imports", self.import_modules)
+            self._stage("clients", self.construct_clients)
+            self._stage("indexes", self.load_indexes)
+            if self.pregenerate > 0 and self.backend_factory is not None:
+                self._stage("scenarios", self.pregenerate_scenarios)
+        finally:
+            metrics.set_gauge("warmup.seconds", time.perf_counter() - start)
+            metrics.set_gauge("warmup.ready", 1)
+            self.ready.set()
+        return self
+
+    # Function to run the warm-up on a background thread
+    def start(self):
+        threading.Thread(target=self.run, name="warm-up", daemon=True).start()
+        return self
+
+# Function to build backends for server-side generation, or None when there is no key to use
+def service_backend_factory():
+    if config.BACKEND == "gemini" and not (config.GEMINI_API_KEY or config.GEMINI_API_KEYS):
+        return None
+    return lambda: backends.create_backend(config.GEMINI_API_KEY, uuid.uuid4().hex, config)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the server warm-up stage and report its timings")
+    parser.add_argument("--pregenerate", type=int, default=config.WARMUP_PREGENERATE, help="opening scenarios per role")
+    args = parser.parse_args()
+    warm_up = WarmUp(SimulationEngine(), service_backend_factory(), args.pregenerate).run()
+    for name, ms in warm_up.stages.items():
+        print(f"{name}: {ms:.1f} ms")
+    print(f"total: {metrics.snapshot()['gauges']['warmup.seconds']:.2f} s" + (f" (failed: {warm_up.error})" if warm_up.error else ""))
+
+if __name__ == "__main__":
+    main()